@@ -0,0 +1,144 @@
+import math
+import time
+import threading
+from collections import Counter
+
+# 准入控制：按估算代价把查询分为廉价和昂贵两类，各自限制并发数和排队长度；
+# 需要排队的请求降级执行（跳过个性化和高亮），队列已满或等待超时则拒绝（429）
+CHEAP = 'cheap'
+EXPENSIVE = 'expensive'
+CONCURRENCY_LIMITS = {CHEAP: 8, EXPENSIVE: 2}
+QUEUE_LIMITS = {CHEAP: 32, EXPENSIVE: 4}
+QUEUE_TIMEOUT = 2.0  # 排队等待的最长时间（秒）
+
+# 代价估算（单位约为一次普通关键词查询）
+EXPENSIVE_COST = 5.0
+TERM_COST = 0.5
+PHRASE_COST = 1.0
+LEADING_WILDCARD_COST = 20.0  # 前导通配符需要扫描整个词典
+EXPANSIONS_PER_COST = 50  # 通配符每扩展出这么多词计 1
+PERSONALIZATION_QUERIES_PER_COST = 100  # 个性化用户每有这么多条历史查询计 1
+
+def wildcard_prefix(query_str):
+    """通配查询中第一个通配符之前的字面前缀；不含通配符时返回 None"""
+    positions = [i for i in (query_str.find('*'), query_str.find('?')) if i >= 0]
+    if not positions:
+        return None
+    start = query_str.rfind(' ', 0, min(positions)) + 1
+    return query_str[start:min(positions)]
+
+def estimate_cost(query_str, is_phrase=False, expansion=None):
+    """估算单个查询的检索代价，expansion 为通配前缀在词典中扩展出的词数（None 表示未知或无前缀）"""
+    terms = query_str.split()
+    cost = 1.0 + TERM_COST * max(len(terms) - 1, 0)
+    if is_phrase:
+        cost += PHRASE_COST
+    prefix = wildcard_prefix(query_str) if not is_phrase else None
+    if prefix is not None:
+        if not prefix:
+            cost += LEADING_WILDCARD_COST
+        else:
+            cost += (expansion or 0) / EXPANSIONS_PER_COST
+    return cost
+
+def personalization_cost(history_size):
+    """个性化重排的代价，history_size 为用户的历史查询数"""
+    return history_size / PERSONALIZATION_QUERIES_PER_COST
+
+def cost_class(cost):
+    return EXPENSIVE if cost >= EXPENSIVE_COST else CHEAP
+
+class Overloaded(Exception):
+    """队列已满或等待超时，retry_after 为建议的重试间隔（秒）"""
+    def __init__(self, cost_class, retry_after):
+        super().__init__(f"{cost_class} queries saturated, retry after {retry_after}s")
+        self.cost_class = cost_class
+        self.retry_after = retry_after
+
+class Ticket:
+    """一次准入许可；degraded 表示请求经过排队，应降级执行。release() 可重复调用"""
+    def __init__(self, controller, cost_class, degraded):
+        self.controller = controller
+        self.cost_class = cost_class
+        self.degraded = degraded
+        self.started = time.time()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class AdmissionController:
+    def __init__(self, limits=None, queue_limits=None, queue_timeout=QUEUE_TIMEOUT):
+        self.limits = dict(limits or CONCURRENCY_LIMITS)
+        self.queue_limits = dict(queue_limits or QUEUE_LIMITS)
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self.in_flight = Counter()
+        self.queued = Counter()
+        self.counters = Counter()
+        # 各类请求处理时间的指数移动平均，用于估算 Retry-After
+        self.service_time = {name: 0.1 for name in self.limits}
+
+    def acquire(self, cost_class):
+        """获取许可，必要时排队；队列已满或等待超时抛出 Overloaded"""
+        with self._condition:
+            limit = self.limits[cost_class]
+            if self.in_flight[cost_class] < limit and not self.queued[cost_class]:
+                self.in_flight[cost_class] += 1
+                self.counters[f'{cost_class}_admitted'] += 1
+                return Ticket(self, cost_class, degraded=False)
+            if self.queued[cost_class] >= self.queue_limits[cost_class]:
+                self.counters[f'{cost_class}_shed'] += 1
+                raise Overloaded(cost_class, self.retry_after(cost_class))
+            self.queued[cost_class] += 1
+            deadline = time.time() + self.queue_timeout
+            try:
+                while self.in_flight[cost_class] >= limit:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.counters[f'{cost_class}_shed'] += 1
+                        self.counters[f'{cost_class}_timed_out'] += 1
+                        raise Overloaded(cost_class, self.retry_after(cost_class))
+                    self._condition.wait(remaining)
+            finally:
+                self.queued[cost_class] -= 1
+            self.in_flight[cost_class] += 1
+            self.counters[f'{cost_class}_admitted'] += 1
+            self.counters[f'{cost_class}_degraded'] += 1
+            return Ticket(self, cost_class, degraded=True)
+
+    def _release(self, ticket):
+        elapsed = time.time() - ticket.started
+        with self._condition:
+            self.in_flight[ticket.cost_class] -= 1
+            self.service_time[ticket.cost_class] = 0.8 * self.service_time[ticket.cost_class] + 0.2 * elapsed
+            self._condition.notify_all()
+
+    def retry_after(self, cost_class):
+        """按排队长度和平均处理时间估算的重试间隔（整秒，至少 1 秒）"""
+        waiting = self.queued[cost_class] + 1
+        return max(1, math.ceil(self.service_time[cost_class] * waiting / self.limits[cost_class]))
+
+    def metrics(self):
+        with self._condition:
+            return {
+                name: {
+                    'limit': self.limits[name],
+                    'queue_limit': self.queue_limits[name],
+                    'in_flight': self.in_flight[name],
+                    'queue_depth': self.queued[name],
+                    'admitted': self.counters[f'{name}_admitted'],
+                    'degraded': self.counters[f'{name}_degraded'],
+                    'shed': self.counters[f'{name}_shed'],
+                    'timed_out': self.counters[f'{name}_timed_out'],
+                    'avg_service_time': round(self.service_time[name], 4)
+                } for name in self.limits
+            }
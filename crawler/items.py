@@ -3,4 +3,11 @@ class PageItem(scrapy.Item):
     url = scrapy.Field()
     content = scrapy.Field()
     file_type = scrapy.Field()
-    original_filename = scrapy.Field()
\ No newline at end of file
+    original_filename = scrapy.Field()
+    outlinks = scrapy.Field()
+    etag = scrapy.Field()
+    last_modified = scrapy.Field()
+    content_hash = scrapy.Field()
+    recrawled = scrapy.Field()
+    request_url = scrapy.Field()
+    unchanged = scrapy.Field()
\ No newline at end of file
@@ -1,20 +1,63 @@
 import os
-import json
-import hashlib
+import time
 import pickle
+import threading
+from twisted.internet import defer, reactor, task, threads
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+from snapshot_store import SnapshotStore, snapshot_key
+from metadata_journal import MetadataJournal, iter_metadata
+from simhash import SimHashIndex, simhash, main_content_text
+
+# 统计信息备份的节流间隔：满足任一条件才写盘
+STATS_CHECKPOINT_SECONDS = 30.0
+STATS_CHECKPOINT_ITEMS = 500
+
+# 写盘线程池与背压：在途写盘任务超过 WRITE_QUEUE_SIZE 时新 item 排队等待，
+# 排队任务达到 WRITE_BACKLOG 时暂停引擎调度新请求，降到一半以下再恢复
+WRITE_THREADS = 4
+WRITE_QUEUE_SIZE = 32
+WRITE_BACKLOG = 64
+# 小于 SMALL_ITEM_BYTES 的 item 攒批写入，一批最多 BATCH_MAX_ITEMS 条或 SMALL_ITEM_BYTES 字节
+SMALL_ITEM_BYTES = 256 * 1024
+BATCH_MAX_ITEMS = 32
+BATCH_FLUSH_SECONDS = 0.5
 
 class SaveContentPipeline:
     def __init__(self, crawler):
         self.crawler = crawler
         os.makedirs('spider_data/pages', exist_ok=True)
         os.makedirs('spider_data/files', exist_ok=True)
-        self.metadata_file = 'spider_data/metadata.json'
-        self.metadata = []
-        if os.path.exists(self.metadata_file):
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                self.metadata = json.load(f)
+        # 页面和文件写入压缩 pack 存储，而不是每条一个小文件
+        self.store = SnapshotStore('spider_data', writable=True)
+        # 元数据逐条追加到 JSONL 日志，不在内存中累积
+        self.journal = MetadataJournal('spider_data')
+        # 近似重复检测（默认关闭）：从日志中恢复已保存页面的指纹
+        self.skip_near_duplicates = crawler.settings.getbool('SIMHASH_SKIP_NEAR_DUPLICATES', False)
+        self.simhash_index = SimHashIndex()
+        self.simhash_lock = threading.Lock()
+        if self.skip_near_duplicates:
+            for entry in iter_metadata('spider_data'):
+                if entry.get('simhash'):
+                    self.simhash_index.add(int(entry['simhash'], 16), entry['url'])
+        # 写盘在独立线程池中进行，不阻塞 Twisted reactor
+        settings = crawler.settings
+        self.write_pool = ThreadPool(minthreads=1, maxthreads=settings.getint('PIPELINE_WRITE_THREADS', WRITE_THREADS),
+                                     name='SaveContentPipeline')
+        self.write_slots = defer.DeferredSemaphore(settings.getint('PIPELINE_WRITE_QUEUE_SIZE', WRITE_QUEUE_SIZE))
+        self.write_backlog = settings.getint('PIPELINE_WRITE_BACKLOG', WRITE_BACKLOG)
+        self.paused = False
+        # 已领取、正在写入的快照 key，与 store 中已有的 key 一起判断是否重复（两个写盘线程可能处理同一 key）
+        self.pending_keys = set()
+        self.key_lock = threading.Lock()
+        self.batch = []
+        self.batch_bytes = 0
+        self.in_flight = set()
+        self.flush_loop = None
         # Load custom stats backup
         self.stats_file = 'spider_data/state/custom_stats.pickle'
+        self.items_since_checkpoint = 0
+        self.last_checkpoint = time.time()
         if os.path.exists(self.stats_file):
             try:
                 with open(self.stats_file, 'rb') as f:
@@ -26,37 +69,152 @@ class SaveContentPipeline:
     def from_crawler(cls, crawler):
         return cls(crawler)
 
+    def open_spider(self, spider):
+        self.write_pool.start()
+        # 定时刷出未满的小文件批次
+        self.flush_loop = task.LoopingCall(self.flush_batch)
+        self.flush_loop.start(BATCH_FLUSH_SECONDS, now=False)
+
     def process_item(self, item, spider):
-        url_hash = hashlib.md5(item['url'].encode()).hexdigest()
-        if item['file_type'] == 'html':
-            filename = f'{url_hash}.html'
-            folder = 'spider_data/pages'
-            snapshot_path = os.path.join(folder, filename)  # 新增快照路径
+        """把写盘工作交给线程池，返回 Deferred；小文件攒批写入"""
+        d = defer.Deferred()
+        if len(item['content']) < SMALL_ITEM_BYTES:
+            self.batch.append((item, d))
+            self.batch_bytes += len(item['content'])
+            if len(self.batch) >= BATCH_MAX_ITEMS or self.batch_bytes >= SMALL_ITEM_BYTES:
+                self.flush_batch()
         else:
-            filename = f'{url_hash}.{item["file_type"]}'
-            folder = 'spider_data/files'
-            snapshot_path = None  # 非 HTML 文件无快照
+            self.submit([(item, d)], spider)
+        d.addCallback(self.after_save, item, spider)
+        return d
+
+    def flush_batch(self):
+        if self.batch:
+            batch, self.batch, self.batch_bytes = self.batch, [], 0
+            self.submit(batch, self.crawler.spider)
+
+    def submit(self, records, spider):
+        """提交一个写盘任务；在途任务达到上限时排队等待，Scrapy 随之暂停处理新响应"""
+        items = [item for item, _ in records]
+        job = self.write_slots.run(threads.deferToThreadPool, reactor, self.write_pool,
+                                   self.save_items, items, spider)
+        self.in_flight.add(job)
+        if not self.paused and len(self.write_slots.waiting) >= self.write_backlog:
+            # 排队的写盘任务过多：暂停调度新请求，等待队列不再无限增长
+            self.paused = True
+            self.crawler.engine.pause()
+            self.crawler.stats.inc_value('pipeline/backpressure_pauses')
+
+        def done(result):
+            self.in_flight.discard(job)
+            if self.paused and len(self.write_slots.waiting) <= self.write_backlog // 2:
+                self.paused = False
+                self.crawler.engine.unpause()
+            if isinstance(result, Failure):
+                spider.logger.warning(f"Failed to save batch of {len(items)} items: {result.getErrorMessage()}")
+            elif result:
+                self.crawler.stats.inc_value('simhash/near_duplicates', result)
+            for _, d in records:
+                d.callback(None)
+        job.addBoth(done)
 
-        file_path = os.path.join(folder, filename)
-        if os.path.exists(file_path):
-            return item
+    def save_items(self, items, spider):
+        """在线程池中执行：保存一批 item，结束时统一 flush；返回跳过的近似重复数"""
+        duplicates = 0
+        for item in items:
+            if self.save_item(item, spider) == 'duplicate':
+                duplicates += 1
+        self.store.flush()
+        self.journal.flush()
+        return duplicates
 
+    def save_item(self, item, spider):
+        key = snapshot_key(item['url'], item['file_type'])
+        filename = key.split('/', 1)[1]
+        file_path = os.path.join('spider_data', key)
+        # 非 HTML 文件无快照
+        snapshot_path = file_path.replace(os.sep, '/') if item['file_type'] == 'html' else None
+        # 在锁内领取 key，检查和写入之间其他线程不会再写同一 key
+        with self.key_lock:
+            if key in self.pending_keys:
+                return 'exists'
+            # 增量重爬中内容已变化的 item 覆盖旧快照（pack 中追加新记录，索引以最后一条为准）
+            if not item.get('recrawled') and (key in self.store or os.path.exists(file_path)):
+                return 'exists'
+            self.pending_keys.add(key)
         try:
-            with open(file_path, 'wb') as f:
-                f.write(item['content'])
-        except Exception as e:
-            spider.logger.warning(f"Failed to save file {file_path}: {e}")
-            return item
+            return self.write_item(item, key, filename, file_path, snapshot_path, spider)
+        finally:
+            # 写入后 key 已在 store 中；失败时释放以便重试
+            with self.key_lock:
+                self.pending_keys.discard(key)
+
+    def write_item(self, item, key, filename, file_path, snapshot_path, spider):
+        # 增量重爬中正文未变、只有 ETag / Last-Modified 更新的 item：沿用已有快照，只追加新的元数据条目
+        reuse_snapshot = item.get('unchanged') and key in self.store
+        fingerprint = None
+        if self.skip_near_duplicates and item['file_type'] == 'html':
+            fingerprint = simhash(main_content_text(item['content']))
+            if fingerprint is not None and not reuse_snapshot:
+                with self.simhash_lock:
+                    duplicate_of = self.simhash_index.find(fingerprint)
+                    if duplicate_of == item['url']:
+                        duplicate_of = None  # 同一页面的旧版本
+                    if not duplicate_of:
+                        self.simhash_index.add(fingerprint, item['url'])
+                if duplicate_of:
+                    spider.logger.debug(f"Skipping near-duplicate {item['url']} of {duplicate_of}")
+                    # 不保存快照，但记录出链，链接图中仍保留该页面指向的链接
+                    self.journal_duplicate(item, duplicate_of, spider)
+                    return 'duplicate'
+
+        if not reuse_snapshot:
+            try:
+                self.store.put(key, item['content'], url=item['url'], file_type=item['file_type'], flush=False)
+            except Exception as e:
+                spider.logger.warning(f"Failed to save file {file_path}: {e}")
+                return 'failed'
 
         metadata_entry = {
             'url': item['url'],
             'filename': filename,
             'file_type': item['file_type'],
             'original_filename': item.get('original_filename'),
-            'snapshot_path': snapshot_path  # 新增字段
+            'snapshot_path': snapshot_path,  # 新增字段
+            'outlinks': item.get('outlinks') or [],  # 出链，用于计算 PageRank
+            'simhash': f'{fingerprint:016x}' if fingerprint is not None else None,
+            # 条件请求校验信息，供增量重爬使用
+            'etag': item.get('etag'),
+            'last_modified': item.get('last_modified'),
+            'content_hash': item.get('content_hash'),
+            # 发生重定向时为最初请求的 URL，重爬时按它查找校验信息
+            'request_url': item.get('request_url'),
+            'fetched_at': time.time()
         }
-        self.metadata.append(metadata_entry)
-        
+        try:
+            self.journal.append(metadata_entry, flush=False)
+        except Exception as e:
+            spider.logger.warning(f"Failed to write metadata for {item['url']}: {e}")
+        return 'saved'
+
+    def journal_duplicate(self, item, duplicate_of, spider):
+        """近似重复页面只记录出链和正文哈希（建索引时不作为文档，只参与 PageRank）"""
+        try:
+            self.journal.append({
+                'url': item['url'],
+                'filename': None,
+                'file_type': item['file_type'],
+                'outlinks': item.get('outlinks') or [],
+                'duplicate_of': duplicate_of,
+                # 没有快照可供 304 时跟进链接，因此不记录 ETag / Last-Modified
+                'content_hash': item.get('content_hash'),
+                'request_url': item.get('request_url'),
+                'fetched_at': time.time()
+            }, flush=False)
+        except Exception as e:
+            spider.logger.warning(f"Failed to write metadata for {item['url']}: {e}")
+
+    def after_save(self, _, item, spider):
         # Update progress bar and backup stats
         if hasattr(spider, 'progress_bar') and spider.progress_bar:
             try:
@@ -64,19 +222,43 @@ class SaveContentPipeline:
                 item_count = stats.get('item_scraped_count', 0)
                 spider.progress_bar.n = item_count
                 spider.progress_bar.refresh()
-                # Backup stats
-                with open(self.stats_file, 'wb') as f:
-                    pickle.dump(stats, f)
+                self.checkpoint_stats()
             except Exception as e:
                 spider.logger.warning(f"Failed to update progress bar or backup stats: {e}")
         
         return item
+
+    def checkpoint_stats(self, force=False):
+        """按时间或条数节流备份统计信息，避免每条 item 都 pickle 一次"""
+        self.items_since_checkpoint += 1
+        if not force and self.items_since_checkpoint < STATS_CHECKPOINT_ITEMS \
+                and time.time() - self.last_checkpoint < STATS_CHECKPOINT_SECONDS:
+            return
+        os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
+        with open(self.stats_file, 'wb') as f:
+            pickle.dump(self.crawler.stats.get_stats(), f)
+        self.items_since_checkpoint = 0
+        self.last_checkpoint = time.time()
     
     def close_spider(self, spider):
+        """刷出剩余批次并等待所有在途写盘任务完成后再关闭存储"""
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush_batch()
+        d = defer.DeferredList(list(self.in_flight))
+        d.addBoth(lambda _: self.finish_close(spider))
+        return d
+
+    def finish_close(self, spider):
+        self.write_pool.stop()
+        self.store.close()
         try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+            self.journal.close()
         except Exception as e:
             spider.logger.warning(f"Failed to save metadata: {e}")
+        try:
+            self.checkpoint_stats(force=True)
+        except Exception as e:
+            spider.logger.warning(f"Failed to backup stats: {e}")
         if hasattr(spider, 'progress_bar') and spider.progress_bar:
             spider.progress_bar.close()
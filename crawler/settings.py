@@ -18,3 +18,5 @@ RETRY_TIMES = 3
 RETRY_HTTP_CODES = [429, 500, 502, 503, 504]
 JOBDIR = 'spider_data/state'
 STATS_DUMP = True
+SIMHASH_SKIP_NEAR_DUPLICATES = False  # 开启后跳过正文与已保存页面近似重复（SimHash）的页面，出链仍记入链接图
+CRAWL_HOST_BUDGET = 20000  # 每个主机最多调度的请求数（0 表示不限），超出后不再跟进该主机的链接
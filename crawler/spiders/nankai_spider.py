@@ -1,6 +1,12 @@
 import scrapy
 import os
+import hashlib
+from scrapy.http import HtmlResponse
 from crawler.items import PageItem
+from crawler.url_seen import URLSeenFilter
+from crawler.scheduling import CrawlPriorityPolicy
+from metadata_journal import iter_metadata
+from snapshot_store import SnapshotStore, snapshot_key
 from urllib.parse import urlparse, urljoin, unquote
 import re
 from tqdm import tqdm
@@ -42,11 +48,30 @@ class NankaiSpider(scrapy.Spider):
         'https://shxy.nankai.edu.cn/'
     ]
     file_extensions = {'.pdf', '.doc', '.docx', '.jpg', '.png', '.xls', '.xlsx'}
-    handle_httpstatus_list = [403, 404, 429]
+    handle_httpstatus_list = [304, 403, 404, 429]
+    seen_save_every = 10000  # 每新增多少个 URL 持久化一次去重过滤器
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, recrawl=False, **kwargs):
         super().__init__(*args, **kwargs)
-        self.seen_urls = set()  # 使用集合快速去重
+        self.seen_urls = None  # 在 start_requests 中按 JOBDIR 加载
+        # 增量重爬：-a recrawl=1，发送条件请求并只输出内容变化的 item
+        self.recrawl = str(recrawl).lower() in ('1', 'true', 'yes')
+        self.validators = {}
+        self.snapshots = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if spider.recrawl:
+            # Recrawls revisit every known URL: Scrapy's persisted request fingerprints from the
+            # previous crawl in the same JOBDIR would drop them, so leave dedup to seen_urls
+            crawler.settings.set('DUPEFILTER_CLASS', 'scrapy.dupefilters.BaseDupeFilter', priority='spider')
+        return spider
+
+    async def start(self):
+        # Scrapy >= 2.13 calls start() instead of start_requests()
+        for request in self.start_requests():
+            yield request
 
     def start_requests(self):
         # Initialize tldextract with custom cache
@@ -58,6 +83,17 @@ class NankaiSpider(scrapy.Spider):
             fallback_to_snapshot=True
         )
         
+        # Load the persisted URL-seen filter so resumed crawls keep their dedup state.
+        # A recrawl has to revisit the URLs a previous crawl marked as seen, so it starts
+        # from an empty filter that is not persisted (an interrupted recrawl starts over)
+        state_dir = self.settings.get('JOBDIR') or os.path.join('spider_data', 'state')
+        self.seen_urls = URLSeenFilter(None if self.recrawl else os.path.join(state_dir, 'seen_urls.bloom'))
+        # Priority frontier: depth, URL pattern and per-host change/error rates
+        self.policy = CrawlPriorityPolicy.from_settings(self.settings)
+
+        if self.recrawl:
+            self.load_validators()
+
         # Initialize progress bar
         try:
             self.progress_bar = tqdm(total=100000, desc="Crawling", unit="items")
@@ -69,59 +105,165 @@ class NankaiSpider(scrapy.Spider):
             self.logger.warning(f"Failed to initialize progress bar: {e}")
             self.progress_bar = None
 
-        # Yield start URLs
+        # Yield start URLs; like Scrapy's default start requests they bypass dedup, so a
+        # crawl reusing a JOBDIR (or its seen filter) still begins from the entry pages
         for url in self.start_urls:
-            if url not in self.seen_urls:
+            if self.policy.allow(url):
                 self.seen_urls.add(url)
-                yield scrapy.Request(url, callback=self.parse, errback=self.handle_error)
+                yield scrapy.Request(url, callback=self.parse, errback=self.handle_error,
+                                     headers=self.conditional_headers(url),
+                                     priority=self.policy.priority(url), dont_filter=True)
+
+    def load_validators(self):
+        """Load per-URL validators (ETag, Last-Modified, body hash) recorded by earlier crawls"""
+        for entry in iter_metadata('spider_data'):
+            if entry.get('etag') or entry.get('last_modified') or entry.get('content_hash'):
+                validators = (entry.get('etag'), entry.get('last_modified'), entry.get('content_hash'))
+                self.validators[entry['url']] = validators
+                # Redirected pages are requested by their original URL, so look them up by it too
+                if entry.get('request_url'):
+                    self.validators[entry['request_url']] = validators
+        self.snapshots = SnapshotStore('spider_data')
+        self.logger.info(f"Recrawl mode: loaded validators for {len(self.validators)} URLs")
+
+    def conditional_headers(self, url):
+        headers = {}
+        etag, last_modified, _ = self.validators.get(url, (None, None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def request_url(self, response):
+        """URL originally requested (before redirects); conditional headers are sent for it"""
+        return (response.meta.get('redirect_urls') or [response.url])[0]
+
+    def previous_validators(self, response):
+        return self.validators.get(self.request_url(response)) or self.validators.get(response.url)
+
+    def response_validators(self, response):
+        return (response.headers.get('ETag', b'').decode('latin-1') or None,
+                response.headers.get('Last-Modified', b'').decode('latin-1') or None)
+
+    def set_validators(self, item, response, unchanged=False):
+        item['etag'], item['last_modified'] = self.response_validators(response)
+        item['content_hash'] = hashlib.sha1(response.body).hexdigest()
+        item['recrawled'] = self.recrawl
+        item['unchanged'] = unchanged
+        if self.request_url(response) != response.url:
+            item['request_url'] = self.request_url(response)
+
+    def is_unchanged(self, response):
+        """Full response whose body hash matches the previous crawl"""
+        previous = self.previous_validators(response)
+        if previous and previous[2] == hashlib.sha1(response.body).hexdigest():
+            self.crawler.stats.inc_value('recrawl/unchanged')
+            return True
+        return False
+
+    def validators_changed(self, response):
+        """Unchanged body served with a new ETag / Last-Modified, which must be saved for the next recrawl"""
+        previous = self.previous_validators(response)
+        if previous and self.response_validators(response) != previous[:2]:
+            self.crawler.stats.inc_value('recrawl/validators_refreshed')
+            return True
+        return False
 
     def parse(self, response):
+        self.policy.record_response(response.url, response.status)
         if response.status in (403, 404, 429):
             return
 
+        depth = response.meta.get('depth', 0) + 1
+        unchanged = False
+        refresh_validators = False
+        if response.status == 304:
+            # Not modified: follow links from the stored snapshot instead of re-downloading
+            self.crawler.stats.inc_value('recrawl/not_modified')
+            body = self.snapshots.get(snapshot_key(response.url, 'html')) if self.snapshots else None
+            if body is None:
+                return
+            response = HtmlResponse(url=response.url, body=body, encoding='utf-8')
+            unchanged = True
+        elif self.recrawl:
+            unchanged = self.is_unchanged(response)
+            refresh_validators = unchanged and self.validators_changed(response)
+        if self.recrawl:
+            self.policy.record_change(response.url, not unchanged)
+
         try:
-            # Save HTML page
-            if not any(response.url.lower().endswith(ext) for ext in self.file_extensions):
+            # Extract links; outlinks are recorded for the link graph
+            outlinks = []
+            for href in response.css('a::attr(href)').getall():
+                absolute_url = urljoin(response.url, href.strip())
+                parsed = urlparse(absolute_url)
+                if parsed.scheme in ('http', 'https') and parsed.netloc:
+                    outlinks.append(absolute_url)
+
+            # Save HTML page (in recrawl mode only changed pages, or unchanged ones whose validators changed)
+            if (not unchanged or refresh_validators) and not any(response.url.lower().endswith(ext) for ext in self.file_extensions):
                 item = PageItem()
                 item['url'] = response.url
                 item['content'] = response.body
                 item['file_type'] = 'html'
                 item['original_filename'] = None
+                item['outlinks'] = outlinks
+                self.set_validators(item, response, unchanged=unchanged)
                 yield item
 
-            # Extract and follow links
-            for href in response.css('a::attr(href)').getall():
-                absolute_url = urljoin(response.url, href.strip())
+            # Follow links
+            for absolute_url in outlinks:
                 if absolute_url in self.seen_urls:
-                    continue  # 跳过已处理的 URL
+                    continue  # 跳过已处理的 URL（按规范化 URL 判断）
+                # 超出主机预算的 URL 不记为已见，续爬时（预算重新计数）仍可调度
+                if not self.policy.allow(absolute_url):
+                    self.crawler.stats.inc_value('scheduler/host_budget_exceeded')
+                    continue
                 self.seen_urls.add(absolute_url)
+                if self.seen_urls.unsaved >= self.seen_save_every:
+                    self.seen_urls.save()
 
                 parsed = urlparse(absolute_url)
-                if not parsed.scheme in ('http', 'https') or not parsed.netloc:
-                    continue
 
                 path = parsed.path.lower()
                 file_ext = next((ext for ext in self.file_extensions if path.endswith(ext)), None)
+                priority = self.policy.priority(absolute_url, depth, is_file=bool(file_ext))
                 
                 if file_ext:
                     yield scrapy.Request(
                         absolute_url,
                         callback=self.parse_file,
                         meta={'file_type': file_ext[1:]},
-                        errback=self.handle_error
+                        errback=self.handle_error,
+                        headers=self.conditional_headers(absolute_url),
+                        priority=priority
                     )
                 else:
                     yield response.follow(
                         absolute_url,
                         self.parse,
-                        errback=self.handle_error
+                        errback=self.handle_error,
+                        headers=self.conditional_headers(absolute_url),
+                        priority=priority
                     )
         except Exception as e:
             self.logger.warning(f"Error in parse: {e}")
 
     def parse_file(self, response):
+        self.policy.record_response(response.url, response.status)
         if response.status in (403, 404, 429):
             return
+        if response.status == 304:
+            self.crawler.stats.inc_value('recrawl/not_modified')
+            self.policy.record_change(response.url, False)
+            return
+        unchanged = False
+        if self.recrawl:
+            unchanged = self.is_unchanged(response)
+            self.policy.record_change(response.url, not unchanged)
+            if unchanged and not self.validators_changed(response):
+                return
         try:
             item = PageItem()
             item['url'] = response.url
@@ -138,9 +280,14 @@ class NankaiSpider(scrapy.Spider):
                 filename = path.split('/')[-1] if '/' in path else path
                 item['original_filename'] = unquote(filename, encoding='utf-8', errors='replace') if filename else None
             
+            self.set_validators(item, response, unchanged=unchanged)
             yield item
         except Exception as e:
             self.logger.warning(f"Error in parse_file: {e}")
 
+    def closed(self, reason):
+        if self.seen_urls is not None:
+            self.seen_urls.save()
+
     def handle_error(self, failure):
         self.logger.warning(f"Request failed: {failure}")
\ No newline at end of file
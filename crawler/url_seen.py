@@ -0,0 +1,115 @@
+import os
+import json
+import math
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def canonicalize_url(url):
+    """URL 规范化：去掉片段、主机名小写、去默认端口、查询参数排序、去掉末尾斜杠"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    path = parts.path or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+class BloomFilter:
+    """定长布隆过滤器，使用双重哈希生成 k 个位置"""
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def _positions(self, h1, h2):
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def contains(self, h1, h2):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(h1, h2))
+
+    def add(self, h1, h2):
+        for pos in self._positions(h1, h2):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+class URLSeenFilter:
+    """可扩展布隆过滤器实现的已见 URL 集合，内存随 URL 数量按块增长并可持久化
+
+    每个子过滤器写满后追加一个容量翻倍、误判率更低的新过滤器，总体误判率
+    不超过 error_rate。误判只会让极少数新 URL 被当作已见而跳过。
+    """
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, path=None, initial_capacity=100000, error_rate=0.001):
+        self.path = path
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.filters = []
+        self.unsaved = 0
+        if path and os.path.exists(path):
+            self._load()
+
+    @staticmethod
+    def _hashes(url):
+        digest = hashlib.md5(canonicalize_url(url).encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def __contains__(self, url):
+        h1, h2 = self._hashes(url)
+        return any(f.contains(h1, h2) for f in self.filters)
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    def add(self, url):
+        """加入 URL，已见过时返回 False"""
+        h1, h2 = self._hashes(url)
+        if any(f.contains(h1, h2) for f in self.filters):
+            return False
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            i = len(self.filters)
+            self.filters.append(BloomFilter(
+                self.initial_capacity * self.GROWTH ** i,
+                self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** i
+            ))
+        self.filters[-1].add(h1, h2)
+        self.unsaved += 1
+        return True
+
+    def save(self):
+        """原子地写入磁盘：一行 JSON 头部，随后依次为各子过滤器的位数组"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        header = {
+            'initial_capacity': self.initial_capacity,
+            'error_rate': self.error_rate,
+            'filters': [{'capacity': f.capacity, 'error_rate': f.error_rate, 'count': f.count} for f in self.filters]
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as fh:
+            fh.write(json.dumps(header).encode('utf-8') + b'\n')
+            for f in self.filters:
+                fh.write(f.bits)
+        os.replace(tmp_path, self.path)
+        self.unsaved = 0
+
+    def _load(self):
+        with open(self.path, 'rb') as fh:
+            header = json.loads(fh.readline())
+            self.initial_capacity = header['initial_capacity']
+            self.error_rate = header['error_rate']
+            for meta in header['filters']:
+                f = BloomFilter(meta['capacity'], meta['error_rate'], count=meta['count'])
+                f.bits = bytearray(fh.read(len(f.bits)))
+                self.filters.append(f)
@@ -0,0 +1,152 @@
+import os
+import mmap
+import struct
+import threading
+from cachetools import LRUCache
+from snapshot_store import _compress, _decompress, zstandard
+
+# 索引旁的正文存储：按块压缩的记录 + 定长偏移表，读取时 mmap 随机访问
+DATA_FILE = 'docstore.dat'
+OFFSETS_FILE = 'docstore.idx'
+MAGIC = b'WDS2'
+# 头部：魔数、编码、记录数、块数、存储标识
+HEADER = struct.Struct('<4s8sIIQ')
+# 早期版本的头部没有存储标识
+LEGACY_MAGIC = b'WDS1'
+LEGACY_HEADER = struct.Struct('<4s8sII')
+# 块表：块在数据文件中的偏移和压缩后长度
+BLOCK = struct.Struct('<QI')
+# 记录表：所在块号、块内偏移、长度
+RECORD = struct.Struct('<III')
+# 每块未压缩大小的上限，相邻文档一起压缩以提高压缩率
+BLOCK_SIZE = 64 * 1024
+CACHED_BLOCKS = 64
+# 每个目录保留的已打开存储数：重建后旧查询的命中仍可读取其所属存储
+RETAINED_STORES = 2
+
+def new_store_id():
+    """每次构建随机生成的存储标识，同时写入索引中的每篇文档，用于核对命中与存储是否同一代"""
+    return int.from_bytes(os.urandom(8), 'little') >> 1
+
+class DocStoreWriter:
+    """顺序写入文档正文，add() 返回记录号（即索引中的 doc_id）"""
+    def __init__(self, store_dir, codec=None):
+        self.store_dir = store_dir
+        self.codec = codec or ('zstd' if zstandard else 'zlib')
+        self.store_id = new_store_id()
+        os.makedirs(store_dir, exist_ok=True)
+        self._data = open(os.path.join(store_dir, DATA_FILE + '.tmp'), 'wb')
+        self._blocks = []
+        self._records = []
+        self._buffer = bytearray()
+        self.raw_bytes = 0
+
+    def add(self, text):
+        data = (text or '').encode('utf-8')
+        # 空正文不触发刷块，否则末尾的空记录会指向一个不会写出的块
+        if data and self._buffer and len(self._buffer) + len(data) > BLOCK_SIZE:
+            self._flush_block()
+        self._records.append((len(self._blocks), len(self._buffer), len(data)))
+        self._buffer += data
+        self.raw_bytes += len(data)
+        return len(self._records) - 1
+
+    def _flush_block(self):
+        compressed = _compress(bytes(self._buffer), self.codec)
+        self._blocks.append((self._data.tell(), len(compressed)))
+        self._data.write(compressed)
+        self._buffer = bytearray()
+
+    def close(self):
+        if self._buffer:
+            self._flush_block()
+        self._data.close()
+        offsets_tmp = os.path.join(self.store_dir, OFFSETS_FILE + '.tmp')
+        with open(offsets_tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.codec.encode('ascii'), len(self._records), len(self._blocks), self.store_id))
+            f.writelines(BLOCK.pack(*block) for block in self._blocks)
+            f.writelines(RECORD.pack(*record) for record in self._records)
+        os.replace(os.path.join(self.store_dir, DATA_FILE + '.tmp'), os.path.join(self.store_dir, DATA_FILE))
+        os.replace(offsets_tmp, os.path.join(self.store_dir, OFFSETS_FILE))
+
+class DocStore:
+    """只读文档存储：偏移表和数据文件均 mmap，解压后的块按 LRU 缓存（线程安全）"""
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self._files = [open(os.path.join(store_dir, name), 'rb') for name in (OFFSETS_FILE, DATA_FILE)]
+        self._offsets, self._data = [
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+            for f in self._files
+        ]
+        magic = self._offsets[:4]
+        if magic == MAGIC:
+            _, codec, self.num_records, self.num_blocks, self.store_id = HEADER.unpack_from(self._offsets, 0)
+            header_size = HEADER.size
+        elif magic == LEGACY_MAGIC:
+            _, codec, self.num_records, self.num_blocks = LEGACY_HEADER.unpack_from(self._offsets, 0)
+            self.store_id, header_size = None, LEGACY_HEADER.size
+        else:
+            raise ValueError(f"Not a document store: {store_dir}")
+        self.codec = codec.rstrip(b'\0').decode('ascii')
+        self._blocks_pos = header_size
+        self._records_pos = header_size + BLOCK.size * self.num_blocks
+        self._cache = LRUCache(maxsize=CACHED_BLOCKS)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.num_records
+
+    def _block(self, block):
+        with self._lock:
+            data = self._cache.get(block)
+        if data is None:
+            offset, length = BLOCK.unpack_from(self._offsets, self._blocks_pos + BLOCK.size * block)
+            data = _decompress(self._data[offset:offset + length], self.codec)
+            with self._lock:
+                self._cache[block] = data
+        return data
+
+    def get(self, doc_id):
+        """返回记录号对应的正文，不存在时返回 None"""
+        if doc_id is None or not 0 <= doc_id < self.num_records:
+            return None
+        block, start, length = RECORD.unpack_from(self._offsets, self._records_pos + RECORD.size * doc_id)
+        if not length:
+            return ''  # 早期版本写出的空记录可能指向不存在的块
+        return self._block(block)[start:start + length].decode('utf-8')
+
+    def close(self):
+        for m in (self._offsets, self._data):
+            if isinstance(m, mmap.mmap):
+                m.close()
+        for f in self._files:
+            f.close()
+
+# 按目录缓存打开的存储 [(偏移表修改时间, DocStore)]，最新的在前；索引重建后重新打开，
+# 旧存储的文件已被替换，但打开的映射仍可读取旧内容
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_doc_store(store_dir, store_id=None):
+    """打开目录中的文档存储，没有存储（旧版索引）时返回 None
+
+    store_id 为命中所属的存储标识（索引中随文档保存）：返回该代存储，
+    已不在保留范围内时返回 None，避免按 doc_id 读到另一次构建的正文。
+    """
+    path = os.path.join(store_dir, OFFSETS_FILE)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _stores_lock:
+        retained = _stores.setdefault(store_dir, [])
+        if mtime is not None and (not retained or retained[0][0] != mtime):
+            retained.insert(0, (mtime, DocStore(store_dir)))
+            del retained[RETAINED_STORES:]
+        if store_id is None:
+            return retained[0][1] if retained and mtime is not None else None
+        return next((store for _, store in retained if store.store_id == store_id), None)
+
+def doc_store_size(store_dir):
+    return sum(os.path.getsize(os.path.join(store_dir, name))
+               for name in (DATA_FILE, OFFSETS_FILE) if os.path.exists(os.path.join(store_dir, name)))
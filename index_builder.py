@@ -1,16 +1,29 @@
 import os
+import re
 import json
 import time
+import pickle
+import shutil
+import argparse
 from functools import lru_cache, partial
+from itertools import islice
 from multiprocessing import Pool, cpu_count
-from whoosh.index import create_in
-from whoosh.fields import Schema, TEXT, ID
+from whoosh.index import create_in, open_dir
+from whoosh.fields import Schema, TEXT, ID, NUMERIC, STORED
 from whoosh.qparser import MultifieldParser, FuzzyTermPlugin, WildcardPlugin
 from whoosh.highlight import UppercaseFormatter
 from bs4 import BeautifulSoup, SoupStrainer
 import logging
 from tqdm import tqdm
 from analyzers import ChineseAnalyzer
+from link_graph import compute_link_scores, get_host_id, PAGERANK_SCALE
+from snapshot_store import read_snapshot, snapshot_size
+from metadata_journal import MetadataSource
+from simhash import SimHashIndex, simhash
+from sharding import SHARD_MANIFEST, SHARD_STRATEGIES, shard_for_url, shard_name, shard_generation_dir, read_manifest, write_manifest, list_shards
+from spelling import SPELLING_FILE, build_spelling_dictionary
+from doc_store import DocStoreWriter, doc_store_size, CACHED_BLOCKS, BLOCK_SIZE
+from related import RELATED_DIR, build_related_index
 from whoosh.scoring import BM25F
 import psutil
 
@@ -19,13 +32,18 @@ logger = logging.getLogger(__name__)
 
 # 支持的文件类型
 SUPPORTED_FILE_TYPES = {'.html', '.pdf', '.doc', '.docx', '.jpg', '.png', '.xls', '.xlsx'}
+# 估算检索内存时抽样的文档数，以及一次检索读取存储字段的命中数（与服务端 run_query 的 limit 一致）
+STORED_FIELDS_SAMPLE = 1000
+HITS_PER_SEARCH = 100
+# 分片目录（含各代目录和旧版本留下的 .tmp 目录），重建后清理未被清单引用的
+STALE_SHARD_RE = re.compile(r'shard_\d{3}(\.g\d+|\.tmp)?$')
 
 @lru_cache(maxsize=1000)
-def extract_html_content(file_path):
-    """提取 HTML 或 XML 文件的标题和正文"""
+def extract_html_content(data_path, relpath):
+    """提取 HTML 或 XML 快照的标题和正文（独立文件或 pack 存储）"""
+    file_path = os.path.join(data_path, relpath)
     try:
-        with open(file_path, 'rb') as f:
-            content = f.read().decode('utf-8', errors='ignore')
+        content = read_snapshot(data_path, relpath).decode('utf-8', errors='ignore')
         strainer = SoupStrainer(['title', 'p', 'div', 'article'])
         soup = BeautifulSoup(content, 'lxml' if "<html" in content.lower() else "xml", parse_only=strainer)
         title = soup.title.string.strip() if soup.title and soup.title.string else ""
@@ -45,7 +63,7 @@ def get_file_type(url):
 def process_entry(entry, data_dir):
     """解析单个条目并返回索引文档"""
     try:
-        # 获取 file_type，优先使用 metadata.json 中的值
+        # 获取 file_type，优先使用元数据中的值
         file_type = entry.get('file_type', get_file_type(entry['url'])).lower()
         if file_type.startswith('.'):
             file_type = file_type[1:]  # 规范化，去掉前缀点
@@ -66,9 +84,11 @@ def process_entry(entry, data_dir):
         # 修复：根据 file_type 选择文件夹
         base_dir = os.path.dirname(os.path.abspath(__file__))  # 获取 index_builder.py 所在目录
         folder = 'pages' if file_type == 'html' else 'files'
-        file_path = os.path.join(base_dir, data_dir, folder, filename)
+        data_path = os.path.join(base_dir, data_dir)
+        relpath = f'{folder}/{filename}'
+        file_path = os.path.join(data_path, folder, filename)
         
-        if not os.path.exists(file_path):
+        if snapshot_size(data_path, relpath) is None:
             logger.warning(f"File not found: {file_path} for URL {entry['url']}, file_type: {file_type}")
             original_filename = entry.get('original_filename', entry['url'].split('/')[-1] or '未知文件名')
             return {
@@ -81,7 +101,7 @@ def process_entry(entry, data_dir):
         
         # 仅为 HTML 文件提取内容
         if file_type == 'html':
-            title, content = extract_html_content(file_path)
+            title, content = extract_html_content(data_path, relpath)
             logger.info(f"Extracted HTML content for {file_path}")
         else:
             # 非 HTML 文件仅设置标题
@@ -100,65 +120,148 @@ def process_entry(entry, data_dir):
         logger.error(f"Failed to process entry {entry.get('url', 'unknown')}: {e}")
         return None
 
-def build_index(data_dir, index_dir, max_entries=None, batch_size=None):
-    """构建倒排索引，支持批量提交和多进程解析"""
+def collapse_near_duplicates(documents, link_scores):
+    """按 SimHash 合并近似重复文档，每组保留 PageRank 最高（其次 URL 最短）的一份"""
+    def rank_key(doc):
+        return (-(link_scores.get(doc['url']) or {}).get('pagerank', 0), len(doc['url']))
+
+    index = SimHashIndex()
+    kept = []
+    for doc in sorted(documents, key=rank_key):
+        fingerprint = simhash(doc['title'] + doc['content']) if doc['file_type'] == 'html' else None
+        if fingerprint is not None:
+            duplicate_of = index.find(fingerprint)
+            if duplicate_of:
+                logger.info(f"Collapsing near-duplicate {doc['url']} into {duplicate_of}")
+                continue
+            index.add(fingerprint, doc['url'])
+        kept.append(doc)
+    return kept
+
+def build_schema():
+    # 优化后的schema，使用cn_stopwords.txt中的停用词
+    return Schema(
+        url=ID(stored=True, unique=True),
+        title=TEXT(analyzer=ChineseAnalyzer(),  # 使用默认停用词配置
+                 stored=True, field_boost=2.0),  # 标题权重加倍
+        # 正文只建倒排不存储，原文写入压缩文档存储（doc_store.py），按 doc_id 读取
+        content=TEXT(analyzer=ChineseAnalyzer(),  # 使用默认停用词配置
+                   stored=False, field_boost=1.0),
+        doc_id=NUMERIC(int, stored=True),
+        store_id=STORED(),  # 所属文档存储的标识，读取正文时核对是同一次构建
+        file_type=ID(stored=True),  # 精确匹配，供检索时按类型过滤
+        snapshot_path=ID(stored=True),
+        # 链接图静态质量分，列存储供最终打分快速读取
+        pagerank=NUMERIC(int, stored=True, sortable=True, default=PAGERANK_SCALE),
+        indegree=NUMERIC(int, stored=True, sortable=True, default=0),
+        host_id=NUMERIC(int, stored=True, sortable=True, default=0)
+    )
+
+def remove_stale_shards(index_dir, keep):
+    """删除 index_dir 下不在 keep 中的分片目录（旧代目录和中断留下的目录）"""
+    for name in os.listdir(index_dir):
+        if STALE_SHARD_RE.match(name) and name not in keep:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+def write_index(index_dir, documents, link_scores, batch_size):
+    """在 index_dir 中新建索引和文档存储并分批提交文档，返回正文原始字节数"""
+    os.makedirs(index_dir, exist_ok=True)
+    ix = create_in(index_dir, build_schema())
+    store = DocStoreWriter(index_dir)
+    writer = ix.writer()
+    for i, doc in enumerate(documents):
+        doc.update(link_scores.get(doc['url']) or {"pagerank": PAGERANK_SCALE, "indegree": 0, "host_id": get_host_id(doc['url'])})
+        doc['doc_id'] = store.add(doc['content'])
+        doc['store_id'] = store.store_id
+        writer.add_document(**doc)
+        if (i + 1) % batch_size == 0:
+            writer.commit(optimize=False)
+            logger.info(f"Committed batch {i + 1} / {len(documents)} in {index_dir}")
+            writer = ix.writer()
+    # 先发布文档存储再提交最后一批：新索引可见时其存储已就绪
+    store.close()
+    writer.commit(optimize=True)
+    return store.raw_bytes
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(dirpath, name)) for dirpath, _, names in os.walk(path) for name in names)
+
+def stored_fields_size(index_dirs, sample=STORED_FIELDS_SAMPLE):
+    """抽样统计每篇文档存储字段的平均大小（检索时每个命中都要读入内存）"""
+    sizes = []
+    for index_dir in index_dirs:
+        with open_dir(index_dir).reader() as reader:
+            sizes.extend(len(pickle.dumps(fields)) for fields in islice(reader.all_stored_fields(), sample))
+    return sum(sizes) / len(sizes) if sizes else 0.0
+
+def build_index(data_dir, index_dir, max_entries=None, batch_size=None, collapse_duplicates=True,
+                num_shards=None, shard_strategy='hash', rebuild_shard=None):
+    """构建倒排索引，支持批量提交、多进程解析、近似重复文档合并和分片
+
+    num_shards 为 None 时构建单一索引；否则按 shard_strategy（URL 哈希或主机）
+    写入 index_dir 下的各分片。rebuild_shard 只重建已有分片布局中的一个分片，
+    此时近似重复只在该分片内合并。
+    """
     start_time = time.time()
+
+    if rebuild_shard is not None:
+        manifest = read_manifest(index_dir)
+        if not manifest:
+            logger.error(f"{index_dir} is not a sharded index, cannot rebuild shard {rebuild_shard}")
+            return
+        num_shards, shard_strategy = manifest['num_shards'], manifest['strategy']
+        if not 0 <= rebuild_shard < num_shards:
+            logger.error(f"Shard {rebuild_shard} out of range (0-{num_shards - 1})")
+            return
     
-    # 加载元数据
+    def in_target(entry):
+        # 爬取时跳过的近似重复页面只有出链，参与链接图但不作为文档
+        if entry.get('duplicate_of'):
+            return False
+        return rebuild_shard is None or shard_for_url(entry['url'], num_shards, shard_strategy) == rebuild_shard
+
+    # 元数据按需从日志流式读取（达到 max_entries 后停止），每一遍重新读取，不在内存中保留全部条目；
+    # 第一遍统计快照大小、条目数和缺失文件
+    metadata = MetadataSource(data_dir, max_entries)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
     load_start = time.time()
-    metadata_file = os.path.join(data_dir, 'metadata.json')
+    entry_count = 0
+    total_entries = 0
+    total_size = 0
+    missing_files = []
     try:
-        with open(metadata_file, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
+        for entry in metadata:
+            entry_count += 1
+            target = in_target(entry)
+            total_entries += target
+            if entry.get('filename'):
+                folder = 'pages' if entry.get('file_type', get_file_type(entry['url'])).lower().lstrip('.') == 'html' else 'files'
+                size = snapshot_size(os.path.join(base_dir, data_dir), f"{folder}/{entry['filename']}")
+                if size is None and target:
+                    missing_files.append(entry['filename'])
+                total_size += size or 0
     except Exception as e:
         logger.error(f"Failed to load metadata: {e}")
         return
     load_time = time.time() - load_start
+    if missing_files:
+        logger.warning(f"Missing files: {missing_files[:10]}{'...' if len(missing_files) > 10 else ''}")
 
     # 动态计算 batch_size
     mem = psutil.virtual_memory()
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    total_size = 0
-    for entry in metadata:
-        if entry.get('filename'):
-            folder = 'pages' if entry.get('file_type', get_file_type(entry['url'])).lower().lstrip('.') == 'html' else 'files'
-            file_path = os.path.join(base_dir, data_dir, folder, entry['filename'])
-            if os.path.exists(file_path):
-                total_size += os.path.getsize(file_path)
-    avg_size = total_size / len(metadata) if metadata else 1
+    avg_size = total_size / entry_count if entry_count else 1
     batch_size = min(10000, max(100, int(mem.available / avg_size))) if batch_size is None else batch_size
-    
-    # 优化后的schema，使用cn_stopwords.txt中的停用词
-    schema = Schema(
-        url=ID(stored=True, unique=True),
-        title=TEXT(analyzer=ChineseAnalyzer(),  # 使用默认停用词配置
-                 stored=True, field_boost=2.0),  # 标题权重加倍
-        content=TEXT(analyzer=ChineseAnalyzer(),  # 使用默认停用词配置
-                   stored=True, field_boost=1.0),
-        file_type=TEXT(stored=True),
-        snapshot_path=ID(stored=True)
-    )
-    os.makedirs(index_dir, exist_ok=True)
-    ix = create_in(index_dir, schema)
 
-    metadata = metadata[:max_entries] if max_entries else metadata
-    total_entries = len(metadata)
-    # 检查缺失文件
-    missing_files = []
-    for entry in metadata:
-        if entry.get('filename'):
-            folder = 'pages' if entry.get('file_type', get_file_type(entry['url'])).lower().lstrip('.') == 'html' else 'files'
-            file_path = os.path.join(base_dir, data_dir, folder, entry['filename'])
-            if not os.path.exists(file_path):
-                missing_files.append(entry['filename'])
-    if missing_files:
-        logger.warning(f"Missing files: {missing_files[:10]}{'...' if len(missing_files) > 10 else ''}")
+    # 计算链接图得分（始终基于完整链接图）
+    link_start = time.time()
+    link_scores = compute_link_scores(metadata)
+    link_time = time.time() - link_start
 
     process_start = time.time()
     documents = []
     process_entry_with_dir = partial(process_entry, data_dir=data_dir)
     with Pool(processes=max(1, cpu_count() - 1)) as pool, tqdm(total=total_entries, desc="Indexing", unit="doc") as pbar:
-        for i, doc in enumerate(pool.imap_unordered(process_entry_with_dir, metadata)):
+        for i, doc in enumerate(pool.imap_unordered(process_entry_with_dir, filter(in_target, metadata))):
             if doc:
                 documents.append(doc)
             pbar.update(1)
@@ -166,27 +269,91 @@ def build_index(data_dir, index_dir, max_entries=None, batch_size=None):
                 logger.info(f"Processed {i + 1} documents, memory usage: {psutil.virtual_memory().used / (1024 * 1024):.2f} MB")
     process_time = time.time() - process_start
 
+    dedup_start = time.time()
+    parsed_count = len(documents)
+    if collapse_duplicates:
+        documents = collapse_near_duplicates(documents, link_scores)
+    dedup_time = time.time() - dedup_start
+
     index_start = time.time()
-    writer = ix.writer()
-    for i, doc in enumerate(documents):
-        writer.add_document(**doc)
-        if (i + 1) % batch_size == 0:
-            writer.commit(optimize=False)
-            logger.info(f"Committed batch {i + 1} / {len(documents)}")
-            writer = ix.writer()
-    writer.commit(optimize=True)
+    shard_sizes = None
+    if num_shards is None:
+        content_bytes = write_index(index_dir, documents, link_scores, batch_size)
+        store_dirs = [index_dir]
+        # 单一索引覆盖旧的分片布局
+        if os.path.exists(os.path.join(index_dir, SHARD_MANIFEST)):
+            os.remove(os.path.join(index_dir, SHARD_MANIFEST))
+    else:
+        shards = [[] for _ in range(num_shards)]
+        for doc in documents:
+            shards[shard_for_url(doc['url'], num_shards, shard_strategy)].append(doc)
+        targets = [rebuild_shard] if rebuild_shard is not None else range(num_shards)
+        shard_sizes = {}
+        content_bytes = 0
+        # 各分片写入新一代目录，全部写完后原子替换清单：替换前的查询读旧目录，之后读新目录，
+        # 任何时刻清单引用的目录都完整存在
+        previous = read_manifest(index_dir)
+        shard_dirs = list(previous['shards']) if rebuild_shard is not None else [shard_name(i) for i in range(num_shards)]
+        for shard in targets:
+            shard_dirs[shard] = shard_generation_dir(previous, shard)
+            shard_dir = os.path.join(index_dir, shard_dirs[shard])
+            shutil.rmtree(shard_dir, ignore_errors=True)  # 上次中断留下的未引用目录
+            content_bytes += write_index(shard_dir, shards[shard], link_scores, batch_size)
+            shard_sizes[shard] = len(shards[shard])
+        store_dirs = [os.path.join(index_dir, shard_dirs[shard]) for shard in targets]
+        write_manifest(index_dir, num_shards, shard_strategy, shard_dirs)
+        # 上一代目录可能仍有查询在读，保留到下次重建；更早的目录删除
+        remove_stale_shards(index_dir, set(shard_dirs) | set(previous['shards'] if previous else []))
     index_time = time.time() - index_start
 
+    # 纠错词典基于全部分片的词典生成
+    spelling_start = time.time()
+    spelling_terms = build_spelling_dictionary(list_shards(index_dir) if num_shards else [index_dir],
+                                               os.path.join(index_dir, SPELLING_FILE))
+    spelling_time = time.time() - spelling_start
+
+    # 相关文档近邻表同样覆盖全部分片
+    related_start = time.time()
+    related_docs = build_related_index(list_shards(index_dir) if num_shards else [index_dir],
+                                       os.path.join(index_dir, RELATED_DIR))
+    related_time = time.time() - related_start
+
     total_time = time.time() - start_time
     print(f"\nIndex building completed ({len(documents)} documents indexed)")
     print(f"Time statistics:")
     print(f"- Metadata loading: {load_time:.2f}s")
     print(f"- Document processing: {process_time:.2f}s")
+    print(f"- Link analysis: {link_time:.2f}s")
+    print(f"- Near-duplicate collapsing: {dedup_time:.2f}s ({parsed_count - len(documents)} collapsed)")
     print(f"- Index building: {index_time:.2f}s")
+    print(f"- Spelling dictionary: {spelling_time:.2f}s ({spelling_terms} terms)")
+    print(f"- Related documents: {related_time:.2f}s ({related_docs} documents)")
     print(f"- Total time: {total_time:.2f}s")
     print(f"- Batch size used: {batch_size}")
+    store_bytes = sum(doc_store_size(store_dir) for store_dir in store_dirs)
+    index_bytes = sum(directory_size(store_dir) for store_dir in store_dirs) - store_bytes
+    print(f"- Index size: {index_bytes / (1024 * 1024):.2f} MB (content not stored in Whoosh)")
+    print(f"- Document store: {store_bytes / (1024 * 1024):.2f} MB compressed from {content_bytes / (1024 * 1024):.2f} MB of content")
+    # 内存：每次检索为全部命中读入存储字段，正文不在其中；正文只为显示的结果从文档存储读取，
+    # 解压后的块缓存有上限
+    if documents:
+        fields_bytes = stored_fields_size(store_dirs)
+        content_per_doc = content_bytes / len(documents)
+        print(f"- Stored fields per search ({HITS_PER_SEARCH} hits): {fields_bytes * HITS_PER_SEARCH / 1024:.1f} KB, "
+              f"about {(fields_bytes + content_per_doc) * HITS_PER_SEARCH / 1024:.1f} KB with content stored in Whoosh")
+        print(f"- Document store block cache: at most {CACHED_BLOCKS * BLOCK_SIZE / (1024 * 1024):.1f} MB per store")
+    if shard_sizes is not None:
+        print(f"- Shards ({shard_strategy}): " + ", ".join(f"{shard_name(i)}={n}" for i, n in shard_sizes.items()))
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建倒排索引")
+    parser.add_argument('--shards', type=int, default=None, help='分片数，不指定时构建单一索引')
+    parser.add_argument('--strategy', choices=SHARD_STRATEGIES, default='hash', help='按 URL 哈希或按主机（学院子域名）分片')
+    parser.add_argument('--rebuild-shard', type=int, default=None, help='只重建已有分片索引中的指定分片')
+    parser.add_argument('--no-collapse-duplicates', dest='collapse_duplicates', action='store_false',
+                        help='不按 SimHash 合并近似重复文档（默认合并）')
+    args = parser.parse_args()
     data_dir = "spider_data"
     index_dir = "indexdir"
-    build_index(data_dir, index_dir, max_entries=None)
\ No newline at end of file
+    build_index(data_dir, index_dir, max_entries=None, collapse_duplicates=args.collapse_duplicates,
+                num_shards=args.shards, shard_strategy=args.strategy, rebuild_shard=args.rebuild_shard)
\ No newline at end of file
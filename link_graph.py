@@ -0,0 +1,145 @@
+import math
+import zlib
+import threading
+from urllib.parse import urlparse
+from cachetools import LRUCache
+from whoosh.scoring import BM25F, BaseScorer
+
+# PageRank 参数
+DAMPING = 0.85
+MAX_ITERATIONS = 30
+TOLERANCE = 1e-6
+
+# PageRank 以定点整数存入可排序的数值列（按文档总数缩放，平均值为 PAGERANK_SCALE）
+PAGERANK_SCALE = 1000
+
+# 静态质量分在最终得分中的权重
+QUALITY_WEIGHT = 0.2
+
+def get_host(url):
+    """提取 URL 的主机名（小写）"""
+    return urlparse(url).netloc.lower()
+
+def get_host_id(url):
+    """主机名的稳定数值标识，跨次构建保持不变"""
+    return zlib.crc32(get_host(url).encode('utf-8')) & 0x7fffffff
+
+def compute_link_scores(metadata):
+    """根据爬虫记录的出链计算每个 URL 的 PageRank、入度和主机标识
+
+    PageRank 按文档总数缩放（平均值为 1.0）后乘以 PAGERANK_SCALE 取整；
+    只统计指向已爬取 URL 的链接。metadata 需可重复遍历（列表或 MetadataSource），
+    第一遍收集 URL，第二遍只读取出链。
+    """
+    urls = [entry['url'] for entry in metadata]
+    index = {url: i for i, url in enumerate(urls)}
+    n = len(urls)
+    if n == 0:
+        return {}
+
+    # 构建去重后的邻接表
+    outgoing = [[] for _ in range(n)]
+    indegree = [0] * n
+    for entry in metadata:
+        src = index[entry['url']]
+        targets = {index[link] for link in entry.get('outlinks') or [] if link in index}
+        targets.discard(src)
+        outgoing[src] = list(targets)
+        for dst in targets:
+            indegree[dst] += 1
+
+    # 幂迭代，悬挂节点的权重均匀分配
+    rank = [1.0 / n] * n
+    for _ in range(MAX_ITERATIONS):
+        dangling = sum(rank[i] for i in range(n) if not outgoing[i])
+        base = (1.0 - DAMPING) / n + DAMPING * dangling / n
+        new_rank = [base] * n
+        for src, targets in enumerate(outgoing):
+            if targets:
+                share = DAMPING * rank[src] / len(targets)
+                for dst in targets:
+                    new_rank[dst] += share
+        delta = sum(abs(a - b) for a, b in zip(new_rank, rank))
+        rank = new_rank
+        if delta < TOLERANCE:
+            break
+
+    return {
+        url: {
+            "pagerank": int(round(rank[i] * n * PAGERANK_SCALE)),
+            "indegree": indegree[i],
+            "host_id": get_host_id(url)
+        }
+        for url, i in index.items()
+    }
+
+# 各段 PageRank 列的最大值，按段标识缓存（段写入后不再改变），用于计算得分上界；
+# 重建和合并会产生新段，缓存有上限，已不存在的段随 LRU 淘汰
+MAX_CACHED_SEGMENTS = 256
+_segment_max_pagerank = LRUCache(maxsize=MAX_CACHED_SEGMENTS)
+_segment_max_pagerank_lock = threading.Lock()
+
+def max_pagerank(reader):
+    """读取器中 PageRank 列的最大值（含已删除文档，仍是有效上界）"""
+    if not reader.is_atomic():
+        return max((max_pagerank(leaf) for leaf, _ in reader.leaf_readers()), default=PAGERANK_SCALE)
+    segment = reader.segment()
+    key = segment.segment_id() if segment is not None else None
+    if key is not None:
+        with _segment_max_pagerank_lock:
+            value = _segment_max_pagerank.get(key)
+        if value is not None:
+            return value
+    value = max(reader.column_reader("pagerank"), default=PAGERANK_SCALE)
+    if key is not None:
+        with _segment_max_pagerank_lock:
+            _segment_max_pagerank[key] = value
+    return value
+
+class QualityScorer(BaseScorer):
+    """把文档的静态质量系数乘到词项得分上
+
+    上界按段内最大质量系数放大，仍然是有效上界，收集阶段的块质量跳过优化保持可用。
+    """
+    def __init__(self, scorer, pagerank, quality_weight, max_pagerank):
+        self.scorer = scorer
+        self.pagerank = pagerank
+        self.quality_weight = quality_weight
+        self.max_boost = self.boost(max_pagerank)
+
+    def boost(self, pagerank):
+        return 1.0 + self.quality_weight * math.log1p(pagerank / PAGERANK_SCALE)
+
+    def supports_block_quality(self):
+        return self.scorer.supports_block_quality()
+
+    def score(self, matcher):
+        return self.scorer.score(matcher) * self.boost(self.pagerank[matcher.id()])
+
+    def max_quality(self):
+        return self.scorer.max_quality() * self.max_boost
+
+    def block_quality(self, matcher):
+        return self.scorer.block_quality(matcher) * self.max_boost
+
+class QualityBM25F(BM25F):
+    """在 BM25F 得分上叠加索引时计算的静态质量分（PageRank）
+
+    质量系数在词项打分器中按文档相乘（多词查询的各词得分同乘一个系数，与对总分相乘等价），
+    不使用 final() 钩子，因此不会关闭 top-k 收集的块质量跳过。
+    """
+    def __init__(self, quality_weight=QUALITY_WEIGHT, **kwargs):
+        super().__init__(**kwargs)
+        self.quality_weight = quality_weight
+
+    def base_scorer(self, searcher, fieldname, text, qf=1):
+        return BM25F.scorer(self, searcher, fieldname, text, qf=qf)
+
+    def scorer(self, searcher, fieldname, text, qf=1):
+        # searcher 为段级 searcher，列读取器和文档号都是段内的；旧索引没有该列时不做调整
+        scorer = self.base_scorer(searcher, fieldname, text, qf=qf)
+        reader = searcher.reader()
+        if not self.quality_weight or not reader.has_column("pagerank"):
+            return scorer
+        pagerank = reader.column_reader("pagerank")
+        return QualityScorer(scorer, pagerank, self.quality_weight, max_pagerank(reader))
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import logging
+import threading
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = 'metadata.jsonl'
+LEGACY_METADATA_FILE = 'metadata.json'
+
+# fsync 间隔：满足任一条件即落盘
+FSYNC_EVERY_ENTRIES = 200
+FSYNC_EVERY_SECONDS = 5.0
+
+class MetadataJournal:
+    """只追加的 JSONL 元数据日志，每条记录写一行并定期 fsync，崩溃时最多丢失最近几条（线程安全）"""
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, JOURNAL_FILE)
+        os.makedirs(data_dir, exist_ok=True)
+        legacy_path = os.path.join(data_dir, LEGACY_METADATA_FILE)
+        migrate = not os.path.exists(self.path) and os.path.exists(legacy_path)
+        if not migrate and os.path.exists(self.path):
+            # 续爬时先截掉上次崩溃写了一半的末行，否则新记录会接在残行后面一起损坏
+            truncate_torn_line(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._pending = 0
+        self._last_sync = time.time()
+        self._lock = threading.Lock()
+        if migrate:
+            # 首次使用日志时导入旧版 metadata.json
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._sync()
+            logger.info(f"Migrated {legacy_path} into {self.path}")
+
+    def append(self, entry, flush=True):
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            if flush:
+                self._file.flush()
+            self._pending += 1
+            if self._pending >= FSYNC_EVERY_ENTRIES or time.time() - self._last_sync >= FSYNC_EVERY_SECONDS:
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.time()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+def truncate_torn_line(path, chunk_size=4096):
+    """把文件截断到最后一个换行符之后，返回截掉的字节数"""
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b'\n')
+            if newline >= 0:
+                pos = start + newline + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+            logger.warning(f"Truncated {end - pos} bytes of a torn last line in {path}")
+        return end - pos
+
+def _iter_journal_lines(journal_path, warn=True):
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 崩溃时写了一半的末行
+                if warn:
+                    logger.warning(f"Skipping malformed journal line {line_no} in {journal_path}")
+                continue
+            yield line_no, entry
+
+def iter_metadata(data_dir):
+    """流式读取元数据日志，没有日志时回退到旧版 metadata.json 数组
+
+    增量重爬会为同一 URL 追加新条目：第一遍只记录每个 URL 最后出现的行号，
+    第二遍按行输出，每个 URL 只保留最新的一条。
+    """
+    journal_path = os.path.join(data_dir, JOURNAL_FILE)
+    if not os.path.exists(journal_path):
+        legacy_path = os.path.join(data_dir, LEGACY_METADATA_FILE)
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                yield from json.load(f)
+        return
+
+    last_line = {entry['url']: line_no for line_no, entry in _iter_journal_lines(journal_path)}
+    for line_no, entry in _iter_journal_lines(journal_path, warn=False):
+        if last_line.get(entry['url']) == line_no:
+            yield entry
+
+class MetadataSource:
+    """可重复遍历的元数据：每次迭代重新流式读取日志，不在内存中保留全部条目"""
+    def __init__(self, data_dir, max_entries=None):
+        self.data_dir = data_dir
+        self.max_entries = max_entries
+
+    def __iter__(self):
+        return islice(iter_metadata(self.data_dir), self.max_entries)
@@ -1,26 +1,22 @@
-import json
 import math
+import time
+import threading
 from collections import Counter
 from datetime import datetime, timedelta
+from query_normalization import canonical_query
+from query_log import query_log
 
 def analyze_user_interests(username):
     """分析用户兴趣特征"""
     try:
-        with open('query_logs.json', 'r', encoding='utf-8') as f:
-            logs = json.load(f)
-        
-        # 获取用户最近30天的搜索记录
+        # 获取用户最近30天的搜索记录（只读取最近30天的日志分区）
         recent_date = datetime.now() - timedelta(days=30)
-        user_logs = [
-            log for log in logs 
-            if log['username'] == username and 
-            datetime.fromisoformat(log['timestamp']) > recent_date
-        ]
+        user_logs = list(query_log.iter_entries(since=recent_date, username=username))
         
         # 提取关键词并计算权重
         keywords = Counter()
         for log in user_logs:
-            query_terms = log['query'].split()
+            query_terms = canonical_query(log['query']).split()
             # 为最近的查询赋予更高权重
             time_weight = 1 + (datetime.fromisoformat(log['timestamp']) - recent_date).days / 30.0
             for term in query_terms:
@@ -48,20 +44,102 @@ def calculate_content_similarity(query_terms, doc_terms):
         return 0.0
     return float(numerator) / denominator
 
-def get_collaborative_recommendations(username, query):
+# 预计算的用户查询集合的最长使用时间（秒），超过后从日志重建以反映压缩和保留期限
+COLLABORATIVE_REBUILD_INTERVAL = 3600
+# 重建期间有历史被删除时重新读取日志的次数上限
+COLLABORATIVE_REBUILD_ATTEMPTS = 3
+
+class CollaborativeIndex:
+    """各用户的规范化查询集合，首次使用时从日志构建，之后随新查询增量更新
+
+    读取方拿到的是不可变快照：更新时复制字典并替换，不影响正在遍历的请求。
+    重建在锁外读取日志，add/invalidate 递增版本号：读取期间的新查询在保存前补上，
+    读取期间有删除时丢弃结果重新读取。
+    """
+    def __init__(self, rebuild_interval=COLLABORATIVE_REBUILD_INTERVAL):
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._queries_by_user = None
+        self._built_at = 0.0
+        self._version = 0
+        self._invalidated_version = 0
+        self._rebuilding = 0
+        self._pending = []  # 重建期间的新查询 [(版本号, 用户, 规范化查询)]
+
+    def queries_by_user(self):
+        for _ in range(COLLABORATIVE_REBUILD_ATTEMPTS):
+            with self._lock:
+                if self._queries_by_user is not None and time.time() - self._built_at <= self.rebuild_interval:
+                    return self._queries_by_user
+                version = self._version
+                self._rebuilding += 1
+            try:
+                queries_by_user = {}
+                for user, logged_query in query_log.query_counts():
+                    queries_by_user.setdefault(user, set()).add(canonical_query(logged_query))
+                with self._lock:
+                    if self._invalidated_version > version:
+                        continue  # 读取期间删除了历史，读到的日志可能已过时
+                    for added_version, user, query in self._pending:
+                        if added_version > version:
+                            queries_by_user.setdefault(user, set()).add(query)
+                    queries_by_user = {user: frozenset(queries) for user, queries in queries_by_user.items()}
+                    self._queries_by_user = queries_by_user
+                    self._built_at = time.time()
+                    return queries_by_user
+            finally:
+                with self._lock:
+                    self._rebuilding -= 1
+                    if not self._rebuilding:
+                        self._pending.clear()
+        # 删除持续发生，返回最后一次读取的结果但不保存，下次使用时再重建
+        return {user: frozenset(queries) for user, queries in queries_by_user.items()}
+
+    def add(self, username, query):
+        """记录一条新查询（log_query 写入日志后调用）"""
+        query = canonical_query(query)
+        with self._lock:
+            self._version += 1
+            if self._rebuilding:
+                self._pending.append((self._version, username, query))
+            if self._queries_by_user is None or query in self._queries_by_user.get(username, ()):
+                return
+            queries_by_user = dict(self._queries_by_user)
+            queries_by_user[username] = queries_by_user.get(username, frozenset()) | {query}
+            self._queries_by_user = queries_by_user
+
+    def invalidate(self):
+        """删除查询历史后调用，下次使用时重建"""
+        with self._lock:
+            self._version += 1
+            self._invalidated_version = self._version
+            self._queries_by_user = None
+
+collaborative_index = CollaborativeIndex()
+
+def get_queries_by_user():
+    """每个用户的规范化查询集合（已压缩的聚合计数加近期分区），使用预计算的 collaborative_index"""
+    return collaborative_index.queries_by_user()
+
+def load_personalization_context(username):
+    """读取一次日志，得到用户兴趣和各用户的查询集合，供同一请求中的多次个性化共用"""
+    return {
+        'interests': analyze_user_interests(username),
+        'queries_by_user': get_queries_by_user()
+    }
+
+def get_collaborative_recommendations(username, query, queries_by_user=None):
     """基于协同过滤的推荐"""
     try:
-        with open('query_logs.json', 'r', encoding='utf-8') as f:
-            logs = json.load(f)
-        
+        if queries_by_user is None:
+            queries_by_user = get_queries_by_user()
+
         # 找到相似用户
-        user_queries = set(log['query'] for log in logs if log['username'] == username)
+        user_queries = queries_by_user.get(username, set())
         user_similarities = {}
         
-        for log in logs:
-            other_user = log['username']
+        for other_user, other_queries in queries_by_user.items():
             if other_user != username:
-                other_queries = set(l['query'] for l in logs if l['username'] == other_user)
                 # 计算用户相似度
                 similarity = len(user_queries & other_queries) / len(user_queries | other_queries) if user_queries or other_queries else 0
                 user_similarities[other_user] = similarity
@@ -69,11 +147,10 @@ def get_collaborative_recommendations(username, query):
         # 获取相似用户的相关查询
         similar_queries = []
         for other_user, similarity in sorted(user_similarities.items(), key=lambda x: x[1], reverse=True)[:5]:
-            other_user_logs = [log['query'] for log in logs if log['username'] == other_user]
-            similar_queries.extend(other_user_logs)
+            similar_queries.extend(queries_by_user[other_user])
         
         # 根据与当前查询的相关性排序
-        query_terms = set(query.lower().split())
+        query_terms = set(canonical_query(query).split())
         recommendations = []
         for similar_query in set(similar_queries):
             similar_terms = set(similar_query.lower().split())
@@ -86,22 +163,24 @@ def get_collaborative_recommendations(username, query):
         print(f"获取协同推荐时出错: {e}")
         return []
 
-def adjust_search_results(results, username, query):
-    """优化后的搜索结果排序调整"""
+def adjust_search_results(results, username, query, context=None):
+    """优化后的搜索结果排序调整，context 为 load_personalization_context 的结果（可选）"""
     try:
+        if context is None:
+            context = load_personalization_context(username)
         # 获取用户兴趣权重(带时间衰减)
-        user_interests = analyze_user_interests(username)
-        query_terms = query.lower().split()
+        user_interests = context['interests']
+        query_terms = canonical_query(query).split()
         
         # 获取协同过滤推荐(去重)
-        collaborative_recs = set(get_collaborative_recommendations(username, query))
-        
+        collaborative_recs = set(get_collaborative_recommendations(username, query, context['queries_by_user']))
+
         for result in results:
             # 基础分数
             base_score = result['score']
             
-            # 提取内容关键词
-            content_terms = (result['title'] + ' ' + result['content_highlight']).lower().split()
+            # 提取内容关键词（标题和正文高亮片段，search_events 在个性化前生成高亮）
+            content_terms = (result['title'] + ' ' + result.get('content_highlight', '')).lower().split()
             
             # 1. 计算个性化兴趣匹配度(带时间衰减)
             interest_score = sum(
@@ -119,18 +198,15 @@ def adjust_search_results(results, username, query):
                 for rec_query in collaborative_recs
             ) else 1.0
             
-            # 4. 多样性控制(避免同一来源内容过于集中)
-            source_penalty = 1.0 - (0.1 * min(
-                sum(1 for r in results if r['url'].startswith(result['url'].split('/')[2])),
-                3
-            ))
+            # 4. 多样性控制：原实现用完整 URL 匹配主机名前缀，从未命中，惩罚系数恒为 1.0；
+            # 保持该排序行为，不对同一来源的结果降权
             
             # 综合评分公式
             result['score'] = base_score * (
                 1 
                 + 0.25 * interest_score  # 个性化权重降低
                 + 0.3 * similarity_score  # 语义相似度权重提高
-            ) * collaborative_boost * source_penalty
+            ) * collaborative_boost
         
         # 重新排序并限制结果数量
         results.sort(key=lambda x: x['score'], reverse=True)
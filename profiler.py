@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import random
+import threading
+from collections import Counter
+
+# 按需启用的采样分析器：被选中的请求执行期间，后台线程按固定间隔读取该线程的调用栈；
+# 没有被分析的请求时不存在采样线程，也不安装 sys.setprofile 钩子，关闭时没有额外开销
+SAMPLE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 64
+MAX_STACKS = 20000
+
+def frame_name(code):
+    """帧名：最后两级路径加函数名，如 whoosh/searching.py:search"""
+    path = code.co_filename.replace('\\', '/').split('/')
+    return f"{'/'.join(path[-2:])}:{code.co_name}"
+
+class SamplingProfiler:
+    def __init__(self, sample_rate=0.0, interval=SAMPLE_INTERVAL):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._lock = threading.Lock()
+        # 线程号 -> (标签, run 的帧)，采样时记录到该帧为止
+        self._active = {}
+        self._thread = None
+        self._stacks = Counter()
+        self.requests = 0
+        self.samples = 0
+        self.dropped = 0
+
+    def should_profile(self, forced=False):
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def configure(self, sample_rate=None, interval=None):
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if interval is not None:
+            self.interval = max(float(interval), 0.001)
+
+    def run(self, label, func, *args, **kwargs):
+        """在采样下执行 func，记录的调用栈以 label 为根，从 func 开始"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = (label, sys._getframe())
+            self.requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active.pop(thread_id, None)
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = dict(self._active)
+            frames = sys._current_frames()
+            for thread_id, (label, root) in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._record(label, frame, root)
+            del frames
+            time.sleep(self.interval)
+
+    def _record(self, label, frame, root):
+        names = []
+        while frame is not None and frame is not root and len(names) < MAX_STACK_DEPTH:
+            names.append(frame_name(frame.f_code))
+            frame = frame.f_back
+        if frame is None:
+            return  # 采样时请求已经结束，栈中没有 run 的帧
+        names.append(label)
+        stack = ';'.join(reversed(names))
+        with self._lock:
+            self.samples += 1
+            if stack in self._stacks or len(self._stacks) < MAX_STACKS:
+                self._stacks[stack] += 1
+            else:
+                self.dropped += 1
+
+    def collapsed(self):
+        """折叠栈格式（每行“帧;帧;... 次数”），可直接交给 flamegraph.pl 或 speedscope"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def top_functions(self, n=20):
+        """按自身采样数排序的热点函数，total 为出现在栈中（含子调用）的采样数"""
+        with self._lock:
+            stacks = list(self._stacks.items())
+            samples = self.samples or 1
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in stacks:
+            names = stack.split(';')[1:]
+            if not names:
+                continue
+            self_counts[names[-1]] += count
+            for name in set(names):
+                total_counts[name] += count
+        return [{
+            'function': name,
+            'self': count,
+            'total': total_counts[name],
+            'self_percent': round(100.0 * count / samples, 2),
+            'total_percent': round(100.0 * total_counts[name] / samples, 2)
+        } for name, count in self_counts.most_common(n)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'interval': self.interval,
+                'requests': self.requests,
+                'samples': self.samples,
+                'stacks': len(self._stacks),
+                'dropped_samples': self.dropped,
+                'active': len(self._active)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.requests = self.samples = self.dropped = 0
+
+# 采样比例可通过环境变量 PROFILE_SAMPLE_RATE 设置初值，运行时由管理接口调整
+profiler = SamplingProfiler(sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0) or 0))
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import logging
+import threading
+import datetime
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+LOG_DIR = 'query_logs'
+LEGACY_LOG_FILE = 'query_logs.json'
+AGGREGATES_FILE = 'aggregates.json'
+DELETIONS_FILE = 'deletions.jsonl'
+PARTITION_FORMAT = '%Y-%m-%d'
+PARTITION_SUFFIX = '.jsonl'
+
+# 超过 COMPACT_AFTER_DAYS 天的日分区压缩为按 (用户, 查询) 的聚合计数；
+# 最后一次出现早于 RETENTION_DAYS 天的记录被删除（None 表示永久保留）
+COMPACT_AFTER_DAYS = 30
+RETENTION_DAYS = 365
+COMPACTION_INTERVAL = 3600
+
+def _parse_time(timestamp):
+    return datetime.datetime.fromisoformat(timestamp)
+
+def _read_jsonl(path):
+    # 不存在的文件视为空：压缩可能在读者列出分区之后删除它
+    try:
+        f = open(path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # 并发写入或崩溃时未写完的末行
+                logger.warning(f"Skipping malformed line in {path}")
+
+class QueryLog:
+    """按天分区的只追加查询日志
+
+    - query_logs/YYYY-MM-DD.jsonl：当天的原始查询记录
+    - query_logs/aggregates.json：已压缩分区的 (用户, 查询) 计数和最后时间
+    - query_logs/deletions.jsonl：删除记录（墓碑），隐藏时间不晚于它的匹配条目，
+      压缩时物理删除，因此删除历史不需要重写日志
+    """
+    def __init__(self, log_dir=LOG_DIR, legacy_file=LEGACY_LOG_FILE):
+        self.log_dir = log_dir
+        self.legacy_file = legacy_file
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _path(self, name):
+        return os.path.join(self.log_dir, name)
+
+    def _ensure_ready(self):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            if not os.path.isdir(self.log_dir):
+                os.makedirs(self.log_dir + '.tmp', exist_ok=True)
+                if os.path.exists(self.legacy_file):
+                    # 首次使用时把旧版 query_logs.json 拆分到日分区
+                    with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                        logs = json.load(f)
+                    partitions = {}
+                    for log in logs:
+                        day = _parse_time(log['timestamp']).strftime(PARTITION_FORMAT)
+                        partitions.setdefault(day, []).append(log)
+                    for day, entries in partitions.items():
+                        with open(os.path.join(self.log_dir + '.tmp', day + PARTITION_SUFFIX), 'w', encoding='utf-8') as f:
+                            f.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+                    logger.info(f"Migrated {len(logs)} entries from {self.legacy_file} into {self.log_dir}/")
+                os.replace(self.log_dir + '.tmp', self.log_dir)
+            self._ready = True
+
+    def _append_line(self, name, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self._path(name), 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def append(self, entry):
+        self._ensure_ready()
+        day = _parse_time(entry['timestamp']).strftime(PARTITION_FORMAT)
+        self._append_line(day + PARTITION_SUFFIX, entry)
+
+    def delete(self, username, query=None):
+        """删除用户的某条查询（query 为 None 时删除全部）的历史记录"""
+        self._ensure_ready()
+        self._append_line(DELETIONS_FILE, {
+            'username': username,
+            'query': query,
+            'timestamp': datetime.datetime.now().isoformat()
+        })
+
+    def _load_aggregates(self):
+        path = self._path(AGGREGATES_FILE)
+        if not os.path.exists(path):
+            return {'compacted_through': None, 'deletions_applied_through': None, 'counts': {}}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _partitions(self, since=None, compacted_through=None):
+        """返回 (日期, 路径) 列表，只包含 since 当天及之后、尚未压缩的分区"""
+        since_day = since.strftime(PARTITION_FORMAT) if since else None
+        partitions = []
+        for name in sorted(os.listdir(self.log_dir)):
+            if not name.endswith(PARTITION_SUFFIX) or name == DELETIONS_FILE:
+                continue
+            day = name[:-len(PARTITION_SUFFIX)]
+            if (since_day and day < since_day) or (compacted_through and day <= compacted_through):
+                continue
+            partitions.append((day, self._path(name)))
+        return partitions
+
+    @staticmethod
+    def _is_deleted(entry, deletions):
+        return any(
+            d['username'] == entry['username'] and (d['query'] is None or d['query'] == entry['query'])
+            and entry['timestamp'] <= d['timestamp']
+            for d in deletions
+        )
+
+    def iter_entries(self, since=None, username=None, aggregates=None):
+        """按时间顺序输出未压缩的原始条目，只读取 since 之后的分区"""
+        self._ensure_ready()
+        aggregates = aggregates or self._load_aggregates()
+        deletions = [d for d in _read_jsonl(self._path(DELETIONS_FILE)) if username is None or d['username'] == username]
+        since_ts = since.isoformat() if since else None
+        for _, path in self._partitions(since, aggregates['compacted_through']):
+            for entry in _read_jsonl(path):
+                if username is not None and entry.get('username') != username:
+                    continue
+                if since_ts and entry['timestamp'] < since_ts:
+                    continue
+                if deletions and self._is_deleted(entry, deletions):
+                    continue
+                yield entry
+
+    def iter_aggregates(self, username=None, aggregates=None):
+        """输出已压缩的聚合条目：{'username', 'query', 'count', 'timestamp'(最后一次)}"""
+        self._ensure_ready()
+        aggregates = aggregates or self._load_aggregates()
+        applied = aggregates['deletions_applied_through']
+        deletions = [d for d in _read_jsonl(self._path(DELETIONS_FILE))
+                     if (applied is None or d['timestamp'] > applied) and (username is None or d['username'] == username)]
+        users = [username] if username is not None else list(aggregates['counts'])
+        for user in users:
+            for query, row in aggregates['counts'].get(user, {}).items():
+                entry = {'username': user, 'query': query, 'count': row['count'], 'timestamp': row['last']}
+                if deletions and self._is_deleted(entry, deletions):
+                    continue
+                yield entry
+
+    def history(self, username=None):
+        """同一份聚合状态下的 (聚合条目列表, 未压缩条目列表)
+
+        读取期间发生压缩时（分区已并入新的聚合并被删除，或删除记录已应用）重新读取，
+        不会漏计或重复计数。
+        """
+        self._ensure_ready()
+        while True:
+            aggregates = self._load_aggregates()
+            result = (list(self.iter_aggregates(username, aggregates)),
+                      list(self.iter_entries(username=username, aggregates=aggregates)))
+            current = self._load_aggregates()
+            if (current['compacted_through'], current['deletions_applied_through']) == \
+                    (aggregates['compacted_through'], aggregates['deletions_applied_through']):
+                return result
+
+    def query_counts(self, username=None):
+        """(用户, 查询) -> 全部历史中的查询次数（聚合计数加近期分区）"""
+        counts = Counter()
+        aggregated, recent = self.history(username)
+        for entry in aggregated:
+            counts[(entry['username'], entry['query'])] += entry['count']
+        for entry in recent:
+            counts[(entry['username'], entry['query'])] += 1
+        return counts
+
+    def compact(self, now=None):
+        """把 COMPACT_AFTER_DAYS 天前的分区并入聚合计数，应用删除记录并执行保留期限"""
+        self._ensure_ready()
+        now = now or datetime.datetime.now()
+        horizon = (now - datetime.timedelta(days=COMPACT_AFTER_DAYS)).strftime(PARTITION_FORMAT)
+        with self._lock:
+            aggregates = self._load_aggregates()
+            deletions = list(_read_jsonl(self._path(DELETIONS_FILE)))
+            counts = aggregates['counts']
+
+            # 1. 新的删除记录作用于已有聚合（聚合中的条目都早于删除时间之前的压缩）
+            applied = aggregates['deletions_applied_through']
+            for d in deletions:
+                if applied is not None and d['timestamp'] <= applied:
+                    continue
+                user_counts = counts.get(d['username'], {})
+                for query in [q for q, row in user_counts.items()
+                              if (d['query'] is None or d['query'] == q) and row['last'] <= d['timestamp']]:
+                    del user_counts[query]
+            if deletions:
+                aggregates['deletions_applied_through'] = max(d['timestamp'] for d in deletions)
+
+            # 2. 旧分区并入聚合
+            compacted = [(day, path) for day, path in self._partitions(compacted_through=aggregates['compacted_through'])
+                         if day < horizon]
+            for day, path in compacted:
+                for entry in _read_jsonl(path):
+                    if self._is_deleted(entry, deletions):
+                        continue
+                    row = counts.setdefault(entry['username'], {}).setdefault(entry['query'], {'count': 0, 'last': entry['timestamp']})
+                    row['count'] += 1
+                    row['last'] = max(row['last'], entry['timestamp'])
+            if compacted:
+                aggregates['compacted_through'] = compacted[-1][0]
+
+            # 3. 保留期限
+            if RETENTION_DAYS is not None:
+                cutoff = (now - datetime.timedelta(days=RETENTION_DAYS)).isoformat()
+                for user in list(counts):
+                    counts[user] = {q: row for q, row in counts[user].items() if row['last'] >= cutoff}
+            for user in [user for user, queries in counts.items() if not queries]:
+                del counts[user]
+
+            tmp_path = self._path(AGGREGATES_FILE + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(aggregates, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(AGGREGATES_FILE))
+            # 聚合落盘后再删除分区；中途崩溃时 compacted_through 保证不会重复计数
+            for _, path in compacted:
+                os.remove(path)
+
+            # 4. 只保留仍可能作用于未压缩分区的删除记录
+            remaining = self._partitions(compacted_through=aggregates['compacted_through'])
+            oldest = remaining[0][0] if remaining else None
+            kept = [d for d in deletions if oldest is not None and d['timestamp'][:10] >= oldest]
+            if len(kept) != len(deletions):
+                tmp_path = self._path(DELETIONS_FILE + '.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(json.dumps(d, ensure_ascii=False) + '\n' for d in kept)
+                os.replace(tmp_path, self._path(DELETIONS_FILE))
+        logger.info(f"Compacted {len(compacted)} query log partitions")
+        return len(compacted)
+
+    def compaction_loop(self, interval=COMPACTION_INTERVAL):
+        while True:
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Query log compaction failed: {e}", exc_info=True)
+            time.sleep(interval)
+
+    def start_compaction(self, interval=COMPACTION_INTERVAL):
+        thread = threading.Thread(target=self.compaction_loop, args=(interval,), name="query-log-compaction", daemon=True)
+        thread.start()
+        return thread
+
+# 服务端和个性化模块共用的默认日志（相对于工作目录）
+query_log = QueryLog()
@@ -0,0 +1,40 @@
+import re
+import unicodedata
+from functools import lru_cache
+import jieba
+
+_SPACE_RE = re.compile(r'\s+')
+# 查询语法：通配符、引号、字段、分组、加减号、权重
+_SYNTAX_RE = re.compile(r'[*?"\':()\[\]{}^~+\-]')
+# Whoosh 的布尔运算符区分大小写，出现时不做小写和重排
+_OPERATOR_RE = re.compile(r'(?:^|\s)(?:AND|OR|NOT|ANDNOT|ANDMAYBE)(?:\s|$)')
+# 两个中文字符之间的空白（如“南开 大学”），合并后交给分词
+_CJK_SPACE_RE = re.compile(r'(?<=[一-鿿])\s+(?=[一-鿿])')
+
+def normalize_query(query_str):
+    """NFKC（全角转半角）、合并空白、小写"""
+    query_str = unicodedata.normalize('NFKC', query_str or '')
+    query_str = _SPACE_RE.sub(' ', query_str).strip()
+    if _OPERATOR_RE.search(query_str):
+        return query_str
+    return query_str.lower()
+
+def is_plain_query(query_str):
+    """不含通配符、引号、字段等查询语法和布尔运算符的关键词查询"""
+    return not _SYNTAX_RE.search(query_str) and not _OPERATOR_RE.search(query_str)
+
+@lru_cache(maxsize=10000)
+def canonical_query(query_str, is_phrase=False):
+    """查询的规范形式，只用作缓存键、预热合并和个性化统计的键
+
+    普通关键词查询按 jieba 分词后去重并排序（AND 语义下与顺序无关），
+    中文字符间的空白先合并，使“南开 大学”与“南开大学”得到相同的分词；
+    短语查询和含查询语法的查询只做 normalize_query。实际执行、写入查询日志、
+    显示和高亮的是 normalize_query 的结果，保持用户输入的词序，搜索建议才能按前缀匹配。
+    """
+    query_str = normalize_query(query_str)
+    if is_phrase or not query_str or not is_plain_query(query_str):
+        return query_str
+    terms = {term.strip() for term in jieba.lcut(_CJK_SPACE_RE.sub('', query_str))}
+    terms.discard('')
+    return ' '.join(sorted(terms))
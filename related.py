@@ -0,0 +1,186 @@
+import os
+import json
+import math
+import shutil
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import svds
+from whoosh.index import open_dir
+
+# “相关文档”索引：正文 TF-IDF -> LSA 降维 -> 随机超平面 LSH 取候选 -> 余弦相似度 top-k，
+# 构建时预计算每篇文档的近邻列表，服务端 mmap 加载后按 URL 常数时间查询
+RELATED_DIR = 'related'
+DOCS_FILE = 'docs.json'
+NEIGHBORS_FILE = 'neighbors.npy'
+SCORES_FILE = 'scores.npy'
+RELATED_FIELD = 'content'
+TOP_K = 10
+LSA_DIMENSIONS = 128
+LSH_TABLES = 8
+LSH_BUCKET_SIZE = 32  # 每个桶的目标平均文档数，决定每张表的位数
+MIN_DOCUMENT_FREQUENCY = 2
+MAX_DOCUMENT_RATIO = 0.5  # 出现在一半以上文档中的词不参与相似度
+MIN_SIMILARITY = 0.1
+RANDOM_SEED = 20250101
+
+def collect_term_matrix(index_dirs):
+    """从各索引的正文倒排表构建文档-词频稀疏矩阵，返回 (矩阵, [(url, 标题)])
+
+    直接读取索引中已分词、去停用词的词项，不再重新分析正文；先按词典中的文档频率
+    排除过稀和过于常见的词，只读取其余词的倒排表。
+    """
+    readers = [open_dir(index_dir).reader() for index_dir in index_dirs]
+    try:
+        num_docs = sum(reader.doc_count() for reader in readers)
+        doc_frequency = {}
+        for reader in readers:
+            for text, terminfo in reader.iter_field(RELATED_FIELD):
+                doc_frequency[text] = doc_frequency.get(text, 0) + terminfo.doc_frequency()
+        vocabulary = {}
+        for text, df in doc_frequency.items():
+            if MIN_DOCUMENT_FREQUENCY <= df <= MAX_DOCUMENT_RATIO * num_docs:
+                vocabulary[text] = len(vocabulary)
+
+        docs = []
+        rows, cols, freqs = [], [], []
+        for reader in readers:
+            row_of = {}
+            for docnum, fields in reader.iter_docs():
+                row_of[docnum] = len(docs)
+                docs.append((fields.get('url', ''), fields.get('title', '')))
+            for text in reader.lexicon(RELATED_FIELD):
+                col = vocabulary.get(text)
+                if col is None:
+                    continue
+                matcher = reader.postings(RELATED_FIELD, text)
+                while matcher.is_active():
+                    # 已删除的文档不在 row_of 中
+                    row = row_of.get(matcher.id())
+                    if row is not None:
+                        rows.append(row)
+                        cols.append(col)
+                        freqs.append(matcher.weight())
+                    matcher.next()
+    finally:
+        for reader in readers:
+            reader.close()
+    matrix = sparse.csr_matrix((np.asarray(freqs, dtype=np.float32), (rows, cols)),
+                               shape=(len(docs), len(vocabulary)), dtype=np.float32)
+    return matrix, docs
+
+def tfidf(matrix):
+    """对数词频 × IDF，按行 L2 归一化"""
+    num_docs = matrix.shape[0]
+    df = np.maximum(np.bincount(matrix.indices, minlength=matrix.shape[1]), 1)
+    matrix = matrix.copy()
+    matrix.data = 1.0 + np.log(matrix.data)
+    matrix = matrix @ sparse.diags(np.log(num_docs / df).astype(np.float32) + 1.0)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+def lsa(matrix, dimensions=LSA_DIMENSIONS):
+    """截断 SVD 降维，返回按行归一化的稠密文档向量（零向量表示文档没有可用词项）"""
+    k = min(dimensions, min(matrix.shape) - 1)
+    if k < 1:
+        return np.zeros((matrix.shape[0], 0), dtype=np.float32)
+    u, s, _ = svds(matrix.astype(np.float64), k=k, random_state=RANDOM_SEED)
+    vectors = (u * s).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    return vectors / norms[:, None]
+
+def lsh_tables(vectors, tables=LSH_TABLES):
+    """随机超平面 LSH：每张表把符号位相同的文档分到一个桶
+
+    返回每张表的 (按签名排序的行号, 各桶起点, 各桶终点, 每篇文档所在桶号)。
+    """
+    num_docs, dimensions = vectors.shape
+    bits = int(min(24, max(1, round(math.log2(max(num_docs / LSH_BUCKET_SIZE, 2))))))
+    rng = np.random.default_rng(RANDOM_SEED)
+    weights = (1 << np.arange(bits, dtype=np.int64))
+    result = []
+    for _ in range(tables):
+        planes = rng.standard_normal((dimensions, bits)).astype(np.float32)
+        signatures = ((vectors @ planes) > 0).astype(np.int64) @ weights
+        order = np.argsort(signatures, kind='stable')
+        _, starts, sizes = np.unique(signatures[order], return_index=True, return_counts=True)
+        bucket_of = np.empty(num_docs, dtype=np.int64)
+        bucket_of[order] = np.repeat(np.arange(len(starts)), sizes)
+        result.append((order, starts, starts + sizes, bucket_of))
+    return result
+
+def nearest_neighbors(vectors, k=TOP_K):
+    """对每篇文档在 LSH 候选中按余弦相似度取 top-k，返回 (行号数组, 相似度数组)，不足 k 个时以 -1 填充"""
+    num_docs = vectors.shape[0]
+    neighbors = np.full((num_docs, k), -1, dtype=np.int32)
+    scores = np.zeros((num_docs, k), dtype=np.float32)
+    if num_docs < 2 or vectors.shape[1] == 0:
+        return neighbors, scores
+    valid = np.linalg.norm(vectors, axis=1) > 0
+    tables = lsh_tables(vectors)
+    for row in np.flatnonzero(valid):
+        # 任一张表中与该文档同桶的文档为候选
+        candidates = np.unique(np.concatenate([
+            order[starts[bucket_of[row]]:ends[bucket_of[row]]] for order, starts, ends, bucket_of in tables
+        ]))
+        candidates = candidates[(candidates != row) & valid[candidates]]
+        if not len(candidates):
+            continue
+        similarities = vectors[candidates] @ vectors[row]
+        keep = similarities >= MIN_SIMILARITY
+        candidates, similarities = candidates[keep], similarities[keep]
+        if len(candidates) > k:
+            top = np.argpartition(-similarities, k)[:k]
+            candidates, similarities = candidates[top], similarities[top]
+        ranked = np.argsort(-similarities, kind='stable')
+        neighbors[row, :len(ranked)] = candidates[ranked]
+        scores[row, :len(ranked)] = similarities[ranked]
+    return neighbors, scores
+
+def build_related_index(index_dirs, output_dir, k=TOP_K):
+    """为各索引（或分片）的全部文档构建相关文档索引，返回文档数"""
+    matrix, docs = collect_term_matrix(index_dirs)
+    vectors = lsa(tfidf(matrix)) if matrix.shape[1] else np.zeros((len(docs), 0), dtype=np.float32)
+    neighbors, scores = nearest_neighbors(vectors, k)
+
+    tmp_dir, old_dir = output_dir + '.tmp', output_dir + '.old'
+    for stale_dir in (tmp_dir, old_dir):
+        shutil.rmtree(stale_dir, ignore_errors=True)  # 上次构建中断时的残留
+    os.makedirs(tmp_dir)
+    with open(os.path.join(tmp_dir, DOCS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(docs, f, ensure_ascii=False)
+    np.save(os.path.join(tmp_dir, NEIGHBORS_FILE), neighbors)
+    np.save(os.path.join(tmp_dir, SCORES_FILE), scores)
+    # 交换目录：旧索引先移走、新索引移入，旧文件在新索引就位后才删除（已加载的 mmap 仍可读）
+    if os.path.isdir(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return len(docs)
+
+class RelatedIndex:
+    """只读相关文档索引：近邻列表 mmap 加载，URL -> 行号为字典，查询为常数时间"""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, DOCS_FILE), 'r', encoding='utf-8') as f:
+            self.docs = json.load(f)
+        self.rows = {url: row for row, (url, _) in enumerate(self.docs)}
+        self.neighbors = np.load(os.path.join(path, NEIGHBORS_FILE), mmap_mode='r')
+        self.scores = np.load(os.path.join(path, SCORES_FILE), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.docs)
+
+    def related(self, url, k=TOP_K):
+        """返回与 url 最相关的至多 k 篇文档 [{'url', 'title', 'score'}]，url 不在索引中时返回 None"""
+        row = self.rows.get(url)
+        if row is None:
+            return None
+        result = []
+        for neighbor, score in zip(self.neighbors[row, :k], self.scores[row, :k]):
+            if neighbor < 0:
+                break
+            neighbor_url, title = self.docs[neighbor]
+            result.append({'url': neighbor_url, 'title': title, 'score': round(float(score), 4)})
+        return result
@@ -1,17 +1,37 @@
 import os
 import json
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, send_from_directory
-from personalization import analyze_user_interests, adjust_search_results, get_collaborative_recommendations
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, send_from_directory, Response, stream_with_context
+from personalization import analyze_user_interests, adjust_search_results, get_collaborative_recommendations, load_personalization_context, collaborative_index
 from whoosh.index import open_dir
-from whoosh.qparser import MultifieldParser
-from whoosh.highlight import UppercaseFormatter
-from whoosh.scoring import BM25F
-from whoosh.query import Phrase, Wildcard
+from whoosh.qparser import MultifieldParser, QueryParser
+from whoosh.highlight import UppercaseFormatter, ContextFragmenter, highlight
+from link_graph import QualityBM25F
+from analyzers import ChineseTokenizer
+from query_normalization import canonical_query, normalize_query, is_plain_query
+from spelling import SPELLING_FILE, SpellingDictionary
+from related import RELATED_DIR, NEIGHBORS_FILE, TOP_K as RELATED_TOP_K, RelatedIndex
+from query_log import query_log
+from sharding import GlobalStats, GlobalStatsBM25F, is_sharded, list_shards, shard_term_stats, query_terms
+from doc_store import open_doc_store
+from profiler import profiler
+from admission import AdmissionController, Overloaded, estimate_cost, personalization_cost, cost_class, wildcard_prefix
+from snapshot_store import read_snapshot
+from whoosh.query import Phrase, Wildcard, Term
+from whoosh.collectors import TopCollector, TermsCollector, TimeLimitCollector, TimeLimit
 import logging
 from passlib.hash import sha256_crypt
 import datetime
 import time
 import re
+import mimetypes
+import threading
+import multiprocessing
+import functools
+import jieba
+from collections import Counter
+from contextlib import nullcontext
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from cachetools import LRUCache
 
 app = Flask(__name__)
@@ -23,6 +43,378 @@ logger = logging.getLogger(__name__)
 
 # 初始化查询缓存，最大100条记录
 query_cache = LRUCache(maxsize=100)
+# 缓存命中统计；normalized_hits 为仅因查询规范化才命中的次数（原始查询串与写入缓存时不同），
+# ranking_hits 为最终结果未命中、但基础排序命中 ranking_cache 的次数
+query_cache_stats = Counter()
+# 个性化之前的基础排序结果，与用户无关：登录用户共享，预热（非个性化）也能为登录用户省去检索
+ranking_cache = LRUCache(maxsize=100)
+
+# 推荐用的标题检索结果，按规范化查询缓存（与用户无关），索引更新后随查询缓存一起清空
+RECOMMEND_LIMIT = 3
+recommend_cache = LRUCache(maxsize=1000)
+
+# 准入控制：廉价和昂贵查询分别限流，过载时降级或返回 429
+admission = AdmissionController()
+# 通配前缀在词典中的扩展词数（估算代价用），超过上限按上限计
+MAX_EXPANSION_COUNT = 2000
+expansion_cache = LRUCache(maxsize=1000)
+
+# 按 (索引目录, 索引代数, 文件类型) 缓存的文档号集合，索引重建后自动失效
+file_type_filter_cache = LRUCache(maxsize=32)
+
+# 分数阈值与单次查询的时间上限（秒），超时返回已收集的部分结果
+MIN_HIT_SCORE = 0.5
+SEARCH_TIME_LIMIT = 2.0
+
+# 分片检索的进程池大小，默认每个 CPU 一个进程
+SHARD_WORKERS = None
+shard_pool = None
+
+# 按索引目录缓存的纠错词典 (文件修改时间, SpellingDictionary)，索引重建后重新加载
+spelling_dictionaries = {}
+# 结果数少于该值的查询才计算“您是不是要找”
+CORRECTION_MAX_RESULTS = 5
+
+# 批量搜索单次请求的最大子查询数
+MAX_BATCH_QUERIES = 20
+
+# 管理员可通过此请求头对单个请求做采样分析（其余请求按 profiler.sample_rate 抽样）
+PROFILE_HEADER = 'X-Profile'
+
+# 搜索结果中仅供服务端使用的字段，不返回给客户端
+INTERNAL_RESULT_KEYS = ('store_dir', 'doc_id', 'store_id', 'matched_terms')
+
+# 按索引目录缓存的相关文档索引 (近邻表修改时间, RelatedIndex)
+related_indexes = {}
+
+# 启动及索引更新后的预热：执行查询日志中最常见的查询
+WARMUP_TOP_QUERIES = 50
+WARMUP_CHECK_INTERVAL = 30  # 检查索引代数变化的间隔（秒）
+# ready 只在首次预热完成前为 False；之后索引更新时在后台重新预热（rewarming），服务不中断
+warmup_state = {"ready": False, "rewarming": False, "generation": None, "queries": 0, "elapsed_time": 0.0}
+
+class ThresholdTopCollector(TopCollector):
+    """在收集阶段直接丢弃低分或被过滤的文档，避免进入 top-k 堆"""
+    def __init__(self, limit=10, min_score=None, restrict=None, **kwargs):
+        super().__init__(limit, **kwargs)
+        self.min_score = min_score
+        self.restrict = restrict
+
+    def _collect(self, global_docnum, score):
+        if self.min_score is not None and score <= self.min_score:
+            return 0
+        if self.restrict is not None and global_docnum in self.restrict:
+            return 0
+        return super()._collect(global_docnum, score)
+
+def get_file_type_docs(searcher, index_dir, file_type):
+    """返回指定 file_type 的文档号集合，按 searcher 所读取的索引代数缓存"""
+    key = (index_dir, searcher.reader().generation(), file_type)
+    docs = file_type_filter_cache.get(key)
+    if docs is None:
+        docs = frozenset(searcher.docs_for_query(Term("file_type", file_type)))
+        file_type_filter_cache[key] = docs
+    return docs
+
+def collect_hits(searcher, query, limit=100, terms=False, min_score=None, restrict=None, timelimit=SEARCH_TIME_LIMIT):
+    """执行带过滤、分数阈值和时间上限的 top-k 收集，超时返回部分结果"""
+    collector = ThresholdTopCollector(limit, min_score=min_score, restrict=restrict)
+    if terms:
+        collector = TermsCollector(collector)
+    # Flask 在工作线程中处理请求，无法使用 SIGALRM
+    collector = TimeLimitCollector(collector, timelimit, use_alarm=False)
+    try:
+        searcher.search_with_collector(query, collector)
+    except TimeLimit:
+        logger.warning(f"查询超时 ({timelimit}s)，返回部分结果: {query}")
+    return collector.results()
+
+def build_query(schema, query_str, is_phrase=False):
+    """解析查询，返回 (query, is_wildcard)；通配查询按通配符位置调整字段权重"""
+    if is_phrase:
+        return Phrase("content", query_str.split()), False
+    is_wildcard = '*' in query_str or '?' in query_str
+    fieldboosts = {"title": 2.0, "content": 1.0}
+    if is_wildcard:
+        if query_str.startswith('*'):
+            fieldboosts = {"title": 1.0, "content": 2.0}  # 优先内容
+        elif query_str.endswith('*'):
+            fieldboosts = {"title": 3.0, "content": 1.0}  # 优先标题
+    return MultifieldParser(["title", "content"], schema, fieldboosts=fieldboosts).parse(query_str), is_wildcard
+
+def run_query(ix, index_dir, query_str, is_phrase=False, files_only=False, ranking_params=None, limit=100, global_stats=None, searcher=None):
+    """在单个索引（或分片）上执行查询，返回命中字典列表（不含高亮，见 highlight_results）
+
+    searcher 为调用方共享的 searcher（见 search_many），其打分模型在创建时已指定，此时 ix 可为 None。
+    """
+    ranking_params = ranking_params or {"B": 0.75, "K1": 1.5}
+    query, is_wildcard = build_query(ix.schema if searcher is None else searcher.schema, query_str, is_phrase)
+    if searcher is not None:
+        searcher_context = nullcontext(searcher)
+    elif global_stats is None:
+        searcher_context = ix.searcher(weighting=QualityBM25F(**ranking_params))
+    else:
+        searcher_context = ix.searcher(weighting=GlobalStatsBM25F(global_stats, **ranking_params))
+    with searcher_context as searcher:
+        # 检索时打开当前文档存储并保留，之后按命中的 store_id 取回同一实例生成高亮
+        open_doc_store(index_dir)
+        # 仅文件模式：在收集阶段排除 HTML 文档
+        restrict = get_file_type_docs(searcher, index_dir, 'html') if files_only else None
+        hits = collect_hits(searcher, query, limit=limit, terms=is_wildcard,
+                            min_score=None if is_phrase else MIN_HIT_SCORE, restrict=restrict)
+        results = []
+        for hit in hits:
+            result = {
+                "url": hit['url'],
+                "title": hit['title'],
+                "score": hit.score,
+                "file_type": hit['file_type'],
+                "snapshot_path": hit.get('snapshot_path', ''),
+                # 高亮时从该目录中与命中同一次构建的文档存储（store_id）读取正文
+                "doc_id": hit.get('doc_id'),
+                "store_id": hit.get('store_id'),
+                "store_dir": index_dir
+            }
+            if is_wildcard:
+                # 通配符扩展出的实际匹配词
+                result["matched_terms"] = [(term[0], term[1].decode('utf-8')) for term in hit.matched_terms() if term[0] in ['title', 'content']]
+            results.append(result)
+        return results
+
+def highlight_text(schema, fieldname, text, terms):
+    if not text or not terms:
+        return ""
+    return highlight(text, terms, schema[fieldname].analyzer, ContextFragmenter(), UppercaseFormatter())
+
+def highlight_results(results, query_str, is_phrase=False, searcher=None):
+    """为当前页的结果生成标题和正文高亮，正文只在此时从文档存储读取
+
+    searcher 为共享的单索引 searcher 时复用其 reader，不再重新打开索引。
+    """
+    field_terms_by_dir = {}
+    for result in results:
+        store_dir = result.pop('store_dir')
+        doc_id = result.pop('doc_id', None)
+        store_id = result.pop('store_id', None)
+        matched_terms = result.pop('matched_terms', None)
+        if store_dir not in field_terms_by_dir:
+            if searcher is None:
+                ix = open_dir(store_dir)
+                schema, reader_context = ix.schema, ix.reader()
+            else:
+                schema, reader_context = searcher.schema, nullcontext(searcher.reader())
+            query = build_query(schema, query_str, is_phrase)[0]
+            field_terms = {"title": set(), "content": set()}
+            with reader_context as reader:
+                for fieldname, text in query_terms(query, reader):
+                    if fieldname in field_terms:
+                        field_terms[fieldname].add(text.decode('utf-8'))
+            field_terms_by_dir[store_dir] = (schema, field_terms)
+        schema, field_terms = field_terms_by_dir[store_dir]
+        if matched_terms is not None:
+            field_terms = {fieldname: {text for name, text in matched_terms if name == fieldname} for fieldname in field_terms}
+        # 按命中所属的存储读取：索引在检索之后被重建时，不会按旧 doc_id 读到新存储中的其他文档
+        store = open_doc_store(store_dir, store_id)
+        content = store.get(doc_id) if store is not None else None
+        result['title_highlight'] = highlight_text(schema, 'title', result['title'], field_terms['title']) or result['title'] or "无标题匹配"
+        result['content_highlight'] = highlight_text(schema, 'content', content, field_terms['content']) or "无内容匹配"
+        emphasize(result, query_str, [text for _, text in matched_terms] if matched_terms is not None else None)
+    return results
+
+def emphasize(result, query_str, matched_terms=None):
+    """加粗高亮片段中的完整查询词组（或通配扩展词）及单字符"""
+    if matched_terms is None:
+        patterns = [re.compile(f"({re.escape(query_str)})", re.IGNORECASE)]
+        chars = list(query_str)
+    else:
+        patterns = []
+        chars = matched_terms + list(query_str.replace('*', '').replace('?', ''))
+    patterns += [re.compile(f"(?<!<strong>)({re.escape(char)})(?!</strong>)", re.IGNORECASE) for char in chars]
+    for key in ("title_highlight", "content_highlight"):
+        for pattern in patterns:
+            result[key] = pattern.sub(r"<strong>\1</strong>", result[key])
+    return result
+
+def open_shard_query(shard_dir, query_str, is_phrase):
+    ix = open_dir(shard_dir)
+    return ix, build_query(ix.schema, query_str, is_phrase)[0]
+
+def shard_stats_worker(shard_dir, query_str, is_phrase):
+    """进程池任务：统计分片中查询词的文档频率等"""
+    ix, query = open_shard_query(shard_dir, query_str, is_phrase)
+    with ix.searcher() as searcher:
+        return shard_term_stats(searcher, query)
+
+def shard_search_worker(shard_dir, query_str, is_phrase, files_only, ranking_params, limit, global_stats):
+    """进程池任务：按全局统计量检索单个分片"""
+    return run_query(open_dir(shard_dir), shard_dir, query_str, is_phrase=is_phrase, files_only=files_only,
+                     ranking_params=ranking_params, limit=limit, global_stats=global_stats)
+
+def get_shard_pool():
+    global shard_pool
+    if shard_pool is None:
+        # spawn：Flask 多线程进程中 fork 可能继承被占用的锁
+        shard_pool = ProcessPoolExecutor(max_workers=SHARD_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return shard_pool
+
+def search_shards(index_dir, query_str, is_phrase=False, files_only=False, ranking_params=None, limit=100):
+    """分片检索协调器：先汇总各分片的词统计得到全局 BM25F 统计量，再并行检索各分片并合并 top-k"""
+    shard_dirs = list_shards(index_dir)
+    pool = get_shard_pool()
+    partials = [future.result() for future in
+                [pool.submit(shard_stats_worker, shard_dir, query_str, is_phrase) for shard_dir in shard_dirs]]
+    global_stats = GlobalStats.merge(partials)
+    futures = [pool.submit(shard_search_worker, shard_dir, query_str, is_phrase, files_only, ranking_params, limit, global_stats)
+               for shard_dir in shard_dirs]
+    hits = [hit for future in futures for hit in future.result()]
+    hits.sort(key=lambda hit: hit['score'], reverse=True)
+    return hits[:limit]
+
+def get_spelling_dictionary(index_dir):
+    path = os.path.join(index_dir, SPELLING_FILE)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = spelling_dictionaries.get(index_dir)
+    if cached is None or cached[0] != mtime:
+        previous = cached
+        cached = (mtime, SpellingDictionary(path))
+        spelling_dictionaries[index_dir] = cached
+        logger.info(f"加载纠错词典: {path} ({len(cached[1])} 词)")
+        if previous is not None:
+            # 关闭旧词典的 mmap 和文件句柄，否则每次重建都泄漏一个映射；
+            # 仍在使用旧词典的查询会失败，suggest_correction 对此不给出纠正
+            try:
+                previous[1].close()
+            except (BufferError, ValueError) as e:
+                logger.warning(f"关闭旧纠错词典失败: {e}")
+    return cached[1]
+
+def get_related_index(index_dir):
+    path = os.path.join(index_dir, RELATED_DIR)
+    try:
+        mtime = os.path.getmtime(os.path.join(path, NEIGHBORS_FILE))
+    except OSError:
+        return None
+    cached = related_indexes.get(index_dir)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, RelatedIndex(path))
+        related_indexes[index_dir] = cached
+        logger.info(f"加载相关文档索引: {path} ({len(cached[1])} 篇)")
+    return cached[1]
+
+def suggest_correction(index_dir, query_str):
+    """“您是不是要找”：纠正关键词查询中的错字，无需纠正时返回 None
+
+    分词结果都在词典中的词保持不变；否则先整体纠正（如“图书官”），
+    找不到候选时再逐个纠正分词结果。
+    """
+    query_str = normalize_query(query_str)
+    if not query_str or not is_plain_query(query_str):
+        return None
+    dictionary = get_spelling_dictionary(index_dir)
+    if dictionary is None:
+        return None
+    corrected = []
+    try:
+        for token in query_str.split():
+            segments = jieba.lcut(token)
+            if all(segment in dictionary for segment in segments):
+                corrected.append(token)
+            else:
+                corrected.append(dictionary.lookup(token) or ''.join(dictionary.lookup(segment) or segment for segment in segments))
+    except ValueError:
+        return None  # 词典在查询期间被新版本替换并关闭
+    corrected = ' '.join(corrected)
+    return corrected if corrected != query_str else None
+
+def index_generation(index_dir):
+    """当前索引代数；单一索引为 (Whoosh 代数, 文档存储标识)，分片索引为各分片（目录，代数）的元组，
+    索引不存在时为 None
+
+    重建的索引 Whoosh 代数从头计数，因此还要比较每次构建都不同的存储标识或分片目录名。
+    """
+    try:
+        if is_sharded(index_dir):
+            return tuple((os.path.basename(shard_dir), open_dir(shard_dir).latest_generation())
+                         for shard_dir in list_shards(index_dir))
+        store = open_doc_store(index_dir)
+        return open_dir(index_dir).latest_generation(), store.store_id if store is not None else None
+    except Exception:
+        return None
+
+def get_top_queries(n=WARMUP_TOP_QUERIES):
+    """按规范形式合并计数的高频查询，每个取最常见的原始写法"""
+    counts = Counter()
+    forms = {}
+    for (_, query), count in query_log.query_counts().items():
+        query = normalize_query(query)
+        if query:
+            key = canonical_query(query)
+            counts[key] += count
+            forms.setdefault(key, Counter())[query] += count
+    return [forms[key].most_common(1)[0][0] for key, _ in counts.most_common(n)]
+
+def warm_up(index_dir):
+    """预加载 jieba 与停用词，并以非个性化路径执行高频查询，填充索引、过滤器和查询缓存
+
+    基础排序缓存与用户无关，登录用户的同一查询也直接复用预热结果，只需个性化和高亮。
+    """
+    start_time = time.time()
+    generation = index_generation(index_dir)
+    # 首次预热完成后不再报告未就绪：所有副本同时看到索引切换，
+    # 一起返回 503 会让负载均衡摘掉整个集群，而缓存清空后服务仍然可用
+    warmup_state["rewarming"] = warmup_state["ready"]
+    jieba.initialize()
+    ChineseTokenizer()  # 读取停用词表
+    get_spelling_dictionary(index_dir)
+    get_related_index(index_dir)
+    queries = get_top_queries()
+    for query_str in queries:
+        search_index(index_dir, query_str)
+    warmup_state.update(ready=True, rewarming=False, generation=generation, queries=len(queries),
+                        elapsed_time=time.time() - start_time)
+    logger.info(f"预热完成: {len(queries)} 条查询，耗时 {warmup_state['elapsed_time']:.2f} 秒，索引代数 {generation}")
+
+def warmup_loop(index_dir):
+    """后台线程：启动时预热，之后索引代数变化时清空查询缓存并重新预热"""
+    while True:
+        try:
+            if not warmup_state["ready"] or index_generation(index_dir) != warmup_state["generation"]:
+                query_cache.clear()
+                ranking_cache.clear()
+                recommend_cache.clear()
+                expansion_cache.clear()
+                warm_up(index_dir)
+        except Exception as e:
+            logger.error(f"预热失败: {e}", exc_info=True)
+        time.sleep(WARMUP_CHECK_INTERVAL)
+
+def start_warmup(index_dir="indexdir"):
+    thread = threading.Thread(target=warmup_loop, args=(index_dir,), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+background_tasks_started = False
+background_tasks_lock = threading.Lock()
+
+def start_background_tasks(index_dir="indexdir"):
+    """启动预热和查询日志压缩线程，每个进程只启动一次"""
+    global background_tasks_started
+    with background_tasks_lock:
+        if background_tasks_started:
+            return
+        background_tasks_started = True
+    start_warmup(index_dir)
+    query_log.start_compaction()
+
+@app.before_request
+def ensure_background_tasks():
+    # 在实际处理请求的进程中启动（debug 重载器的子进程、WSGI 的各 worker），
+    # 第一个请求（通常是 /health 就绪检查）即触发预热
+    if not background_tasks_started:
+        start_background_tasks()
 
 def load_users():
     try:
@@ -36,6 +428,27 @@ def load_users():
         logger.error(f"加载 users.json 失败: {e}", exc_info=True)
         raise
 
+def is_admin(username):
+    """users.json 中带 "is_admin": true 的用户"""
+    if not username:
+        return False
+    try:
+        return any(user.get('username') == username and user.get('is_admin') for user in load_users())
+    except Exception:
+        return False
+
+def profiled(label):
+    """按采样比例或管理员的 X-Profile 请求头对路由做采样分析，未启用时只多一次比较"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            forced = PROFILE_HEADER in request.headers and is_admin(session.get('username'))
+            if not profiler.should_profile(forced):
+                return view(*args, **kwargs)
+            return profiler.run(label, view, *args, **kwargs)
+        return wrapper
+    return decorator
+
 def save_users(users):
     try:
         with open('users.json', 'w', encoding='utf-8') as f:
@@ -71,29 +484,17 @@ def log_query(username, query):
         'timestamp': datetime.datetime.now().isoformat()
     }
     try:
-        log_file = 'query_logs.json'
-        logs = []
-        if os.path.exists(log_file):
-            with open(log_file, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        logs.append(log_entry)
-        with open(log_file, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, ensure_ascii=False, indent=2)
+        query_log.append(log_entry)
+        collaborative_index.add(username, query)
     except Exception as e:
         logger.error(f"Failed to log query: {e}", exc_info=True)
 
 def get_user_personalization(username):
     try:
-        log_file = 'query_logs.json'
-        if not os.path.exists(log_file):
-            return {}
-        with open(log_file, 'r', encoding='utf-8') as f:
-            logs = json.load(f)
-        user_logs = [log['query'] for log in logs if log['username'] == username]
         keyword_weights = {}
-        for query in user_logs:
-            for word in query.split():
-                keyword_weights[word] = keyword_weights.get(word, 0) + 1
+        for (_, query), count in query_log.query_counts(username).items():
+            for word in canonical_query(query).split():
+                keyword_weights[word] = keyword_weights.get(word, 0) + count
         return keyword_weights
     except Exception as e:
         logger.error(f"Failed to generate personalization for user {username}: {e}", exc_info=True)
@@ -103,157 +504,200 @@ def apply_personalization(results, keyword_weights):
     for result in results:
         score_boost = 0
         for keyword, weight in keyword_weights.items():
-            if keyword in result['title'] or keyword in result['content_highlight']:
+            if keyword in result['title'] or keyword in result.get('content_highlight', ''):
                 score_boost += weight
         result['score'] += score_boost
     return sorted(results, key=lambda x: x['score'], reverse=True)
 
-def search_index(index_dir, query_str, page=1, files_only=False, ranking_params=None, is_phrase=False, username=None):
+def public_result(result):
+    """去掉仅供服务端使用的字段（文档存储位置、通配扩展词）"""
+    return {key: value for key, value in result.items() if key not in INTERNAL_RESULT_KEYS}
+
+def search_events(index_dir, query_str, page=1, files_only=False, ranking_params=None, is_phrase=False, username=None,
+                  searcher=None, personalization=None, degraded=False):
+    """分阶段执行搜索，依次产生 (事件名, 数据)：
+
+    - results：总数、总页数和当前页的基础排序结果（精确匹配在前，尚无高亮）
+    - personalized：个性化重排后的当前页（仅登录用户）
+    - highlights：当前页最终结果（含高亮）
+    - done：耗时
+
+    每个阶段的 results 都是完整的当前页，最终结果与 search_index 相同；
+    命中缓存时 results 事件直接给出最终结果。searcher 和 personalization
+    为批量搜索共享的单索引 searcher 和个性化上下文（见 search_many）。
+    degraded 为过载降级：只产生 results 和 done，跳过个性化和高亮，结果不写入缓存。
+    """
+    if not os.path.exists(index_dir):
+        logger.error(f"索引目录不存在: {index_dir}")
+        yield "results", {"results": [], "total_results": 0, "total_pages": 0, "final": True}
+        yield "done", {"elapsed_time": 0}
+        return
+    start_time = time.time()
+    ranking_params = ranking_params or {"B": 0.75, "K1": 1.5}
+    results = []
+    seen_urls = set()
+    raw_query = query_str
+    # 执行和高亮使用保持原词序的规范化查询，缓存按规范形式（分词排序后）查找
+    query_str = normalize_query(query_str)
+    canonical = canonical_query(query_str, is_phrase)
+
+    # 检查缓存（按规范化查询和索引代数；索引重建后不会命中旧索引的结果）
+    generation = index_generation(index_dir)
+    cache_key = f"{canonical}_{page}_{files_only}_{is_phrase}_{username}_{generation}"
+    query_cache_stats['lookups'] += 1
+    if cache_key in query_cache:
+        cached_result = query_cache[cache_key]
+        query_cache_stats['hits'] += 1
+        if cached_result['raw_query'] != raw_query:
+            query_cache_stats['normalized_hits'] += 1
+        yield "results", {"results": cached_result['results'], "total_results": cached_result['total_results'],
+                          "total_pages": cached_result['total_pages'], "final": True}
+        yield "done", {"elapsed_time": cached_result['elapsed_time']}
+        return
+
+    ranking_key = (canonical, files_only, is_phrase, tuple(sorted(ranking_params.items())), generation)
+    if ranking_key in ranking_cache:
+        query_cache_stats['ranking_hits'] += 1
+        # 后续阶段会修改分数并取走内部字段，使用副本
+        results = [dict(result) for result in ranking_cache[ranking_key]]
+    else:
+        # 1. 精确短语查询；2. 通配查询或模糊查询
+        if is_sharded(index_dir):
+            hits = search_shards(index_dir, query_str, is_phrase=is_phrase, files_only=files_only, ranking_params=ranking_params)
+        else:
+            ix = open_dir(index_dir) if searcher is None else None
+            hits = run_query(ix, index_dir, query_str, is_phrase=is_phrase, files_only=files_only,
+                             ranking_params=ranking_params, searcher=searcher)
+        phrase_results = []
+        for hit in hits:
+            if hit['url'] not in seen_urls:
+                result = hit
+                result['is_exact'] = is_phrase
+                if is_phrase:
+                    result['score'] = result['score'] * 5.0 + 200.0
+                    phrase_results.append(result)
+                else:
+                    results.append(result)
+                seen_urls.add(hit['url'])
+
+        # 3. 合并结果，精确匹配优先
+        results = phrase_results + results
+        ranking_cache[ranking_key] = [dict(result) for result in results]
+    total_results = len(results)
+    results_per_page = 10
+    start_index = (page - 1) * results_per_page
+    total_pages = (total_results + results_per_page - 1) // results_per_page
+    # 个性化只调整分数和顺序，不改变结果总数
+    yield "results", {"results": [public_result(result) for result in results[start_index:start_index + results_per_page]],
+                      "total_results": total_results, "total_pages": total_pages, "final": False}
+
+    if degraded:
+        yield "done", {"elapsed_time": time.time() - start_time, "degraded": True}
+        return
+
+    if username:
+        # 个性化按正文高亮片段中的词计算兴趣和相似度：先从文档存储读取全部结果的正文生成高亮，
+        # 与正文存储在索引中时的排序一致；非个性化查询只为当前页读取正文
+        results = highlight_results(results, query_str, is_phrase, searcher=searcher)
+        results = adjust_search_results(results, username, query_str, context=personalization)
+        yield "personalized", {"results": [public_result(result) for result in results[start_index:start_index + results_per_page]]}
+        paginated_results = results[start_index:start_index + results_per_page]
+    else:
+        paginated_results = highlight_results(results[start_index:start_index + results_per_page], query_str, is_phrase, searcher=searcher)
+    yield "highlights", {"results": paginated_results}
+
+    elapsed_time = time.time() - start_time
+
+    # 缓存结果
+    query_cache[cache_key] = {
+        'raw_query': raw_query,
+        'results': paginated_results,
+        'elapsed_time': elapsed_time,
+        'total_pages': total_pages,
+        'total_results': total_results
+    }
+    yield "done", {"elapsed_time": elapsed_time}
+
+def search_index(index_dir, query_str, page=1, files_only=False, ranking_params=None, is_phrase=False, username=None,
+                 searcher=None, personalization=None, degraded=False):
     """优化后的搜索倒排索引函数，支持分页、短语查询、通配查询、精确匹配优先和个性化排序"""
     try:
-        if not os.path.exists(index_dir):
-            logger.error(f"索引目录不存在: {index_dir}")
-            return [], 0, 0, 0
-        ix = open_dir(index_dir)
-        start_time = time.time()
-        ranking_params = ranking_params or {"B": 0.75, "K1": 1.5}
-        results = []
-        seen_urls = set()
-
-        # 检查缓存
-        cache_key = f"{query_str}_{page}_{files_only}_{is_phrase}_{username}"
-        if cache_key in query_cache:
-            cached_result = query_cache[cache_key]
-            return cached_result['results'], cached_result['elapsed_time'], cached_result['total_pages'], cached_result['total_results']
-
-        with ix.searcher(weighting=BM25F(**ranking_params)) as searcher:
-            # 1. 精确短语查询
-            phrase_results = []
-            if is_phrase:
-                terms = query_str.split()
-                query = Phrase("content", terms)
-                phrase_hits = searcher.search(query, limit=100)
-                phrase_hits.formatter = UppercaseFormatter()
-                for hit in phrase_hits:
-                    if hit['url'] not in seen_urls:
-                        title_highlight = hit.highlights("title") or hit['title'] or "无标题匹配"
-                        content_highlight = hit.highlights("content") or "无内容匹配"
-                        # 高亮完整查询词组及单字符
-                        query_chars = query_str
-                        pattern = re.compile(f"({re.escape(query_chars)})", re.IGNORECASE)
-                        title_highlight = pattern.sub(r"<strong>\1</strong>", title_highlight)
-                        content_highlight = pattern.sub(r"<strong>\1</strong>", content_highlight)
-                        for char in query_chars:
-                            char_pattern = re.compile(f"(?<!<strong>)({re.escape(char)})(?!</strong>)", re.IGNORECASE)
-                            title_highlight = char_pattern.sub(r"<strong>\1</strong>", title_highlight)
-                            content_highlight = char_pattern.sub(r"<strong>\1</strong>", content_highlight)
-                        phrase_results.append({
-                            "url": hit['url'],
-                            "title": hit['title'],
-                            "title_highlight": title_highlight,
-                            "content_highlight": content_highlight,
-                            "score": hit.score * 5.0 + 200.0,
-                            "file_type": hit['file_type'],
-                            "snapshot_path": hit.get('snapshot_path', ''),
-                            "is_exact": True
-                        })
-                        seen_urls.add(hit['url'])
+        results, elapsed_time, total_pages, total_results = [], 0, 0, 0
+        for event, data in search_events(index_dir, query_str, page=page, files_only=files_only,
+                                         ranking_params=ranking_params, is_phrase=is_phrase, username=username,
+                                         searcher=searcher, personalization=personalization, degraded=degraded):
+            if event == "results":
+                total_pages, total_results = data['total_pages'], data['total_results']
+            if event == "done":
+                elapsed_time = data['elapsed_time']
             else:
-                # 2. 通配查询或模糊查询
-                # 检测通配符
-                is_wildcard = '*' in query_str or '?' in query_str
-                fieldboosts = {"title": 2.0, "content": 1.0}
-                # 动态调整字段权重
-                if is_wildcard:
-                    if query_str.startswith('*'):
-                        fieldboosts = {"title": 1.0, "content": 2.0}  # 优先内容
-                    elif query_str.endswith('*'):
-                        fieldboosts = {"title": 3.0, "content": 1.0}  # 优先标题
-
-                if is_wildcard:
-                    # 使用 Wildcard 查询处理通配符
-                    query = MultifieldParser(["title", "content"], ix.schema, fieldboosts=fieldboosts).parse(query_str)
-                    fuzzy_hits = searcher.search(query, limit=100, terms=True, scored=True)
-                    fuzzy_hits.formatter = UppercaseFormatter()
-                    for hit in fuzzy_hits:
-                        if hit['url'] not in seen_urls and (not files_only or hit['file_type'] != 'html'):
-                            title_highlight = hit.highlights("title") or hit['title'] or "无标题匹配"
-                            content_highlight = hit.highlights("content") or "无内容匹配"
-                            # 高亮匹配的扩展词及单字符
-                            matched_terms = [term[1].decode('utf-8') for term in hit.matched_terms() if term[0] in [b'title', b'content']]
-                            for term in matched_terms + list(query_str.replace('*', '').replace('?', '')):
-                                pattern = re.compile(f"(?<!<strong>)({re.escape(term)})(?!</strong>)", re.IGNORECASE)
-                                title_highlight = pattern.sub(r"<strong>\1</strong>", title_highlight)
-                                content_highlight = pattern.sub(r"<strong>\1</strong>", content_highlight)
-                            # 过滤低分结果
-                            if hit.score > 0.5:  # 设置分数阈值
-                                results.append({
-                                    "url": hit['url'],
-                                    "title": hit['title'],
-                                    "title_highlight": title_highlight,
-                                    "content_highlight": content_highlight,
-                                    "score": hit.score,
-                                    "file_type": hit['file_type'],
-                                    "snapshot_path": hit.get('snapshot_path', ''),
-                                    "is_exact": False
-                                })
-                                seen_urls.add(hit['url'])
-                else:
-                    # 普通模糊查询
-                    query = MultifieldParser(["title", "content"], ix.schema, fieldboosts=fieldboosts).parse(query_str)
-                    fuzzy_hits = searcher.search(query, limit=100)
-                    fuzzy_hits.formatter = UppercaseFormatter()
-                    for hit in fuzzy_hits:
-                        if hit['url'] not in seen_urls and (not files_only or hit['file_type'] != 'html'):
-                            title_highlight = hit.highlights("title") or hit['title'] or "无标题匹配"
-                            content_highlight = hit.highlights("content") or "无内容匹配"
-                            query_chars = query_str
-                            pattern = re.compile(f"({re.escape(query_chars)})", re.IGNORECASE)
-                            title_highlight = pattern.sub(r"<strong>\1</strong>", title_highlight)
-                            content_highlight = pattern.sub(r"<strong>\1</strong>", content_highlight)
-                            for char in query_chars:
-                                char_pattern = re.compile(f"(?<!<strong>)({re.escape(char)})(?!</strong>)", re.IGNORECASE)
-                                title_highlight = char_pattern.sub(r"<strong>\1</strong>", title_highlight)
-                                content_highlight = char_pattern.sub(r"<strong>\1</strong>", content_highlight)
-                            if hit.score > 0.5:  # 设置分数阈值
-                                results.append({
-                                    "url": hit['url'],
-                                    "title": hit['title'],
-                                    "title_highlight": title_highlight,
-                                    "content_highlight": content_highlight,
-                                    "score": hit.score,
-                                    "file_type": hit['file_type'],
-                                    "snapshot_path": hit.get('snapshot_path', ''),
-                                    "is_exact": False
-                                })
-                                seen_urls.add(hit['url'])
-
-            # 3. 合并结果，精确匹配优先
-            results = phrase_results + results
-            if username:
-                results = adjust_search_results(results, username, query_str)
-
-            total_results = len(results)
-            results_per_page = 10
-            start_index = (page - 1) * results_per_page
-            paginated_results = results[start_index:start_index + results_per_page]
-        
-        elapsed_time = time.time() - start_time
-        total_pages = (total_results + results_per_page - 1) // results_per_page
-
-        # 缓存结果
-        query_cache[cache_key] = {
-            'results': paginated_results,
-            'elapsed_time': elapsed_time,
-            'total_pages': total_pages,
-            'total_results': total_results
-        }
-
-        return paginated_results, elapsed_time, total_pages, total_results
+                results = data['results']
+        return results, elapsed_time, total_pages, total_results
     except Exception as e:
         logger.error(f"搜索失败: {e}", exc_info=True)
         return [], 0, 0, 0
 
+def recommend_titles(index_dir, query_str, limit=RECOMMEND_LIMIT):
+    """推荐用的轻量检索：只查标题字段、只取少量结果，不高亮、不个性化，按规范化查询缓存
+
+    分片索引按各分片的本地统计打分后合并，推荐只需要大致的排序。
+    """
+    query_str = normalize_query(query_str)
+    key = (index_dir, canonical_query(query_str), limit)
+    titles = recommend_cache.get(key)
+    if titles is not None:
+        return titles
+    hits = []
+    for shard_dir in list_shards(index_dir) or [index_dir]:
+        ix = open_dir(shard_dir)
+        query = QueryParser("title", ix.schema).parse(query_str)
+        with ix.searcher(weighting=QualityBM25F()) as searcher:
+            for hit in collect_hits(searcher, query, limit=limit, min_score=MIN_HIT_SCORE):
+                # 正文不在存储字段中（见 doc_store），读取标题不会加载正文
+                hits.append((hit.score, hit.get('title', '')))
+    titles = []
+    for _, title in sorted(hits, key=lambda x: x[0], reverse=True):
+        if title and title not in titles:
+            titles.append(title)
+    titles = titles[:limit]
+    recommend_cache[key] = titles
+    return titles
+
+def search_many(index_dir, specs, ranking_params=None, username=None, degraded=False):
+    """批量搜索：所有子查询共用一个 searcher（单索引时）和一份个性化上下文，规范化后相同的子查询只执行一次
+
+    specs 为 {"query", "page", "files_only", "is_phrase"} 字典列表，返回与之一一对应的
+    {"query", "page", "results", "elapsed_time", "total_pages", "total"} 列表。
+    """
+    ranking_params = ranking_params or {"B": 0.75, "K1": 1.5}
+    personalization = load_personalization_context(username) if username and not degraded else None
+    # 分片索引的各分片在进程池中检索，无法共享 searcher
+    ix = open_dir(index_dir) if os.path.exists(index_dir) and not is_sharded(index_dir) else None
+    responses = []
+    unique = {}
+    with (ix.searcher(weighting=QualityBM25F(**ranking_params)) if ix is not None else nullcontext()) as searcher:
+        for spec in specs:
+            query_str = spec.get('query', '').strip()
+            page = int(spec.get('page', 1))
+            files_only = bool(spec.get('files_only', False))
+            is_phrase = bool(spec.get('is_phrase', False))
+            key = (canonical_query(query_str, is_phrase), page, files_only, is_phrase)
+            if key not in unique:
+                unique[key] = search_index(index_dir, query_str, page=page, files_only=files_only,
+                                           ranking_params=ranking_params, is_phrase=is_phrase, username=username,
+                                           searcher=searcher, personalization=personalization,
+                                           degraded=degraded) if query_str else ([], 0, 0, 0)
+            results, elapsed_time, total_pages, total_results = unique[key]
+            responses.append({
+                "query": query_str,
+                "page": page,
+                "results": results,
+                "elapsed_time": elapsed_time,
+                "total_pages": total_pages,
+                "total": total_results
+            })
+    return responses
+
 @app.route('/')
 def index():
     try:
@@ -292,37 +736,83 @@ def register_page():
         logger.error(f"register_page 路由错误: {e}", exc_info=True)
         return jsonify({"error": "内部服务器错误"}), 500
 
+def wildcard_expansion(index_dir, query_str):
+    """通配前缀在标题和正文词典中扩展出的词数（至多 MAX_EXPANSION_COUNT），没有字面前缀时返回 None"""
+    prefix = wildcard_prefix(query_str)
+    if not prefix:
+        return None
+    key = (index_dir, prefix)
+    count = expansion_cache.get(key)
+    if count is None:
+        count = 0
+        for shard_dir in list_shards(index_dir) or [index_dir]:
+            with open_dir(shard_dir).reader() as reader:
+                for fieldname in ("title", "content"):
+                    count += sum(1 for _ in islice(reader.expand_prefix(fieldname, prefix), MAX_EXPANSION_COUNT - count))
+        expansion_cache[key] = count
+    return count
+
+def admit_search(index_dir, queries, username=None):
+    """估算一组 (查询串, 是否短语) 的代价并申请准入许可，返回 (Ticket, None) 或 (None, 429 响应)
+
+    同一请求只加载一次个性化上下文，用户历史规模只计一次。
+    """
+    cost = 0.0
+    for query_str, is_phrase in queries:
+        query_str = normalize_query(query_str)
+        expansion = wildcard_expansion(index_dir, query_str) if os.path.exists(index_dir) and not is_phrase else None
+        cost += estimate_cost(query_str, is_phrase, expansion=expansion)
+    if username:
+        cost += personalization_cost(len(collaborative_index.queries_by_user().get(username, ())))
+    try:
+        return admission.acquire(cost_class(cost)), None
+    except Overloaded as e:
+        logger.warning(f"准入拒绝: {e} (代价 {cost:.1f})")
+        response = jsonify({"error": "服务器繁忙，请稍后重试", "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return None, (response, 429)
+
+def parse_search_request():
+    """校验搜索请求，返回 (参数字典, None) 或 (None, 错误响应)"""
+    if 'username' not in session:
+        logger.warning("未登录用户尝试搜索")
+        return None, (jsonify({"error": "您必须登录才能搜索"}), 401)
+    data = request.get_json()
+    if not data:
+        return None, (jsonify({"error": "无效的请求数据"}), 400)
+    query_str = data.get('query', '').strip()
+    if not query_str:
+        logger.warning("收到空查询")
+        return None, (jsonify({"error": "查询字符串不能为空"}), 400)
+    return {
+        "query_str": query_str,
+        "page": int(data.get('page', 1)),
+        "files_only": data.get('files_only', False),
+        "is_phrase": data.get('is_phrase', False),
+        "ranking_params": get_user_ranking_params(session['username']),
+        "username": session['username']
+    }, None
+
 @app.route('/search', methods=['POST'])
+@profiled('search')
 def search():
     try:
-        if 'username' not in session:
-            logger.warning("未登录用户尝试搜索")
-            return jsonify({"error": "您必须登录才能搜索"}), 401
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "无效的请求数据"}), 400
-        query_str = data.get('query', '').strip()
-        if not query_str:
-            logger.warning("收到空查询")
-            return jsonify({"error": "查询字符串不能为空"}), 400
-        page = int(data.get('page', 1))
-        files_only = data.get('files_only', False)
-        is_phrase = data.get('is_phrase', False)
-        ranking_params = get_user_ranking_params(session['username'])
+        params, error = parse_search_request()
+        if error:
+            return error
+        query_str, page, is_phrase = params['query_str'], params['page'], params['is_phrase']
         index_dir = "indexdir"
-        results, elapsed_time, total_pages, total_results = search_index(
-            index_dir, 
-            query_str, 
-            page=page, 
-            files_only=files_only, 
-            ranking_params=ranking_params, 
-            is_phrase=is_phrase, 
-            username=session['username']
-        )
-        log_query(session['username'], query_str)
+        ticket, error = admit_search(index_dir, [(query_str, is_phrase)], params['username'])
+        if error:
+            return error
+        with ticket:
+            results, elapsed_time, total_pages, total_results = search_index(index_dir, degraded=ticket.degraded, **params)
+        log_query(params['username'], normalize_query(query_str))
         logger.debug(f"搜索结果: {len(results)} 条，耗时: {elapsed_time:.2f} 秒")
         return jsonify({
             "results": results,
+            "degraded": ticket.degraded,
+            "did_you_mean": suggest_correction(index_dir, query_str) if total_results < CORRECTION_MAX_RESULTS else None,
             "elapsed_time": elapsed_time,
             "total_pages": total_pages,
             "total": total_results,
@@ -333,6 +823,73 @@ def search():
         logger.error(f"search 路由错误: {e}", exc_info=True)
         return jsonify({"error": "搜索失败"}), 500
 
+@app.route('/search/stream', methods=['POST'])
+def search_stream():
+    """流式搜索（NDJSON，每行一个事件）：先返回总数和基础排序的当前页，再依次返回个性化重排和高亮"""
+    try:
+        params, error = parse_search_request()
+        if error:
+            return error
+        query_str, page, is_phrase = params['query_str'], params['page'], params['is_phrase']
+        index_dir = "indexdir"
+        ticket, error = admit_search(index_dir, [(query_str, is_phrase)], params['username'])
+        if error:
+            return error
+        log_query(params['username'], normalize_query(query_str))
+
+        def generate():
+            try:
+                total = 0
+                for event, data in search_events(index_dir, degraded=ticket.degraded, **params):
+                    if event == "results":
+                        data = dict(data, page=page, query=query_str)
+                        total = data['total'] = data.pop('total_results')
+                    elif event == "done":
+                        data['did_you_mean'] = suggest_correction(index_dir, query_str) if total < CORRECTION_MAX_RESULTS else None
+                    yield json.dumps(dict(data, event=event), ensure_ascii=False) + '\n'
+            except Exception as e:
+                logger.error(f"流式搜索失败: {e}", exc_info=True)
+                yield json.dumps({"event": "error", "error": "搜索失败"}, ensure_ascii=False) + '\n'
+            finally:
+                ticket.release()
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # 客户端在生成器开始前断开时也要归还许可
+        response.call_on_close(ticket.release)
+        return response
+    except Exception as e:
+        logger.error(f"search_stream 路由错误: {e}", exc_info=True)
+        return jsonify({"error": "搜索失败"}), 500
+
+@app.route('/search/batch', methods=['POST'])
+@profiled('search_batch')
+def search_batch():
+    """批量搜索：{"queries": [{"query", "page", "files_only", "is_phrase"}, ...]}，按顺序返回各子查询的结果"""
+    try:
+        if 'username' not in session:
+            logger.warning("未登录用户尝试搜索")
+            return jsonify({"error": "您必须登录才能搜索"}), 401
+        data = request.get_json()
+        specs = data.get('queries') if isinstance(data, dict) else None
+        if not isinstance(specs, list) or not specs or not all(isinstance(spec, dict) for spec in specs):
+            return jsonify({"error": "无效的请求数据"}), 400
+        if len(specs) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"单次最多 {MAX_BATCH_QUERIES} 个查询"}), 400
+        start_time = time.time()
+        username = session['username']
+        ticket, error = admit_search("indexdir", {(str(spec.get('query', '')).strip(), bool(spec.get('is_phrase', False))) for spec in specs}, username)
+        if error:
+            return error
+        with ticket:
+            responses = search_many("indexdir", specs, ranking_params=get_user_ranking_params(username), username=username,
+                                    degraded=ticket.degraded)
+        logger.debug(f"批量搜索: {len(specs)} 个查询，耗时: {time.time() - start_time:.2f} 秒")
+        return jsonify({"responses": responses, "degraded": ticket.degraded, "elapsed_time": time.time() - start_time})
+    except Exception as e:
+        logger.error(f"search_batch 路由错误: {e}", exc_info=True)
+        return jsonify({"error": "搜索失败"}), 500
+
 @app.route('/register', methods=['POST'])
 def register():
     try:
@@ -394,21 +951,17 @@ def get_logs():
     try:
         if 'username' not in session:
             return jsonify({"error": "未登录"}), 401
-        if os.path.exists('query_logs.json'):
-            with open('query_logs.json', 'r', encoding='utf-8') as f:
-                all_logs = json.load(f)
-            user_logs = [
-                {
-                    'query': log['query'],
-                    'timestamp': log.get('timestamp', ''),
-                    'results_count': log.get('results_count', 0)
-                }
-                for log in all_logs
-                if log.get('username') == session['username']
-            ]
-            return jsonify(user_logs)
-        else:
-            return jsonify([])
+        # 已压缩的历史每个查询一条（最后一次查询时间），近期分区逐条返回
+        username = session['username']
+        user_logs = [
+            {
+                'query': log['query'],
+                'timestamp': log.get('timestamp', ''),
+                'results_count': log.get('results_count', 0)
+            }
+            for logs in query_log.history(username) for log in logs
+        ]
+        return jsonify(user_logs)
     except Exception as e:
         logger.error(f"获取日志失败: {e}", exc_info=True)
         return jsonify({"error": "获取日志失败"}), 500
@@ -421,15 +974,8 @@ def delete_log():
         data = request.get_json()
         if not data or 'query' not in data:
             return jsonify({"error": "缺少查询参数"}), 400
-        query = data['query']
-        if os.path.exists('query_logs.json'):
-            with open('query_logs.json', 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        logs = [log for log in logs if log.get('query') != query or log.get('username') != session['username']]
-        with open('query_logs.json', 'w', encoding='utf-8') as f:
-            json.dump(logs, f, ensure_ascii=False, indent=2)
+        query_log.delete(session['username'], data['query'])
+        collaborative_index.invalidate()
         return jsonify({"message": "删除成功"})
     except Exception as e:
         logger.error(f"删除日志失败: {e}", exc_info=True)
@@ -440,24 +986,77 @@ def clear_logs():
     try:
         if 'username' not in session:
             return jsonify({"error": "未登录"}), 401
-        if os.path.exists('query_logs.json'):
-            with open('query_logs.json', 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-            logs = [log for log in logs if log.get('username') != session['username']]
-            with open('query_logs.json', 'w', encoding='utf-8') as f:
-                json.dump(logs, f, ensure_ascii=False, indent=2)
+        query_log.delete(session['username'])
+        collaborative_index.invalidate()
         return jsonify({"message": "清空成功"})
     except Exception as e:
         logger.error(f"清空日志失败: {e}", exc_info=True)
         return jsonify({"error": "清空失败"}), 500
 
+@app.route('/health')
+def health():
+    """就绪检查：首次预热完成前返回 503；之后索引更新引起的重新预热只在 rewarming 字段中报告"""
+    status = dict(warmup_state, status="ready" if warmup_state["ready"] else "warming")
+    lookups = query_cache_stats['lookups']
+    status["query_cache"] = dict(query_cache_stats, size=len(query_cache), ranking_size=len(ranking_cache),
+                                 hit_rate=query_cache_stats['hits'] / lookups if lookups else 0.0)
+    status["admission"] = admission.metrics()
+    return jsonify(status), 200 if warmup_state["ready"] else 503
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 文本格式的准入控制指标"""
+    lines = []
+    for name, kind, key in (
+        ('search_admission_in_flight', 'gauge', 'in_flight'),
+        ('search_admission_queue_depth', 'gauge', 'queue_depth'),
+        ('search_admission_admitted_total', 'counter', 'admitted'),
+        ('search_admission_degraded_total', 'counter', 'degraded'),
+        ('search_admission_shed_total', 'counter', 'shed'),
+        ('search_admission_timed_out_total', 'counter', 'timed_out'),
+    ):
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f'{name}{{class="{cls}"}} {values[key]}' for cls, values in admission.metrics().items())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """采样分析（仅管理员）：GET 返回统计和 top-N 热点函数；POST 设置 sample_rate、interval 或 reset"""
+    try:
+        if not is_admin(session.get('username')):
+            return jsonify({"error": "需要管理员权限"}), 403
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            profiler.configure(sample_rate=data.get('sample_rate'), interval=data.get('interval'))
+            if data.get('reset'):
+                profiler.reset()
+            logger.info(f"采样分析设置: {profiler.stats()}")
+        n = int(request.args.get('n', 20))
+        return jsonify(dict(profiler.stats(), top=profiler.top_functions(n)))
+    except Exception as e:
+        logger.error(f"admin_profile 路由错误: {e}", exc_info=True)
+        return jsonify({"error": "获取分析结果失败"}), 500
+
+@app.route('/admin/profile/collapsed')
+def admin_profile_collapsed():
+    """折叠栈文本，可直接生成火焰图：flamegraph.pl profile.txt > profile.svg"""
+    if not is_admin(session.get('username')):
+        return jsonify({"error": "需要管理员权限"}), 403
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
 @app.route('/favicon.ico')
 def favicon():
     return app.send_static_file('favicon.ico')
 
 @app.route('/spider_data/<path:filename>')
 def serve_spider_data(filename):
-    return send_from_directory('spider_data', filename)
+    if os.path.isfile(os.path.join('spider_data', filename)):
+        return send_from_directory('spider_data', filename)
+    # 独立文件不存在时从 pack 存储读取
+    data = read_snapshot('spider_data', filename)
+    if data is None:
+        return "快照不存在", 404
+    return Response(data, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
 
 @app.route('/_redirect')
 def redirect_proxy():
@@ -486,27 +1085,25 @@ def suggest():
             return jsonify([])
         username = session['username']
         user_interests = analyze_user_interests(username)
-        log_file = 'query_logs.json'
-        if not os.path.exists(log_file):
-            return jsonify([])
-        with open(log_file, 'r', encoding='utf-8') as f:
-            logs = json.load(f)
+        counts = query_log.query_counts()
         suggestions_set = set()
         suggestions = []
-        user_logs = [log for log in logs if log['username'] == username]
-        for log in user_logs:
-            log_q = log.get('query', '')
-            if log_q.lower().startswith(q.lower()) and log_q not in suggestions_set:
+        # 前缀匹配只做 NFKC/空白/大小写规范化，不重排词序
+        prefix = normalize_query(q)
+        user_logs = [query for (user, query) in counts if user == username]
+        for log_q in user_logs:
+            log_q = normalize_query(log_q)
+            if log_q.startswith(prefix) and log_q not in suggestions_set:
                 suggestions_set.add(log_q)
                 suggestions.append({
                     'query': log_q,
                     'type': 'history',
                     'weight': user_interests.get(log_q, 0)
                 })
-        other_logs = [log for log in logs if log['username'] != username]
-        for log in other_logs:
-            log_q = log.get('query', '')
-            if log_q.lower().startswith(q.lower()) and log_q not in suggestions_set:
+        other_logs = [query for (user, query) in counts if user != username]
+        for log_q in other_logs:
+            log_q = normalize_query(log_q)
+            if log_q.startswith(prefix) and log_q not in suggestions_set:
                 suggestions_set.add(log_q)
                 suggestions.append({
                     'query': log_q,
@@ -528,10 +1125,10 @@ def recommend():
         if not q:
             return jsonify([])
         username = session['username']
+        # 协同过滤使用预计算的用户查询集合，内容推荐只检索标题
         collaborative_recommendations = get_collaborative_recommendations(username, q)
         index_dir = "indexdir"
-        content_results, _, _, _ = search_index(index_dir, q, page=1, files_only=False, username=username)
-        content_recommendations = [result['title'] for result in content_results[:3]]
+        content_recommendations = recommend_titles(index_dir, q) if os.path.exists(index_dir) else []
         recommendations = []
         seen = set()
         for i in range(max(len(collaborative_recommendations), len(content_recommendations))):
@@ -554,9 +1151,31 @@ def recommend():
         logger.error(f"推荐功能错误: {e}", exc_info=True)
         return jsonify({"error": "获取推荐失败"}), 500
 
+@app.route('/related')
+def related():
+    """相关文档：返回与 url 内容最相近的文档（构建索引时预计算）"""
+    try:
+        if 'username' not in session:
+            return jsonify({"error": "您必须登录才能获取相关文档"}), 401
+        url = request.args.get('url', '').strip()
+        if not url:
+            return jsonify({"error": "缺少 url 参数"}), 400
+        k = min(max(int(request.args.get('k', RELATED_TOP_K)), 1), RELATED_TOP_K)
+        related_index = get_related_index("indexdir")
+        if related_index is None:
+            return jsonify({"error": "相关文档索引不存在"}), 503
+        results = related_index.related(url, k)
+        if results is None:
+            return jsonify({"error": "文档不在索引中"}), 404
+        return jsonify({"url": url, "related": results})
+    except Exception as e:
+        logger.error(f"相关文档功能错误: {e}", exc_info=True)
+        return jsonify({"error": "获取相关文档失败"}), 500
+
 if __name__ == "__main__":
     try:
         logger.info("启动 Flask 服务器...")
+        # 预热和日志压缩由第一个请求触发（见 ensure_background_tasks）
         app.run(debug=True, host='localhost', port=5000)
     except Exception as e:
         logger.error(f"启动服务器失败: {e}", exc_info=True)
\ No newline at end of file
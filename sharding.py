@@ -0,0 +1,121 @@
+import os
+import json
+import math
+import zlib
+from whoosh.scoring import BM25FScorer
+from link_graph import QualityBM25F, get_host_id
+
+# 分片索引布局：index_dir/shards.json 记录分片数和划分方式，各分片是 index_dir 下独立的 Whoosh 索引
+SHARD_MANIFEST = 'shards.json'
+SHARD_STRATEGIES = ('hash', 'host')
+SCORED_FIELDS = ('title', 'content')
+
+def shard_for_url(url, num_shards, strategy='hash'):
+    """按 URL 哈希或按主机（学院子域名）把文档分配到分片"""
+    if strategy == 'host':
+        # 同一学院的页面落在同一分片，便于单独重建
+        return get_host_id(url) % num_shards
+    return (zlib.crc32(url.encode('utf-8')) & 0x7fffffff) % num_shards
+
+def shard_name(shard):
+    return f'shard_{shard:03d}'
+
+def read_manifest(index_dir):
+    """返回分片清单，不是分片索引时返回 None"""
+    path = os.path.join(index_dir, SHARD_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def shard_generation_dir(manifest, shard):
+    """分片下一代的目录名（shard_NNN.gK）
+
+    每次重建写入新目录，清单原子替换后新的查询才会打开它；旧目录留给仍在读的请求。
+    """
+    generation = 0
+    if manifest and shard < len(manifest['shards']):
+        base, _, suffix = manifest['shards'][shard].partition('.g')
+        if base == shard_name(shard) and suffix.isdigit():
+            generation = int(suffix)
+    return f'{shard_name(shard)}.g{generation + 1}'
+
+def write_manifest(index_dir, num_shards, strategy, shards=None):
+    """原子写入分片清单，shards 为各分片的目录名（默认 shard_NNN）"""
+    path = os.path.join(index_dir, SHARD_MANIFEST)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'num_shards': num_shards,
+            'strategy': strategy,
+            'shards': shards or [shard_name(i) for i in range(num_shards)]
+        }, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def is_sharded(index_dir):
+    return os.path.exists(os.path.join(index_dir, SHARD_MANIFEST))
+
+def list_shards(index_dir):
+    manifest = read_manifest(index_dir)
+    return [os.path.join(index_dir, name) for name in manifest['shards']] if manifest else []
+
+def query_terms(query, reader):
+    """查询在该分片中实际出现的 (字段, 词) 集合，通配符按分片词典展开
+
+    逐个叶子查询收集：Whoosh 复合查询的 existing_terms 在多字段展开时会丢词。
+    """
+    terms = set()
+    for leaf in query.leaves():
+        terms |= leaf.existing_terms(reader, expand=True)
+    return terms
+
+def shard_term_stats(searcher, query):
+    """散发阶段一：返回分片的文档数、字段总长度和查询词的文档频率"""
+    return {
+        'doc_count': searcher.doc_count_all(),
+        'field_length': {field: searcher.field_length(field) for field in SCORED_FIELDS},
+        'doc_frequency': {term: searcher.doc_frequency(*term) for term in query_terms(query, searcher.reader())}
+    }
+
+class GlobalStats:
+    """各分片统计量之和，保证每个分片按全局 IDF 和平均字段长度打分，合并后的分数可直接比较"""
+    def __init__(self, doc_count=0, field_length=None, doc_frequency=None):
+        self.doc_count = doc_count
+        self.field_length = field_length or {}
+        self.doc_frequency = doc_frequency or {}
+
+    @classmethod
+    def merge(cls, partials):
+        stats = cls()
+        for partial in partials:
+            stats.doc_count += partial['doc_count']
+            for field, length in partial['field_length'].items():
+                stats.field_length[field] = stats.field_length.get(field, 0) + length
+            for term, freq in partial['doc_frequency'].items():
+                stats.doc_frequency[term] = stats.doc_frequency.get(term, 0) + freq
+        return stats
+
+    def idf(self, fieldname, text):
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        n = self.doc_frequency.get((fieldname, text), 0)
+        # 与 whoosh.scoring.WeightingModel.idf 的公式一致
+        return math.log(self.doc_count / (n + 1)) + 1
+
+    def avg_field_length(self, fieldname):
+        return self.field_length.get(fieldname, 0) / (self.doc_count or 1)
+
+class GlobalStatsBM25F(QualityBM25F):
+    """使用全局统计量的 QualityBM25F，用于分片检索"""
+    def __init__(self, global_stats, **kwargs):
+        super().__init__(**kwargs)
+        self.global_stats = global_stats
+
+    def idf(self, searcher, fieldname, text):
+        return self.global_stats.idf(fieldname, text)
+
+    def base_scorer(self, searcher, fieldname, text, qf=1):
+        scorer = super().base_scorer(searcher, fieldname, text, qf=qf)
+        if isinstance(scorer, BM25FScorer):
+            scorer.avgfl = self.global_stats.avg_field_length(fieldname) or 1
+        return scorer
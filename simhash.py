@@ -0,0 +1,89 @@
+import re
+import zlib
+from collections import Counter
+from bs4 import BeautifulSoup
+
+FINGERPRINT_BITS = 64
+# 汉明距离不超过 MAX_DISTANCE 视为近似重复；分成 MAX_DISTANCE + 1 段，
+# 由抽屉原理，距离 <= MAX_DISTANCE 的两个指纹至少有一段完全相同
+MAX_DISTANCE = 3
+SHINGLE_SIZE = 3
+# 文本过短时指纹不可靠（如空白页、跳转页），不参与去重
+MIN_TEXT_LENGTH = 100
+
+_SPACE_RE = re.compile(r'\s+')
+
+# 各页面共用的模板区域（导航、页眉页脚、侧栏等），不参与指纹
+BOILERPLATE_TAGS = ['script', 'style', 'noscript', 'nav', 'header', 'footer', 'aside', 'form']
+# 正文容器，按顺序取第一个存在的；WebPlus 站点的正文区为 wp_articlecontent / vsb_content
+MAIN_CONTENT_SELECTORS = ['article', 'main', 'div.wp_articlecontent', '#vsb_content', 'div.content']
+
+def main_content_text(content):
+    """提取页面主体文本，用于爬取阶段计算指纹
+
+    去掉模板区域后优先使用正文容器，没有时使用整个 body，避免同一模板下的不同短文章
+    因为共用的导航和页脚文本而被判为近似重复。
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='ignore')
+    soup = BeautifulSoup(content, 'lxml')
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    main = next((node for node in map(soup.select_one, MAIN_CONTENT_SELECTORS) if node is not None), None)
+    main = main or soup.body or soup
+    return _SPACE_RE.sub(' ', main.get_text(' ')).strip()
+
+def simhash(text):
+    """64 位 SimHash：特征为去空白后的字符 3-gram，按出现次数加权
+
+    文本过短时返回 None。
+    """
+    text = _SPACE_RE.sub('', text or '')
+    if len(text) < MIN_TEXT_LENGTH:
+        return None
+    shingles = Counter(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+    total = sum(shingles.values())
+    weights = [0] * FINGERPRINT_BITS
+    for shingle, weight in shingles.items():
+        data = shingle.encode('utf-8')
+        # 两个不同初值的 crc32 拼成稳定的 64 位哈希（跨进程一致，可持久化）
+        h = (zlib.crc32(data) << 32) | zlib.crc32(data, 0x9747b28c)
+        i = 0
+        while h:
+            if h & 1:
+                weights[i] += weight
+            h >>= 1
+            i += 1
+    fingerprint = 0
+    for i, w in enumerate(weights):
+        if 2 * w > total:
+            fingerprint |= 1 << i
+    return fingerprint
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class SimHashIndex:
+    """分段查找表：按段值索引指纹，只对同段候选计算汉明距离"""
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.num_bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.num_bands
+        self.band_mask = (1 << self.band_bits) - 1
+        self.tables = [{} for _ in range(self.num_bands)]
+
+    def _bands(self, fingerprint):
+        for i in range(self.num_bands):
+            yield i, (fingerprint >> (i * self.band_bits)) & self.band_mask
+
+    def find(self, fingerprint):
+        """返回一个近似重复文档的 key，没有时返回 None"""
+        for i, band in self._bands(fingerprint):
+            for other, key in self.tables[i].get(band, ()):
+                if hamming_distance(fingerprint, other) <= self.max_distance:
+                    return key
+        return None
+
+    def add(self, fingerprint, key):
+        for i, band in self._bands(fingerprint):
+            self.tables[i].setdefault(band, []).append((fingerprint, key))
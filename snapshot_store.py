@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import mmap
+import zlib
+import hashlib
+import threading
+import logging
+
+try:
+    import zstandard
+except ImportError:  # zstd 可选，未安装时使用 zlib 压缩
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 单个 pack 文件的最大字节数，超过后滚动到新文件
+PACK_MAX_BYTES = 256 * 1024 * 1024
+PACK_DIR = 'packs'
+INDEX_FILE = 'index.jsonl'
+RECORD_MAGIC = b'WPK1 '
+
+# 已经是压缩格式的文件类型直接存储
+RAW_FILE_TYPES = {'pdf', 'doc', 'docx', 'jpg', 'png', 'xls', 'xlsx'}
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == 'zlib':
+        return zlib.compress(data, 6)
+    return data
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    # 'gzip' 为早期版本对 zlib 数据流的误标，读取时按 zlib 处理
+    if codec in ('zlib', 'gzip'):
+        return zlib.decompress(data)
+    return data
+
+def snapshot_key(url, file_type):
+    """URL 对应的存储 key：HTML 为 pages/<md5>.html，其他文件为 files/<md5>.<类型>"""
+    url_hash = hashlib.md5(url.encode()).hexdigest()
+    if file_type == 'html':
+        return f'pages/{url_hash}.html'
+    return f'files/{url_hash}.{file_type}'
+
+class SnapshotStore:
+    """追加写入的压缩快照存储：多个 pack 文件 + 偏移索引，读取时使用 mmap 随机访问
+
+    每条记录在 pack 中的格式为 ``WPK1 <json 头>\\n<压缩数据>\\n``，头部包含 key、url、
+    编码和长度，即使索引丢失也可顺序扫描恢复。key 为相对 spider_data 的路径，
+    例如 ``pages/<md5>.html``。
+    """
+    def __init__(self, data_dir, writable=False):
+        self.root = os.path.join(data_dir, PACK_DIR)
+        self.index_path = os.path.join(self.root, INDEX_FILE)
+        self.writable = writable
+        self.entries = {}
+        self._index_pos = 0
+        self._maps = {}
+        self._lock = threading.Lock()
+        self._pack_file = None
+        self._index_file = None
+        self._index_buffer = []
+        if writable:
+            os.makedirs(self.root, exist_ok=True)
+        self.refresh()
+
+    def _pack_path(self, pack):
+        return os.path.join(self.root, f'pack-{pack:05d}.wpk')
+
+    def refresh(self):
+        """读取索引中新追加的条目（爬虫可能仍在写入）"""
+        if not os.path.exists(self.index_path):
+            return
+        with self._lock, open(self.index_path, 'rb') as f:
+            f.seek(self._index_pos)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # 写入中断的末行，等待下次刷新
+                self._index_pos += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.entries[entry['key']] = entry
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def size(self, key):
+        entry = self.entries.get(key)
+        return entry['size'] if entry else None
+
+    def _mapping(self, pack, end):
+        mm = self._maps.get(pack)
+        if mm is None or len(mm) < end:
+            # 首次访问或 pack 在映射后继续增长时重新映射
+            if mm is not None:
+                mm.close()
+            with open(self._pack_path(pack), 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[pack] = mm
+        return mm
+
+    def get(self, key):
+        """返回 key 对应的原始字节，不存在时返回 None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        with self._lock:
+            if self._pack_file:
+                self._pack_file.flush()
+            start = entry['offset']
+            end = start + entry['length']
+            data = self._mapping(entry['pack'], end)[start:end]
+        return _decompress(data, entry['codec'])
+
+    def _open_for_append(self):
+        packs = sorted(int(name[5:10]) for name in os.listdir(self.root)
+                       if name.startswith('pack-') and name.endswith('.wpk'))
+        pack = packs[-1] if packs else 0
+        if os.path.exists(self._pack_path(pack)) and os.path.getsize(self._pack_path(pack)) >= PACK_MAX_BYTES:
+            pack += 1
+        self._pack = pack
+        self._pack_file = open(self._pack_path(pack), 'ab')
+        self._index_file = open(self.index_path, 'ab')
+
+    def put(self, key, data, url=None, file_type=None, flush=True):
+        """追加一条记录并写入索引；批量写入时可传 flush=False，最后调用 flush()"""
+        assert self.writable, "SnapshotStore opened read-only"
+        if file_type in RAW_FILE_TYPES:
+            codec = 'raw'
+        else:
+            codec = 'zstd' if zstandard else 'zlib'
+        payload = _compress(data, codec)
+        with self._lock:
+            if self._pack_file is None:
+                self._open_for_append()
+            elif self._pack_file.tell() >= PACK_MAX_BYTES:
+                self._pack_file.close()
+                self._pack += 1
+                self._pack_file = open(self._pack_path(self._pack), 'ab')
+            header = json.dumps({'key': key, 'url': url, 'codec': codec, 'length': len(payload), 'size': len(data)},
+                                ensure_ascii=False).encode('utf-8')
+            self._pack_file.write(RECORD_MAGIC + header + b'\n')
+            offset = self._pack_file.tell()
+            self._pack_file.write(payload + b'\n')
+            entry = {'key': key, 'pack': self._pack, 'offset': offset, 'length': len(payload),
+                     'size': len(data), 'codec': codec}
+            self._index_buffer.append(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.entries[key] = entry
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """先落盘数据再写索引，崩溃时最多丢失索引末尾几行"""
+        with self._lock:
+            if self._pack_file is None:
+                return
+            self._pack_file.flush()
+            if self._index_buffer:
+                self._index_file.write(b''.join(self._index_buffer))
+                self._index_file.flush()
+                self._index_buffer = []
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            for f in (self._pack_file, self._index_file):
+                if f:
+                    f.close()
+            self._pack_file = self._index_file = None
+            for mm in self._maps.values():
+                mm.close()
+            self._maps.clear()
+
+_stores = {}
+
+def open_store(data_dir):
+    """返回当前进程共享的只读存储（多进程解析时每个子进程各自打开 mmap）"""
+    key = (os.getpid(), os.path.abspath(data_dir))
+    store = _stores.get(key)
+    if store is None:
+        store = SnapshotStore(data_dir)
+        _stores[key] = store
+    return store
+
+def read_snapshot(data_dir, relpath):
+    """读取快照：优先使用旧的独立文件，其次从 pack 存储读取"""
+    file_path = os.path.join(data_dir, relpath)
+    if os.path.isfile(file_path):
+        with open(file_path, 'rb') as f:
+            return f.read()
+    store = open_store(data_dir)
+    key = relpath.replace(os.sep, '/')
+    if key not in store:
+        store.refresh()
+    return store.get(key)
+
+def snapshot_size(data_dir, relpath):
+    """快照大小（字节），不存在时返回 None"""
+    file_path = os.path.join(data_dir, relpath)
+    if os.path.isfile(file_path):
+        return os.path.getsize(file_path)
+    return open_store(data_dir).size(relpath.replace(os.sep, '/'))
+
+def convert_directory(data_dir, remove=False):
+    """把 pages/ 和 files/ 下已有的独立文件迁移到 pack 存储"""
+    store = SnapshotStore(data_dir, writable=True)
+    converted = 0
+    try:
+        for folder in ('pages', 'files'):
+            folder_path = os.path.join(data_dir, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for filename in sorted(os.listdir(folder_path)):
+                key = f'{folder}/{filename}'
+                file_path = os.path.join(folder_path, filename)
+                if key not in store:
+                    with open(file_path, 'rb') as f:
+                        store.put(key, f.read(), file_type=filename.rsplit('.', 1)[-1].lower())
+                    converted += 1
+                if remove:
+                    os.remove(file_path)
+    finally:
+        store.close()
+    print(f"Converted {converted} files into {store.root} ({len(store)} records)")
+
+if __name__ == "__main__":
+    # 用法: python snapshot_store.py [spider_data] [--remove]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    convert_directory(args[0] if args else 'spider_data', remove='--remove' in sys.argv)
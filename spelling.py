@@ -0,0 +1,163 @@
+import os
+import mmap
+import zlib
+import struct
+from array import array
+from bisect import bisect_left
+from whoosh.index import open_dir
+
+# SymSpell 式对称删除纠错词典，索引构建时生成，服务端 mmap 只读加载
+SPELLING_FILE = 'spelling.dict'
+MAGIC = b'SYMSPEL1'
+# 头部：魔数、最大编辑距离、前缀长度、词数、删除变体数
+HEADER = struct.Struct('<8sIIII')
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7
+MIN_TERM_FREQUENCY = 2
+MAX_TERM_LENGTH = 20
+LEXICON_FIELDS = ('title', 'content')
+
+def _hash(text):
+    data = text.encode('utf-8')
+    return (zlib.crc32(data) << 32) | zlib.crc32(data, 0x9747b28c)
+
+def _deletes(word, max_distance):
+    """删除至多 max_distance 个字符得到的所有变体（含原词），不生成空串"""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        result |= frontier
+    return result
+
+def edit_distance(a, b, max_distance):
+    """限制最大值的 OSA（相邻换位）编辑距离，超过 max_distance 时返回 max_distance + 1"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev_prev = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev_prev is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev_prev[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev_prev, prev = prev, cur
+    return prev[-1]
+
+def collect_lexicon(index_dirs):
+    """汇总各索引中标题和正文字段的词频"""
+    frequencies = {}
+    for index_dir in index_dirs:
+        with open_dir(index_dir).reader() as reader:
+            for fieldname in LEXICON_FIELDS:
+                for text in reader.lexicon(fieldname):
+                    term = text.decode('utf-8')
+                    frequencies[term] = frequencies.get(term, 0) + int(reader.frequency(fieldname, text))
+    return frequencies
+
+def build_spelling_dictionary(index_dirs, output_path, max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH):
+    """从索引词典生成纠错词典文件，返回收录的词数"""
+    frequencies = collect_lexicon(index_dirs)
+    # 只收录含文字的词，排除空白、标点和纯数字
+    terms = sorted(term for term, freq in frequencies.items()
+                   if freq >= MIN_TERM_FREQUENCY and len(term) <= MAX_TERM_LENGTH
+                   and any(ch.isalpha() for ch in term) and term == term.strip())
+    pairs = sorted((_hash(variant), term_id)
+                   for term_id, term in enumerate(terms)
+                   for variant in _deletes(term[:prefix_length], max_distance))
+    blob = b''.join(term.encode('utf-8') for term in terms)
+    offsets = [0]
+    for term in terms:
+        offsets.append(offsets[-1] + len(term.encode('utf-8')))
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, max_distance, prefix_length, len(terms), len(pairs)))
+        f.write(array('Q', (key for key, _ in pairs)).tobytes())
+        f.write(array('I', (term_id for _, term_id in pairs)).tobytes())
+        f.write(array('I', offsets).tobytes())
+        f.write(array('I', (min(frequencies[term], 0xffffffff) for term in terms)).tobytes())
+        f.write(blob)
+    os.replace(tmp_path, output_path)
+    return len(terms)
+
+class SpellingDictionary:
+    """mmap 只读加载的纠错词典：删除变体哈希有序数组 + 词表，查询只做二分查找和少量编辑距离计算"""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_distance, self.prefix_length, num_terms, num_deletes = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a spelling dictionary: {path}")
+        view = self._view = memoryview(self._mm)
+        pos = HEADER.size
+        self._keys = view[pos:pos + 8 * num_deletes].cast('Q')
+        pos += 8 * num_deletes
+        self._values = view[pos:pos + 4 * num_deletes].cast('I')
+        pos += 4 * num_deletes
+        self._offsets = view[pos:pos + 4 * (num_terms + 1)].cast('I')
+        pos += 4 * (num_terms + 1)
+        self._freqs = view[pos:pos + 4 * num_terms].cast('I')
+        pos += 4 * num_terms
+        self._blob = pos
+        self.num_terms = num_terms
+
+    def __len__(self):
+        return self.num_terms
+
+    def term(self, term_id):
+        start = self._blob + self._offsets[term_id]
+        end = self._blob + self._offsets[term_id + 1]
+        return self._mm[start:end].decode('utf-8')
+
+    def __contains__(self, word):
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self.num_terms and self.term(lo) == word
+
+    def lookup(self, word):
+        """返回编辑距离最小的纠正词，词已收录或找不到候选时返回 None"""
+        if word in self:
+            return None
+        # 短词只允许较小的编辑距离（两个字的中文词最多改一个字）
+        max_distance = min(self.max_distance, len(word) // 2)
+        if max_distance == 0:
+            return None
+        best = None
+        seen = set()
+        for variant in _deletes(word[:self.prefix_length], max_distance):
+            key = _hash(variant)
+            i = bisect_left(self._keys, key)
+            while i < len(self._keys) and self._keys[i] == key:
+                term_id = self._values[i]
+                i += 1
+                if term_id in seen:
+                    continue
+                seen.add(term_id)
+                candidate = self.term(term_id)
+                distance = edit_distance(word, candidate, max_distance)
+                if distance <= max_distance:
+                    # 距离相同时优先等长候选（错字比漏字常见），其次词频高者
+                    rank = (distance, abs(len(candidate) - len(word)), -self._freqs[term_id])
+                    if best is None or rank < best[0]:
+                        best = (rank, candidate)
+        return best[1] if best else None
+
+    def close(self):
+        self._keys.release()
+        self._values.release()
+        self._offsets.release()
+        self._freqs.release()
+        self._view.release()
+        self._mm.close()
+        self._file.close()
@@ -0,0 +1,53 @@
+import threading
+import pytest
+from admission import (AdmissionController, Overloaded, CHEAP, EXPENSIVE, EXPENSIVE_COST,
+                       wildcard_prefix, estimate_cost, personalization_cost, cost_class)
+
+def test_wildcard_prefix():
+    assert wildcard_prefix('南开 大学') is None
+    assert wildcard_prefix('南开 计算*') == '计算'
+    assert wildcard_prefix('*学院') == ''
+    assert wildcard_prefix('数?学') == '数'
+
+def test_estimate_cost_and_class():
+    assert estimate_cost('南开') == 1.0
+    assert estimate_cost('南开 大学 图书馆') == 2.0
+    assert estimate_cost('南开 大学', is_phrase=True) > estimate_cost('南开 大学')
+    assert cost_class(estimate_cost('*学院')) == EXPENSIVE
+    assert estimate_cost('计算*', expansion=500) > estimate_cost('计算*', expansion=10)
+    assert cost_class(1.0) == CHEAP and cost_class(EXPENSIVE_COST) == EXPENSIVE
+    assert personalization_cost(200) == 2.0
+
+def test_admits_up_to_limit_and_sheds_when_queue_full():
+    controller = AdmissionController(limits={CHEAP: 1, EXPENSIVE: 1}, queue_limits={CHEAP: 0, EXPENSIVE: 0})
+    ticket = controller.acquire(CHEAP)
+    assert not ticket.degraded
+    with pytest.raises(Overloaded) as excinfo:
+        controller.acquire(CHEAP)
+    assert excinfo.value.retry_after >= 1
+    # 两类查询互不占用配额
+    controller.acquire(EXPENSIVE).release()
+    ticket.release()
+    ticket.release()  # 重复释放无影响
+    metrics = controller.metrics()[CHEAP]
+    assert metrics['in_flight'] == 0 and metrics['admitted'] == 1 and metrics['shed'] == 1
+
+def test_queued_request_is_degraded():
+    controller = AdmissionController(limits={CHEAP: 1, EXPENSIVE: 1}, queue_timeout=5.0)
+    held = controller.acquire(CHEAP)
+    timer = threading.Timer(0.1, held.release)
+    timer.start()
+    with controller.acquire(CHEAP) as ticket:
+        assert ticket.degraded
+    timer.join()
+    metrics = controller.metrics()[CHEAP]
+    assert metrics['degraded'] == 1 and metrics['in_flight'] == 0 and metrics['queue_depth'] == 0
+
+def test_queue_timeout_sheds():
+    controller = AdmissionController(limits={CHEAP: 1, EXPENSIVE: 1}, queue_timeout=0.05)
+    held = controller.acquire(CHEAP)
+    with pytest.raises(Overloaded):
+        controller.acquire(CHEAP)
+    held.release()
+    metrics = controller.metrics()[CHEAP]
+    assert metrics['timed_out'] == 1 and metrics['queue_depth'] == 0
@@ -0,0 +1,52 @@
+import os
+import pytest
+import doc_store
+from doc_store import DocStoreWriter, DocStore, open_doc_store, doc_store_size, DATA_FILE, OFFSETS_FILE
+
+def write_store(store_dir, texts, codec='zlib'):
+    writer = DocStoreWriter(store_dir, codec=codec)
+    ids = [writer.add(text) for text in texts]
+    writer.close()
+    return ids, writer
+
+def test_round_trip_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_store, 'BLOCK_SIZE', 64)
+    texts = [f'南开大学第{i}篇文档 ' * (i % 5 + 1) for i in range(50)] + ['', None]
+    ids, writer = write_store(str(tmp_path), texts)
+    assert ids == list(range(len(texts)))
+    store = DocStore(str(tmp_path))
+    try:
+        assert len(store) == len(texts)
+        assert store.num_blocks > 1
+        assert [store.get(i) for i in ids] == [text or '' for text in texts]
+        assert store.get(None) is None and store.get(-1) is None and store.get(len(texts)) is None
+    finally:
+        store.close()
+    assert writer.raw_bytes == sum(len((text or '').encode('utf-8')) for text in texts)
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+
+def test_empty_store(tmp_path):
+    write_store(str(tmp_path), [])
+    store = DocStore(str(tmp_path))
+    assert len(store) == 0 and store.get(0) is None
+    store.close()
+
+def test_compresses_repetitive_text(tmp_path):
+    _, writer = write_store(str(tmp_path), ['计算机学院新闻 ' * 200] * 20)
+    assert doc_store_size(str(tmp_path)) < writer.raw_bytes / 10
+
+def test_rejects_other_files(tmp_path):
+    (tmp_path / OFFSETS_FILE).write_bytes(b'\0' * 64)
+    (tmp_path / DATA_FILE).write_bytes(b'')
+    with pytest.raises(ValueError):
+        DocStore(str(tmp_path))
+
+def test_open_doc_store_reopens_after_rebuild(tmp_path):
+    store_dir = str(tmp_path)
+    assert open_doc_store(store_dir) is None
+    write_store(store_dir, ['旧'])
+    first = open_doc_store(store_dir)
+    assert open_doc_store(store_dir) is first
+    write_store(store_dir, ['新'])
+    os.utime(os.path.join(store_dir, OFFSETS_FILE), (1e9, 1e9))
+    assert open_doc_store(store_dir).get(0) == '新'
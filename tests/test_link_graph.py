@@ -0,0 +1,44 @@
+import link_graph
+from cachetools import LRUCache
+from whoosh.index import create_in
+from whoosh.fields import Schema, ID, TEXT, NUMERIC
+from whoosh.query import Term
+from link_graph import compute_link_scores, max_pagerank, QualityBM25F, PAGERANK_SCALE
+
+def test_compute_link_scores():
+    metadata = [
+        {'url': 'https://a/', 'outlinks': ['https://b/', 'https://c/', 'https://outside/']},
+        {'url': 'https://b/', 'outlinks': ['https://c/', 'https://b/']},
+        {'url': 'https://c/', 'outlinks': []},
+    ]
+    scores = compute_link_scores(metadata)
+    assert [scores[url]['indegree'] for url in ('https://a/', 'https://b/', 'https://c/')] == [0, 1, 2]
+    assert scores['https://c/']['pagerank'] > scores['https://b/']['pagerank'] > scores['https://a/']['pagerank']
+    # 缩放后平均值约为 PAGERANK_SCALE
+    assert abs(sum(s['pagerank'] for s in scores.values()) / 3 - PAGERANK_SCALE) <= 1
+    assert compute_link_scores([]) == {}
+
+def make_index(path, pageranks):
+    ix = create_in(str(path), Schema(url=ID(stored=True), content=TEXT,
+                                     pagerank=NUMERIC(int, sortable=True, default=PAGERANK_SCALE)))
+    writer = ix.writer()
+    for i, pagerank in enumerate(pageranks):
+        writer.add_document(url=f'https://a/{i}', content='南开 news', pagerank=pagerank)
+    writer.commit()
+    return ix
+
+def test_quality_boost_orders_equal_matches(tmp_path):
+    ix = make_index(tmp_path, [500, 4000, 1000])
+    with ix.searcher(weighting=QualityBM25F()) as searcher:
+        hits = searcher.search(Term('content', 'news'))
+        assert [hit['url'] for hit in hits] == ['https://a/1', 'https://a/2', 'https://a/0']
+
+def test_max_pagerank_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(link_graph, '_segment_max_pagerank', LRUCache(maxsize=2))
+    for i in range(4):
+        (tmp_path / str(i)).mkdir()
+        ix = make_index(tmp_path / str(i), [100 * (i + 1), 50])
+        with ix.reader() as reader:
+            assert max_pagerank(reader) == 100 * (i + 1)
+            assert max_pagerank(reader) == 100 * (i + 1)
+    assert len(link_graph._segment_max_pagerank) == 2
@@ -0,0 +1,63 @@
+import os
+import json
+from metadata_journal import (MetadataJournal, MetadataSource, JOURNAL_FILE, LEGACY_METADATA_FILE,
+                              iter_metadata, truncate_torn_line)
+
+def test_append_and_iterate(tmp_path):
+    journal = MetadataJournal(str(tmp_path))
+    journal.append({'url': 'https://a/', 'filename': 'a.html'})
+    journal.append({'url': 'https://b/', 'filename': 'b.html'})
+    journal.close()
+    assert [entry['url'] for entry in iter_metadata(str(tmp_path))] == ['https://a/', 'https://b/']
+
+def test_latest_entry_per_url_wins(tmp_path):
+    journal = MetadataJournal(str(tmp_path))
+    journal.append({'url': 'https://a/', 'version': 1})
+    journal.append({'url': 'https://b/', 'version': 1})
+    journal.append({'url': 'https://a/', 'version': 2})
+    journal.close()
+    entries = list(iter_metadata(str(tmp_path)))
+    assert [(entry['url'], entry['version']) for entry in entries] == [('https://b/', 1), ('https://a/', 2)]
+
+def test_reopen_truncates_torn_last_line(tmp_path):
+    journal = MetadataJournal(str(tmp_path))
+    journal.append({'url': 'https://a/'})
+    journal.close()
+    path = os.path.join(str(tmp_path), JOURNAL_FILE)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"url": "https://torn')
+
+    # 崩溃后续写：新记录必须从新的一行开始，不能和残行一起被丢弃
+    journal = MetadataJournal(str(tmp_path))
+    journal.append({'url': 'https://b/'})
+    journal.close()
+    assert [entry['url'] for entry in iter_metadata(str(tmp_path))] == ['https://a/', 'https://b/']
+
+def test_truncate_torn_line(tmp_path):
+    path = str(tmp_path / 'j.jsonl')
+    with open(path, 'wb') as f:
+        f.write(b'{"a": 1}\n' + b'x' * 10000)
+    assert truncate_torn_line(path, chunk_size=64) == 10000
+    assert open(path, 'rb').read() == b'{"a": 1}\n'
+    assert truncate_torn_line(path) == 0
+    with open(path, 'wb') as f:
+        f.write(b'partial')
+    truncate_torn_line(path)
+    assert os.path.getsize(path) == 0
+
+def test_migrates_legacy_metadata(tmp_path):
+    with open(os.path.join(str(tmp_path), LEGACY_METADATA_FILE), 'w', encoding='utf-8') as f:
+        json.dump([{'url': 'https://old/'}], f)
+    assert [entry['url'] for entry in iter_metadata(str(tmp_path))] == ['https://old/']
+    MetadataJournal(str(tmp_path)).close()
+    assert os.path.exists(os.path.join(str(tmp_path), JOURNAL_FILE))
+    assert [entry['url'] for entry in iter_metadata(str(tmp_path))] == ['https://old/']
+
+def test_metadata_source_is_reiterable_and_limited(tmp_path):
+    journal = MetadataJournal(str(tmp_path))
+    for i in range(5):
+        journal.append({'url': f'https://{i}/'})
+    journal.close()
+    source = MetadataSource(str(tmp_path), max_entries=3)
+    assert len(list(source)) == 3
+    assert len(list(source)) == 3
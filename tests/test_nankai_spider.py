@@ -0,0 +1,94 @@
+import hashlib
+from collections import Counter
+from types import SimpleNamespace
+from scrapy.http import HtmlResponse, Request
+from crawler.items import PageItem
+from crawler.spiders.nankai_spider import NankaiSpider
+from crawler.scheduling import CrawlPriorityPolicy
+from crawler.url_seen import URLSeenFilter
+from metadata_journal import MetadataJournal
+from snapshot_store import SnapshotStore, snapshot_key
+
+BODY = b'<html><body><a href="/a.htm">a</a><a href="https://other.nankai.edu.cn/b.htm">b</a></body></html>'
+
+class Stats(Counter):
+    def inc_value(self, key, count=1):
+        self[key] += count
+
+def make_spider(recrawl=False, host_budget=None):
+    spider = NankaiSpider(recrawl=recrawl)
+    spider.crawler = SimpleNamespace(stats=Stats())
+    spider.seen_urls = URLSeenFilter()
+    spider.policy = CrawlPriorityPolicy(host_budget=host_budget)
+    return spider
+
+def response(url, body=BODY, status=200, headers=None, redirect_urls=None):
+    request = Request(url, meta={'redirect_urls': redirect_urls} if redirect_urls else {})
+    return HtmlResponse(url=url, body=body, status=status, headers=headers or {}, request=request, encoding='utf-8')
+
+def split(output):
+    items = [x for x in output if isinstance(x, PageItem)]
+    return items, [x for x in output if isinstance(x, Request)]
+
+def test_over_budget_links_are_not_marked_seen():
+    spider = make_spider(host_budget=1)
+    items, requests = split(list(spider.parse(response('https://cs.nankai.edu.cn/'))))
+    assert len(items) == 1 and items[0]['outlinks'] == ['https://cs.nankai.edu.cn/a.htm', 'https://other.nankai.edu.cn/b.htm']
+    assert [r.url for r in requests] == ['https://cs.nankai.edu.cn/a.htm', 'https://other.nankai.edu.cn/b.htm']
+    # cs.nankai.edu.cn 的预算已用完：再次出现的新链接被拒绝，但不记为已见
+    page = response('https://other.nankai.edu.cn/b.htm', body=b'<a href="https://cs.nankai.edu.cn/c.htm">c</a>')
+    assert split(list(spider.parse(page)))[1] == []
+    assert 'https://cs.nankai.edu.cn/c.htm' not in spider.seen_urls
+    assert spider.crawler.stats['scheduler/host_budget_exceeded'] == 1
+    # 已调度的链接不会重复调度
+    assert split(list(spider.parse(response('https://other.nankai.edu.cn/', body=BODY))))[1] == []
+
+def recrawl_spider(tmp_path, monkeypatch, etag='"v1"'):
+    monkeypatch.chdir(tmp_path)
+    journal = MetadataJournal('spider_data')
+    journal.append({'url': 'https://cs.nankai.edu.cn/new.htm', 'request_url': 'https://cs.nankai.edu.cn/old.htm',
+                    'file_type': 'html', 'etag': etag, 'last_modified': None,
+                    'content_hash': hashlib.sha1(BODY).hexdigest()})
+    journal.close()
+    store = SnapshotStore('spider_data', writable=True)
+    store.put(snapshot_key('https://cs.nankai.edu.cn/new.htm', 'html'), BODY)
+    store.close()
+    spider = make_spider(recrawl=True)
+    spider.load_validators()
+    return spider
+
+def test_validators_are_keyed_by_request_url(tmp_path, monkeypatch):
+    spider = recrawl_spider(tmp_path, monkeypatch)
+    assert spider.conditional_headers('https://cs.nankai.edu.cn/old.htm') == {'If-None-Match': '"v1"'}
+    assert spider.conditional_headers('https://cs.nankai.edu.cn/new.htm') == {'If-None-Match': '"v1"'}
+    # 重定向后的 304：按快照跟进链接，不输出 item
+    not_modified = response('https://cs.nankai.edu.cn/new.htm', body=b'', status=304,
+                            redirect_urls=['https://cs.nankai.edu.cn/old.htm'])
+    items, requests = split(list(spider.parse(not_modified)))
+    assert not items and len(requests) == 2
+    assert spider.crawler.stats['recrawl/not_modified'] == 1
+
+def test_unchanged_body_with_same_validators_is_skipped(tmp_path, monkeypatch):
+    spider = recrawl_spider(tmp_path, monkeypatch)
+    page = response('https://cs.nankai.edu.cn/new.htm', headers={'ETag': '"v1"'},
+                    redirect_urls=['https://cs.nankai.edu.cn/old.htm'])
+    items, requests = split(list(spider.parse(page)))
+    assert not items and len(requests) == 2
+    assert spider.crawler.stats['recrawl/unchanged'] == 1
+
+def test_unchanged_body_with_new_validators_is_refreshed(tmp_path, monkeypatch):
+    spider = recrawl_spider(tmp_path, monkeypatch)
+    page = response('https://cs.nankai.edu.cn/new.htm', headers={'ETag': '"v2"'},
+                    redirect_urls=['https://cs.nankai.edu.cn/old.htm'])
+    items, _ = split(list(spider.parse(page)))
+    assert len(items) == 1
+    item = items[0]
+    assert item['unchanged'] and item['recrawled'] and item['etag'] == '"v2"'
+    assert item['request_url'] == 'https://cs.nankai.edu.cn/old.htm'
+    assert spider.crawler.stats['recrawl/validators_refreshed'] == 1
+
+def test_changed_body_is_saved(tmp_path, monkeypatch):
+    spider = recrawl_spider(tmp_path, monkeypatch)
+    page = response('https://cs.nankai.edu.cn/new.htm', body=BODY + b'<p>new</p>', headers={'ETag': '"v1"'})
+    items, _ = split(list(spider.parse(page)))
+    assert len(items) == 1 and not items[0]['unchanged'] and 'request_url' not in items[0]
@@ -0,0 +1,47 @@
+import personalization
+from personalization import CollaborativeIndex
+
+def fake_log(monkeypatch, entries, during_read=None):
+    def query_counts():
+        snapshot = {key: 1 for key in entries}
+        if during_read:
+            during_read.pop(0)()
+        return snapshot
+    monkeypatch.setattr(personalization.query_log, 'query_counts', query_counts)
+
+def test_add_during_rebuild_is_kept(monkeypatch):
+    index = CollaborativeIndex()
+    entries = [('alice', '图书馆')]
+
+    def concurrent_add():
+        entries.append(('bob', '食堂'))
+        index.add('bob', '食堂')
+
+    fake_log(monkeypatch, entries, [concurrent_add])
+    assert index.queries_by_user() == {'alice': frozenset({'图书馆'}), 'bob': frozenset({'食堂'})}
+    # 已保存的快照包含重建期间的新查询，不再读取日志
+    assert index.queries_by_user()['bob'] == frozenset({'食堂'})
+
+def test_invalidate_during_rebuild_rereads_log(monkeypatch):
+    index = CollaborativeIndex()
+    entries = [('alice', '图书馆'), ('alice', '食堂')]
+
+    def concurrent_delete():
+        entries.remove(('alice', '食堂'))
+        index.invalidate()
+
+    fake_log(monkeypatch, entries, [concurrent_delete])
+    assert index.queries_by_user() == {'alice': frozenset({'图书馆'})}
+    entries.append(('alice', '食堂'))
+    assert index.queries_by_user() == {'alice': frozenset({'图书馆'})}  # 重新读取的结果已保存
+
+def test_add_before_invalidate_is_not_replayed(monkeypatch):
+    index = CollaborativeIndex()
+    entries = [('alice', '图书馆')]
+
+    def add_then_delete():
+        index.add('alice', '食堂')
+        index.invalidate()
+
+    fake_log(monkeypatch, entries, [add_then_delete])
+    assert index.queries_by_user() == {'alice': frozenset({'图书馆'})}
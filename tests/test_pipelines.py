@@ -0,0 +1,52 @@
+import threading
+from types import SimpleNamespace
+from scrapy.settings import Settings
+from crawler.pipelines import SaveContentPipeline
+from metadata_journal import iter_metadata
+
+def make_pipeline(tmp_path, monkeypatch, **settings):
+    monkeypatch.chdir(tmp_path)
+    crawler = SimpleNamespace(settings=Settings(settings), stats=None, spider=None)
+    return SaveContentPipeline(crawler)
+
+def html_item(url, body='<html><body><p>正文</p></body></html>'):
+    return {'url': url, 'content': body.encode('utf-8'), 'file_type': 'html', 'outlinks': []}
+
+def test_same_key_is_written_once_under_concurrency(tmp_path, monkeypatch):
+    pipeline = make_pipeline(tmp_path, monkeypatch)
+    spider = SimpleNamespace(logger=SimpleNamespace(warning=print, debug=print))
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(pipeline.save_item(html_item('https://cs.nankai.edu.cn/a'), spider))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pipeline.store.close()
+    pipeline.journal.close()
+
+    assert results.count('saved') == 1
+    assert results.count('exists') == 7
+    assert len(list(iter_metadata('spider_data'))) == 1
+    assert not pipeline.pending_keys
+
+def test_near_duplicate_keeps_outlinks(tmp_path, monkeypatch):
+    pipeline = make_pipeline(tmp_path, monkeypatch, SIMHASH_SKIP_NEAR_DUPLICATES=True)
+    spider = SimpleNamespace(logger=SimpleNamespace(warning=print, debug=lambda message: None))
+    article = '<html><body><article><p>' + '南开大学计算机学院新闻' * 30 + '</p></article></body></html>'
+    first, second = html_item('https://cs.nankai.edu.cn/a', article), html_item('https://cs.nankai.edu.cn/b', article)
+    second['outlinks'] = ['https://cs.nankai.edu.cn/c']
+    assert pipeline.save_item(first, spider) == 'saved'
+    assert pipeline.save_item(second, spider) == 'duplicate'
+    pipeline.store.close()
+    pipeline.journal.close()
+
+    entries = {entry['url']: entry for entry in iter_metadata('spider_data')}
+    assert entries['https://cs.nankai.edu.cn/b']['duplicate_of'] == 'https://cs.nankai.edu.cn/a'
+    assert entries['https://cs.nankai.edu.cn/b']['outlinks'] == ['https://cs.nankai.edu.cn/c']
+    assert entries['https://cs.nankai.edu.cn/b']['filename'] is None
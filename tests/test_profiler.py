@@ -0,0 +1,58 @@
+import sys
+import time
+from profiler import SamplingProfiler, frame_name
+
+def busy(duration):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        sum(range(100))
+    return 'done'
+
+def wait_for_sampler(profiler, timeout=2.0):
+    end = time.monotonic() + timeout
+    while profiler._thread is not None and time.monotonic() < end:
+        time.sleep(0.01)
+    return profiler._thread is None
+
+def test_sampler_starts_and_stops_with_request():
+    profiler = SamplingProfiler(interval=0.001)
+    assert profiler._thread is None
+    assert profiler.run('search', busy, 0.2) == 'done'
+    # 没有被分析的请求后采样线程自行退出
+    assert wait_for_sampler(profiler)
+    stats = profiler.stats()
+    assert stats['requests'] == 1 and stats['samples'] > 0 and stats['active'] == 0
+
+    lines = profiler.collapsed().splitlines()
+    assert lines
+    total = 0
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        frames = stack.split(';')
+        assert frames[0] == 'search' and frames[1] == frame_name(busy.__code__)
+        total += int(count)
+    assert total == stats['samples']
+    assert profiler.top_functions(1)[0]['total'] == total
+
+def test_disabled_profiler_never_samples():
+    profiler = SamplingProfiler()
+    assert not any(profiler.should_profile() for _ in range(100))
+    assert profiler.should_profile(forced=True)
+    profiler.configure(sample_rate=5)
+    assert profiler.sample_rate == 1.0 and profiler.should_profile()
+    assert profiler.collapsed() == '' and profiler.top_functions() == []
+
+def test_reset_clears_stacks():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.run('batch', busy, 0.05)
+    assert wait_for_sampler(profiler)
+    profiler.reset()
+    assert profiler.collapsed() == '' and profiler.stats()['samples'] == 0
+
+def test_sample_after_request_finished_is_ignored():
+    profiler = SamplingProfiler()
+    finished = []
+    profiler.run('search', lambda: finished.append(sys._getframe()))
+    # 采样线程拿到的根帧已不在当前栈中
+    profiler._record('search', sys._getframe(), finished[0])
+    assert profiler.stats()['samples'] == 0 and profiler.collapsed() == ''
@@ -0,0 +1,82 @@
+import os
+import json
+import datetime
+import query_log as query_log_module
+from query_log import QueryLog, _read_jsonl
+
+NOW = datetime.datetime(2026, 6, 1, 12, 0)
+
+def make_log(tmp_path):
+    return QueryLog(str(tmp_path / 'query_logs'), str(tmp_path / 'query_logs.json'))
+
+def entry(username, query, days_ago):
+    return {'username': username, 'query': query, 'timestamp': (NOW - datetime.timedelta(days=days_ago)).isoformat()}
+
+def test_migrates_legacy_file(tmp_path):
+    with open(tmp_path / 'query_logs.json', 'w', encoding='utf-8') as f:
+        json.dump([entry('alice', '图书馆', 1), entry('bob', '食堂', 2)], f)
+    log = make_log(tmp_path)
+    assert log.query_counts() == {('alice', '图书馆'): 1, ('bob', '食堂'): 1}
+    assert len(os.listdir(tmp_path / 'query_logs')) == 2
+
+def test_compaction_keeps_counts(tmp_path):
+    log = make_log(tmp_path)
+    for days_ago in (60, 45, 40, 2):
+        log.append(entry('alice', '图书馆', days_ago))
+    log.append(entry('bob', '食堂', 50))
+    before = log.query_counts()
+    assert log.compact(now=NOW) == 4
+    assert log.query_counts() == before
+    assert [e['query'] for e in log.iter_entries()] == ['图书馆']
+    aggregated = {(e['username'], e['query']): e['count'] for e in log.iter_aggregates()}
+    assert aggregated == {('alice', '图书馆'): 3, ('bob', '食堂'): 1}
+    # 已压缩的分区被删除，再次压缩没有新分区
+    assert log.compact(now=NOW) == 0
+
+def test_deletions_hide_and_compact_away(tmp_path):
+    log = make_log(tmp_path)
+    log.append(entry('alice', '图书馆', 60))
+    log.append(entry('alice', '食堂', 60))
+    log.compact(now=NOW)
+    log.append(entry('alice', '图书馆', 1))
+    log.delete('alice', '图书馆')
+    assert log.query_counts('alice') == {('alice', '食堂'): 1}
+    log.compact(now=NOW)
+    assert log.query_counts('alice') == {('alice', '食堂'): 1}
+    # 删除之后的新查询不受影响
+    log.append({'username': 'alice', 'query': '图书馆', 'timestamp': datetime.datetime.now().isoformat()})
+    assert log.query_counts('alice')[('alice', '图书馆')] == 1
+    log.delete('alice')
+    assert not log.query_counts('alice')
+
+def test_retention_drops_old_aggregates(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_log_module, 'RETENTION_DAYS', 90)
+    log = make_log(tmp_path)
+    log.append(entry('alice', '旧查询', 120))
+    log.append(entry('alice', '新查询', 60))
+    log.compact(now=NOW)
+    assert log.query_counts() == {('alice', '新查询'): 1}
+
+def test_read_jsonl_tolerates_missing_and_torn_files(tmp_path):
+    assert list(_read_jsonl(str(tmp_path / 'missing.jsonl'))) == []
+    path = tmp_path / 'torn.jsonl'
+    path.write_text('{"a": 1}\n\n{"a": 2', encoding='utf-8')
+    assert list(_read_jsonl(str(path))) == [{'a': 1}]
+
+def test_history_rereads_after_concurrent_compaction(tmp_path, monkeypatch):
+    log = make_log(tmp_path)
+    log.append(entry('alice', '图书馆', 60))
+    log.append(entry('alice', '图书馆', 1))
+    iter_entries = log.iter_entries
+    calls = []
+
+    def racing_iter_entries(*args, **kwargs):
+        # 第一次读取分区前，压缩把旧分区并入聚合并删除
+        if not calls:
+            log.compact(now=NOW)
+        calls.append(1)
+        return iter_entries(*args, **kwargs)
+
+    monkeypatch.setattr(log, 'iter_entries', racing_iter_entries)
+    assert log.query_counts() == {('alice', '图书馆'): 2}
+    assert len(calls) == 2
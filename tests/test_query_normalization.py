@@ -0,0 +1,24 @@
+from query_normalization import normalize_query, is_plain_query, canonical_query
+
+def test_normalize_query_keeps_word_order():
+    assert normalize_query('  Ｎａｎｋａｉ　计算机   学院 ') == 'nankai 计算机 学院'
+    assert normalize_query('计算机学院') == '计算机学院'
+    # 布尔运算符区分大小写，不做小写
+    assert normalize_query('Nankai  AND  大学') == 'Nankai AND 大学'
+    assert normalize_query(None) == ''
+
+def test_is_plain_query():
+    assert is_plain_query('南开 大学')
+    assert not is_plain_query('计算*')
+    assert not is_plain_query('title:南开')
+    assert not is_plain_query('南开 OR 天津')
+
+def test_canonical_query_ignores_order_and_spacing():
+    assert canonical_query('计算机学院') == canonical_query('学院 计算机')
+    assert canonical_query('南开 大学') == canonical_query('南开大学')
+    assert canonical_query('人工智能 人工智能') == canonical_query('人工智能')
+
+def test_canonical_query_leaves_syntax_and_phrases():
+    assert canonical_query('学院 计算机', is_phrase=True) == '学院 计算机'
+    assert canonical_query('计算* 学院') == '计算* 学院'
+    assert canonical_query('') == ''
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+from scipy import sparse
+from whoosh.index import create_in
+from whoosh.fields import Schema, ID, TEXT
+from related import tfidf, lsa, nearest_neighbors, build_related_index, RelatedIndex, RELATED_DIR
+
+TOPICS = {
+    'library': 'library books reading borrow catalog shelves',
+    'sports': 'football match stadium team coach league',
+    'physics': 'quantum particle energy laser optics experiment',
+}
+
+def test_tfidf_rows_are_unit_length():
+    matrix = sparse.csr_matrix(np.array([[1, 2, 0], [0, 0, 0], [3, 0, 1]], dtype=np.float32))
+    norms = np.sqrt(np.asarray(tfidf(matrix).multiply(tfidf(matrix)).sum(axis=1)).ravel())
+    assert np.allclose(norms, [1.0, 0.0, 1.0])
+
+def test_lsa_handles_tiny_matrices():
+    assert lsa(sparse.csr_matrix((1, 1), dtype=np.float32)).shape == (1, 0)
+    vectors = lsa(tfidf(sparse.random(20, 30, density=0.3, format='csr', random_state=1, dtype=np.float32)), dimensions=5)
+    assert vectors.shape == (20, 5)
+
+def test_nearest_neighbors_finds_similar_rows():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((2, 16))
+    vectors = np.vstack([centers[i % 2] + 0.05 * rng.standard_normal(16) for i in range(40)]).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1)[:, None]
+    neighbors, scores = nearest_neighbors(vectors, k=3)
+    assert neighbors.shape == (40, 3)
+    for row in range(40):
+        found = neighbors[row][neighbors[row] >= 0]
+        assert len(found) and row not in found
+        assert all(n % 2 == row % 2 for n in found)
+        assert list(scores[row][:len(found)]) == sorted(scores[row][:len(found)], reverse=True)
+
+def test_nearest_neighbors_pads_when_nothing_to_compare():
+    neighbors, scores = nearest_neighbors(np.ones((1, 4), dtype=np.float32), k=2)
+    assert (neighbors == -1).all() and (scores == 0).all()
+
+def test_build_and_query(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    os.makedirs(index_dir)
+    ix = create_in(index_dir, Schema(url=ID(stored=True, unique=True), title=TEXT(stored=True), content=TEXT))
+    writer = ix.writer()
+    for topic, words in TOPICS.items():
+        for i in range(6):
+            writer.add_document(url=f'https://{topic}.nankai.edu.cn/{i}', title=f'{topic} {i}',
+                                content=f'{words} {words.split()[i]} news{i}')
+    writer.commit()
+    output_dir = str(tmp_path / RELATED_DIR)
+    assert build_related_index([index_dir], output_dir, k=3) == 18
+    related = RelatedIndex(output_dir)
+    assert len(related) == 18
+    assert related.related('https://missing/') is None
+    results = related.related('https://sports.nankai.edu.cn/0', k=3)
+    assert results and all(r['url'].startswith('https://sports.') for r in results)
+    assert len(related.related('https://sports.nankai.edu.cn/0', k=1)) <= 1
+    # 重建时替换已有目录
+    assert build_related_index([index_dir], output_dir, k=3) == 18
+
+def test_rebuild_swaps_directories(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / 'index')
+    os.makedirs(index_dir)
+    ix = create_in(index_dir, Schema(url=ID(stored=True, unique=True), title=TEXT(stored=True), content=TEXT))
+    writer = ix.writer()
+    for i in range(6):
+        writer.add_document(url=f'https://lib.nankai.edu.cn/{i}', title=f'library {i}', content=TOPICS['library'])
+    writer.commit()
+    output_dir = str(tmp_path / RELATED_DIR)
+    build_related_index([index_dir], output_dir, k=3)
+    loaded = RelatedIndex(output_dir)
+    os.makedirs(output_dir + '.tmp')  # 上次构建中断的残留
+
+    replaced = []
+    real_replace = os.replace
+    def replace(src, dst):
+        # 每次改名时旧索引的文件都完整存在
+        old = output_dir if os.path.isdir(output_dir) else output_dir + '.old'
+        replaced.append((os.path.basename(src), os.path.basename(dst), sorted(os.listdir(old))))
+        real_replace(src, dst)
+    monkeypatch.setattr(os, 'replace', replace)
+    build_related_index([index_dir], output_dir, k=3)
+
+    files = sorted(['docs.json', 'neighbors.npy', 'scores.npy'])
+    assert replaced == [(RELATED_DIR, RELATED_DIR + '.old', files), (RELATED_DIR + '.tmp', RELATED_DIR, files)]
+    assert sorted(os.listdir(tmp_path)) == ['index', RELATED_DIR]
+    assert loaded.related('https://lib.nankai.edu.cn/0', k=3) is not None
+    assert len(RelatedIndex(output_dir)) == 6
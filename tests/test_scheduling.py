@@ -0,0 +1,35 @@
+from crawler.scheduling import CrawlPriorityPolicy, DEPTH_PENALTY
+
+def test_priority_prefers_home_list_and_fresh_pages():
+    policy = CrawlPriorityPolicy(fresh_years=1)
+    year = policy.fresh_since + 1
+    home = policy.priority('https://cs.nankai.edu.cn/')
+    listing = policy.priority('https://cs.nankai.edu.cn/xwdt/list.htm')
+    deep_listing = policy.priority('https://cs.nankai.edu.cn/xwdt/list30.htm')
+    fresh = policy.priority(f'https://cs.nankai.edu.cn/{year}/0301/c1a2/page.htm')
+    archive = policy.priority('https://cs.nankai.edu.cn/2009/0301/c1a2/page.htm')
+    attachment = policy.priority('https://cs.nankai.edu.cn/a.pdf', is_file=True)
+    assert home > listing > fresh > archive > attachment
+    assert listing > deep_listing
+    assert policy.priority('https://cs.nankai.edu.cn/', depth=2) == home - 2 * DEPTH_PENALTY
+
+def test_host_error_and_change_rates_adjust_priority():
+    policy = CrawlPriorityPolicy()
+    url = 'https://cs.nankai.edu.cn/info/1.htm'
+    other = 'https://math.nankai.edu.cn/info/1.htm'
+    assert policy.priority(url) == policy.priority(other)
+    for _ in range(10):
+        policy.record_response(url, 429)
+        policy.record_change(other, True)
+    assert policy.priority(url) < policy.priority(other)
+    policy.record_response(other, 200)
+    assert policy.hosts['math.nankai.edu.cn'].error_rate == 0
+
+def test_host_budget_counts_only_allowed_requests():
+    policy = CrawlPriorityPolicy(host_budget=2)
+    assert policy.allow('https://cs.nankai.edu.cn/1')
+    assert policy.allow('https://CS.nankai.edu.cn/2')
+    assert not policy.allow('https://cs.nankai.edu.cn/3')
+    assert policy.hosts['cs.nankai.edu.cn'].scheduled == 2
+    assert policy.allow('https://math.nankai.edu.cn/1')
+    assert CrawlPriorityPolicy().allow('https://cs.nankai.edu.cn/1')
@@ -0,0 +1,76 @@
+import json
+import pytest
+from cachetools import LRUCache
+import index_builder
+import personalization
+import server
+from query_log import QueryLog
+from query_normalization import canonical_query
+
+DOCUMENTS = [
+    ('https://lib.nankai.edu.cn/1', '图书馆开放时间', '图书馆 开放 时间 调整 通知'),
+    ('https://lib.nankai.edu.cn/2', '图书馆讲座预告', '图书馆 讲座 报名 预告'),
+    ('https://cs.nankai.edu.cn/1', '计算机学院讲座', '计算机 学院 学术 讲座 通知'),
+    ('https://news.nankai.edu.cn/1', '校园新闻', '校园 新闻 讲座 图书馆 活动'),
+]
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    documents = [{'url': url, 'title': title, 'content': content, 'file_type': 'html', 'snapshot_path': ''}
+                 for url, title, content in DOCUMENTS]
+    index_builder.write_index('indexdir', documents, {}, 100)
+    server.save_users([{'username': 'alice'}])
+    log = QueryLog()
+    for module in (server, personalization):
+        monkeypatch.setattr(module, 'query_log', log)
+    for name in ('query_cache', 'ranking_cache', 'recommend_cache', 'expansion_cache', 'file_type_filter_cache'):
+        monkeypatch.setattr(server, name, LRUCache(maxsize=100))
+    index = personalization.CollaborativeIndex()
+    monkeypatch.setattr(personalization, 'collaborative_index', index)
+    monkeypatch.setattr(server, 'collaborative_index', index)
+    monkeypatch.setattr(server, 'background_tasks_started', True)
+    for username, query in [('alice', '讲座'), ('bob', '讲座'), ('bob', '讲座 报名')]:
+        server.log_query(username, query)
+    client = server.app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'alice'
+    return client
+
+def test_batch_matches_single_searches(client, monkeypatch):
+    specs = [{'query': '图书馆'}, {'query': '讲座', 'page': 1}, {'query': ' 图书馆 '}, {'query': '讲座 通知', 'is_phrase': True}]
+    calls = []
+    search_index = server.search_index
+    def counting_search_index(*args, **kwargs):
+        calls.append(kwargs.get('searcher'))
+        return search_index(*args, **kwargs)
+    monkeypatch.setattr(server, 'search_index', counting_search_index)
+
+    response = client.post('/search/batch', json={'queries': specs})
+    assert response.status_code == 200
+    responses = response.get_json()['responses']
+    # 规范化后相同的子查询只执行一次，所有子查询共用一个 searcher
+    assert len(calls) == 3 and calls[0] is not None and all(searcher is calls[0] for searcher in calls)
+
+    for name in ('query_cache', 'ranking_cache'):
+        getattr(server, name).clear()
+    assert [r['query'] for r in responses] == ['图书馆', '讲座', '图书馆', '讲座 通知']
+    for spec, batch in zip(specs, responses):
+        results, _, total_pages, total = search_index('indexdir', spec['query'].strip(), page=spec.get('page', 1),
+                                                      is_phrase=spec.get('is_phrase', False), username='alice')
+        assert batch['results'] == json.loads(json.dumps(results))
+        assert (batch['total_pages'], batch['total']) == (total_pages, total)
+    assert responses[0]['total'] == 3
+
+def test_batch_rejects_bad_requests(client):
+    assert client.post('/search/batch', json={'queries': []}).status_code == 400
+    assert client.post('/search/batch', json={'queries': ['图书馆']}).status_code == 400
+    too_many = [{'query': f'讲座{i}'} for i in range(server.MAX_BATCH_QUERIES + 1)]
+    assert client.post('/search/batch', json={'queries': too_many}).status_code == 400
+
+def test_recommend_combines_collaborative_and_titles(client):
+    recommendations = client.get('/recommend?q=讲座').get_json()
+    assert {'query': canonical_query('讲座 报名'), 'type': 'collaborative'} in recommendations
+    content = [r['query'] for r in recommendations if r['type'] == 'content']
+    assert content and set(content) <= {title for _, title, _ in DOCUMENTS}
+    assert server.recommend_titles('indexdir', '讲座') == server.recommend_titles('indexdir', ' 讲座')
@@ -0,0 +1,68 @@
+import doc_store
+import index_builder
+import server
+from whoosh.index import open_dir
+
+def build(index_dir, contents):
+    documents = [{'url': url, 'title': url.rsplit('/', 1)[-1], 'content': content,
+                  'file_type': 'html', 'snapshot_path': ''} for url, content in contents]
+    index_builder.write_index(index_dir, documents, {}, 100)
+
+def snippets(results):
+    return {result['url']: result['content_highlight'] for result in results}
+
+def test_hits_keep_their_store_across_rebuild(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / 'indexdir')
+    build(index_dir, [('https://lib.nankai.edu.cn/a', '图书馆 开放 时间 调整'),
+                      ('https://lib.nankai.edu.cn/b', '图书馆 新到 期刊 推荐')])
+    hits = server.run_query(open_dir(index_dir), index_dir, '图书馆')
+    stale = server.run_query(open_dir(index_dir), index_dir, '图书馆')
+
+    # 重建后同一 doc_id 对应另一篇文档
+    build(index_dir, [('https://lib.nankai.edu.cn/b', '图书馆 讲座 报名 通知'),
+                      ('https://lib.nankai.edu.cn/a', '图书馆 闭馆 安排 公告')])
+    highlighted = snippets(server.highlight_results(hits, '图书馆'))
+    assert '时间' in highlighted['https://lib.nankai.edu.cn/a']
+    assert '期刊' in highlighted['https://lib.nankai.edu.cn/b']
+
+    # 超出保留范围的存储不再读取，而不是按旧 doc_id 读新存储
+    for _ in range(doc_store.RETAINED_STORES):
+        build(index_dir, [('https://lib.nankai.edu.cn/c', '图书馆 其他 文档 内容')])
+        doc_store.open_doc_store(index_dir)
+    assert set(snippets(server.highlight_results(stale, '图书馆')).values()) == {'无内容匹配'}
+
+def test_rebuild_serves_new_snippets(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'query_cache', {})
+    monkeypatch.setattr(server, 'ranking_cache', {})
+    index_dir = str(tmp_path / 'indexdir')
+    build(index_dir, [('https://lib.nankai.edu.cn/a', '图书馆 开放 时间 调整'),
+                      ('https://lib.nankai.edu.cn/b', '图书馆 新到 期刊 推荐')])
+    before = snippets(server.search_index(index_dir, '图书馆')[0])
+    assert '时间' in before['https://lib.nankai.edu.cn/a']
+
+    build(index_dir, [('https://lib.nankai.edu.cn/a', '图书馆 讲座 报名 通知'),
+                      ('https://lib.nankai.edu.cn/b', '图书馆 新到 期刊 推荐')])
+    after = snippets(server.search_index(index_dir, '图书馆')[0])
+    assert '讲座' in after['https://lib.nankai.edu.cn/a']
+    assert '时间' not in after['https://lib.nankai.edu.cn/a']
+    assert '期刊' in after['https://lib.nankai.edu.cn/b']
+
+def test_health_stays_ready_while_rewarming(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / 'indexdir')
+    build(index_dir, [('https://lib.nankai.edu.cn/a', '图书馆 开放 时间 调整')])
+    monkeypatch.setattr(server, 'background_tasks_started', True)
+    monkeypatch.setattr(server, 'warmup_state', dict(server.warmup_state, ready=False, rewarming=False))
+    client = server.app.test_client()
+    during = []
+
+    def top_queries():
+        response = client.get('/health')
+        during.append((response.status_code, response.get_json()['rewarming']))
+        return []
+
+    monkeypatch.setattr(server, 'get_top_queries', top_queries)
+    server.warm_up(index_dir)
+    server.warm_up(index_dir)
+    assert during == [(503, False), (200, True)]
+    response = client.get('/health')
+    assert response.status_code == 200 and response.get_json()['rewarming'] is False
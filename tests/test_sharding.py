@@ -0,0 +1,22 @@
+from sharding import shard_generation_dir, read_manifest, write_manifest, list_shards, shard_for_url
+
+def test_shard_generation_dir_increments():
+    assert shard_generation_dir(None, 2) == 'shard_002.g1'
+    manifest = {'shards': ['shard_000', 'shard_001.g4']}
+    assert shard_generation_dir(manifest, 0) == 'shard_000.g1'
+    assert shard_generation_dir(manifest, 1) == 'shard_001.g5'
+    # 分片数增加时新分片从第一代开始
+    assert shard_generation_dir(manifest, 3) == 'shard_003.g1'
+
+def test_manifest_lists_generation_dirs(tmp_path):
+    index_dir = str(tmp_path)
+    write_manifest(index_dir, 2, 'hash')
+    assert read_manifest(index_dir)['shards'] == ['shard_000', 'shard_001']
+    write_manifest(index_dir, 2, 'hash', ['shard_000.g1', 'shard_001'])
+    assert list_shards(index_dir) == [str(tmp_path / 'shard_000.g1'), str(tmp_path / 'shard_001')]
+    assert not (tmp_path / 'shards.json.tmp').exists()
+
+def test_shard_for_url_is_stable():
+    url = 'https://cs.nankai.edu.cn/info/1.htm'
+    assert shard_for_url(url, 4) == shard_for_url(url, 4)
+    assert shard_for_url(url, 4, 'host') == shard_for_url('https://cs.nankai.edu.cn/other.htm', 4, 'host')
@@ -0,0 +1,46 @@
+import random
+from simhash import SimHashIndex, hamming_distance, main_content_text, simhash, MAX_DISTANCE
+
+def random_text(seed, length=400):
+    rng = random.Random(seed)
+    return ''.join(chr(0x4e00 + rng.randrange(3000)) for _ in range(length))
+
+def page(article, boilerplate):
+    return (f'<html><head><title>t</title><style>p {{}}</style></head><body>'
+            f'<header>{boilerplate}</header><nav>{boilerplate}</nav>'
+            f'<article><p>{article}</p></article>'
+            f'<footer>{boilerplate}</footer><script>var a = 1;</script></body></html>').encode('utf-8')
+
+def test_short_text_has_no_fingerprint():
+    assert simhash('太短') is None
+    assert simhash('') is None
+
+def test_identical_and_near_identical_texts():
+    text = random_text(0)
+    assert simhash(text) == simhash(text)
+    edited = text[:200] + '改' + text[201:]
+    assert hamming_distance(simhash(text), simhash(edited)) <= MAX_DISTANCE
+    assert hamming_distance(simhash(text), simhash(random_text(1))) > MAX_DISTANCE
+
+def test_main_content_excludes_template():
+    boilerplate = random_text(2, 2000)
+    text = main_content_text(page('正文内容', boilerplate))
+    assert text == '正文内容'
+
+def test_same_template_distinct_articles_are_not_duplicates():
+    # 模板文本远多于正文时，整页指纹会判为重复，正文指纹不会
+    boilerplate = random_text(3, 3000)
+    a, b = page(random_text(4, 150), boilerplate), page(random_text(5, 150), boilerplate)
+    assert hamming_distance(simhash(main_content_text(a)), simhash(main_content_text(b))) > MAX_DISTANCE
+
+def test_main_content_falls_back_to_body():
+    html = '<html><body><nav>菜单</nav><div>' + random_text(6, 50) + '</div></body></html>'
+    assert main_content_text(html) == random_text(6, 50)
+
+def test_index_finds_within_distance():
+    index = SimHashIndex()
+    fingerprint = simhash(random_text(7))
+    index.add(fingerprint, 'https://a/')
+    assert index.find(fingerprint ^ 0b101) == 'https://a/'
+    assert index.find(fingerprint ^ 0b1111) is None
+    assert index.find(simhash(random_text(8))) is None
@@ -0,0 +1,52 @@
+import os
+import zlib
+import snapshot_store
+from snapshot_store import SnapshotStore, read_snapshot, snapshot_size, snapshot_key
+
+def test_put_get_roundtrip(tmp_path):
+    store = SnapshotStore(str(tmp_path), writable=True)
+    html = '<html>南开大学</html>'.encode('utf-8') * 50
+    store.put('pages/a.html', html, url='https://a/', file_type='html')
+    store.put('files/b.pdf', b'%PDF raw', url='https://b/', file_type='pdf')
+    assert store.get('pages/a.html') == html
+    assert store.get('files/b.pdf') == b'%PDF raw'
+    assert store.get('pages/missing.html') is None
+    store.close()
+
+    reopened = SnapshotStore(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get('pages/a.html') == html
+    assert reopened.entries['files/b.pdf']['codec'] == 'raw'
+    reopened.close()
+
+def test_torn_index_line_is_ignored(tmp_path):
+    store = SnapshotStore(str(tmp_path), writable=True)
+    store.put('pages/a.html', b'a', file_type='html')
+    store.close()
+    with open(os.path.join(str(tmp_path), 'packs', 'index.jsonl'), 'ab') as f:
+        f.write(b'{"key": "pages/b.ht')
+    assert list(SnapshotStore(str(tmp_path)).keys()) == ['pages/a.html']
+
+def test_legacy_gzip_label_reads_zlib_data():
+    assert snapshot_store._decompress(zlib.compress(b'data'), 'gzip') == b'data'
+    assert snapshot_store._decompress(snapshot_store._compress(b'data', 'zlib'), 'zlib') == b'data'
+
+def test_read_snapshot_prefers_loose_files_and_ignores_directories(tmp_path):
+    data_dir = str(tmp_path)
+    os.makedirs(os.path.join(data_dir, 'pages'))
+    with open(os.path.join(data_dir, 'pages', 'loose.html'), 'wb') as f:
+        f.write(b'loose')
+    store = SnapshotStore(data_dir, writable=True)
+    store.put('pages/packed.html', b'packed', file_type='html')
+    store.close()
+
+    assert read_snapshot(data_dir, 'pages/loose.html') == b'loose'
+    assert read_snapshot(data_dir, 'pages/packed.html') == b'packed'
+    assert snapshot_size(data_dir, 'pages/packed.html') == 6
+    # 目录不是快照，返回 None（服务端据此返回 404）
+    assert read_snapshot(data_dir, 'pages') is None
+    assert snapshot_size(data_dir, 'pages') is None
+
+def test_snapshot_key():
+    assert snapshot_key('https://a/', 'html').startswith('pages/')
+    assert snapshot_key('https://a/x.pdf', 'pdf').endswith('.pdf')
@@ -0,0 +1,34 @@
+import os
+import pytest
+import index_builder
+from spelling import build_spelling_dictionary, SpellingDictionary, edit_distance, SPELLING_FILE
+
+@pytest.fixture
+def dictionary(tmp_path):
+    index_dir = str(tmp_path / 'indexdir')
+    documents = [{'url': f'https://lib.nankai.edu.cn/{i}', 'title': '图书馆通知', 'content': content,
+                  'file_type': 'html', 'snapshot_path': ''}
+                 for i, content in enumerate(['图书馆 开放 时间', '图书馆 讲座 通知', '计算机 学院 讲座'])]
+    index_builder.write_index(index_dir, documents, {}, 100)
+    path = os.path.join(index_dir, SPELLING_FILE)
+    assert build_spelling_dictionary([index_dir], path) > 0
+    dictionary = SpellingDictionary(path)
+    yield dictionary
+    dictionary.close()
+
+def test_round_trip_corrects_typo(dictionary):
+    assert '图书馆' in dictionary and '讲座' in dictionary
+    assert '图书官' not in dictionary
+    assert dictionary.lookup('图书官') == '图书馆'
+    assert dictionary.lookup('图书馆') is None  # 已收录的词不纠正
+    assert dictionary.lookup('体育场') is None
+    assert not any(name.endswith('.tmp') for name in os.listdir(os.path.dirname(dictionary.path)))
+
+def test_close_releases_mapping(dictionary):
+    dictionary.close()
+    with pytest.raises(ValueError):
+        dictionary.lookup('图书官')
+
+def test_edit_distance_is_bounded():
+    assert edit_distance('图书馆', '图书官', 2) == 1
+    assert edit_distance('图书馆', '计算机学院', 2) > 2
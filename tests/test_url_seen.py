@@ -0,0 +1,48 @@
+from crawler.url_seen import BloomFilter, URLSeenFilter, canonicalize_url
+
+def test_canonicalize_url():
+    assert canonicalize_url('HTTPS://CS.Nankai.edu.cn:443/info/?b=2&a=1#top') == 'https://cs.nankai.edu.cn/info?a=1&b=2'
+    assert canonicalize_url('http://cs.nankai.edu.cn') == 'http://cs.nankai.edu.cn/'
+    assert canonicalize_url('http://cs.nankai.edu.cn:8080/x/') == 'http://cs.nankai.edu.cn:8080/x'
+
+def test_add_reports_new_urls_once():
+    seen = URLSeenFilter()
+    assert seen.add('https://cs.nankai.edu.cn/a')
+    assert not seen.add('https://cs.nankai.edu.cn/a/#frag')
+    assert 'https://CS.nankai.edu.cn/a' in seen
+    assert 'https://cs.nankai.edu.cn/b' not in seen
+    assert len(seen) == 1
+
+def test_grows_past_initial_capacity_without_false_negatives():
+    seen = URLSeenFilter(initial_capacity=100, error_rate=0.01)
+    urls = [f'https://cs.nankai.edu.cn/info/{i}.htm' for i in range(1000)]
+    for url in urls:
+        seen.add(url)
+    assert len(seen.filters) > 1
+    assert all(url in seen for url in urls)
+    false_positives = sum(f'https://other.nankai.edu.cn/{i}' in seen for i in range(2000))
+    assert false_positives < 2000 * 0.02
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'state' / 'seen_urls.bloom')
+    seen = URLSeenFilter(path, initial_capacity=50)
+    for i in range(120):
+        seen.add(f'https://a/{i}')
+    seen.save()
+    assert seen.unsaved == 0
+
+    loaded = URLSeenFilter(path)
+    assert len(loaded) == 120
+    assert all(f'https://a/{i}' in loaded for i in range(120))
+    assert not loaded.add('https://a/5')
+
+def test_unpersisted_filter_does_not_save(tmp_path):
+    seen = URLSeenFilter(None)
+    seen.add('https://a/')
+    seen.save()
+    assert not list(tmp_path.iterdir())
+
+def test_bloom_filter_sizing():
+    bloom = BloomFilter(1000, 0.01)
+    assert bloom.num_bits >= 9000
+    assert bloom.num_hashes == 7